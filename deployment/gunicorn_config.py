@@ -8,10 +8,19 @@ backlog = 2048
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1  # Optimal: (2 x CPU cores) + 1
 worker_class = "sync"
+# Sync workers hold a worker for every payment gateway call. To overlap them,
+# pip install uvicorn and run ecomarce_choco.asgi:application with
+# worker_class = "uvicorn.workers.UvicornWorker" (asgi.py switches the
+# GraphQL endpoint to AsyncGraphQLView). See DEPLOYMENT_GUIDE.md.
 worker_connections = 1000
 timeout = 30
 keepalive = 2
 
+# Catalog cache invalidation listener (one per worker)
+def post_worker_init(worker):
+    from products.invalidation import start_listener
+    start_listener()
+
 # Logging
 accesslog = "/home/django/ecomarce_choco/logs/gunicorn_access.log"
 errorlog = "/home/django/ecomarce_choco/logs/gunicorn_error.log"
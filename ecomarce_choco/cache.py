@@ -0,0 +1,297 @@
+"""
+Caching helpers shared by the apps
+"""
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Sentinel for cache misses (None is a valid cached value)
+MISSING = object()
+
+# Background refreshes for stale entries
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+
+def _store(key: str, value: Any, ttl: int, stale_ttl: int):
+    cache.set(key, {'value': value, 'fresh_until': time.time() + ttl}, ttl + stale_ttl)
+
+
+def _refresh(key: str, fetch: Callable[[], Any], ttl: int, stale_ttl: int,
+             should_cache: Callable[[Any], bool]):
+    try:
+        value = fetch()
+        if should_cache(value):
+            _store(key, value, ttl, stale_ttl)
+        return value
+    finally:
+        cache.delete(f'{key}:refreshing')
+
+
+def _refresh_quietly(*args):
+    try:
+        _refresh(*args)
+    except Exception as e:
+        logger.error(f"Background cache refresh of {args[0]} failed: {str(e)}", exc_info=True)
+
+
+def get_or_refresh(key: str, fetch: Callable[[], Any], ttl: int, stale_ttl: int = 0,
+                   should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+    """
+    Read-through cache with stale-while-revalidate
+
+    Fresh entries are returned as is. For `stale_ttl` seconds after they
+    expire they are still returned immediately, while a single background
+    refresh (one per key across all workers) fetches the new value. Misses
+    are fetched inline.
+
+    Args:
+        key: Cache key
+        fetch: Callable producing the value
+        ttl: Seconds the value is fresh
+        stale_ttl: Seconds a stale value may still be served
+        should_cache: Return False for values that must not be stored (errors)
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['fresh_until'] > time.time():
+            return entry['value']
+        if cache.add(f'{key}:refreshing', 1, 30):
+            _refresh_executor.submit(_refresh_quietly, key, fetch, ttl, stale_ttl, should_cache)
+        return entry['value']
+
+    return _refresh(key, fetch, ttl, stale_ttl, should_cache)
+
+
+class LocalCache:
+    """
+    Small thread-safe in-process LRU cache with per-entry expiry
+
+    Entries remember their tags so they can be evicted by tag.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at, _ = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict_tags(self, tags: Iterable[str]) -> int:
+        """Remove every entry carrying one of the tags"""
+        tags = set(tags)
+        with self._lock:
+            keys = [key for key, (_, _, entry_tags) in self._entries.items() if entry_tags & tags]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache:
+    """
+    Per-process LRU tier in front of the shared Django cache, with tags
+
+    Every entry is stored with the versions of its tags (e.g. product:12,
+    category:3). Invalidating a tag bumps its version in the shared cache, so
+    shared entries carrying an older version are treated as stale, and
+    evicts matching entries from this process' local tier. Local entries
+    live only `local_ttl` seconds (a number, or a callable returning one),
+    which bounds how long another worker may serve an entry invalidated
+    elsewhere.
+
+    Recomputation is single-flight: one worker per key (across processes)
+    takes a short lock and recomputes, while the others keep serving the
+    stale value for up to `stale_ttl` seconds, or wait for the new value when
+    there is none. Entries are also recomputed early with a probability that
+    grows as they approach expiry and with how long they took to compute, so
+    hot keys are usually refreshed before they expire at all.
+    """
+
+    def __init__(self, prefix: str, ttl: int = 300, local_ttl: int = 30, local_max_entries: int = 1000,
+                 stale_ttl: int = 0, lock_timeout: int = 10, early_expiry_beta: float = 1.0):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.early_expiry_beta = early_expiry_beta
+        self.local = LocalCache(local_max_entries)
+
+    def make_key(self, name: str, **params) -> str:
+        """Cache key for a resolver and its arguments"""
+        if not params:
+            return f'{self.prefix}:{name}'
+        raw = json.dumps(params, sort_keys=True, default=str)
+        return f'{self.prefix}:{name}:{hashlib.md5(raw.encode("utf-8")).hexdigest()}'
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{self.prefix}:tag:{tag}'
+
+    def _tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        stored = cache.get_many([self._tag_key(tag) for tag in tags])
+        return {tag: stored.get(self._tag_key(tag), 0) for tag in tags}
+
+    def tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """
+        Current versions of the tags, for validators such as HTTP ETags
+
+        Missing versions are initialised from the clock, so a version never
+        repeats after the shared cache is flushed.
+        """
+        versions = self._tag_versions(tags)
+        missing = [tag for tag, version in versions.items() if not version]
+        for tag in missing:
+            cache.add(self._tag_key(tag), time.time_ns(), None)
+        if missing:
+            versions.update(self._tag_versions(missing))
+        return versions
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """Whether a shared entry is current and not (probabilistically) expiring"""
+        if self._tag_versions(entry['tags']) != entry['tags']:
+            return False
+        # XFetch: expire early by a random fraction of the compute time
+        early = entry.get('compute_time', 0) * self.early_expiry_beta * -math.log(1.0 - random.random())
+        return time.time() + early < entry['fresh_until']
+
+    def _store_local(self, key: str, value: Any, entry: Dict[str, Any]):
+        local_ttl = self.local_ttl() if callable(self.local_ttl) else self.local_ttl
+        ttl = min(local_ttl, entry['fresh_until'] - time.time())
+        if ttl > 0:
+            self.local.set(key, value, ttl, entry['tags'])
+
+    def get(self, key: str):
+        """Fresh cached value, or MISSING"""
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        entry = cache.get(key)
+        if entry is None or not self._is_fresh(entry):
+            return MISSING
+
+        self._store_local(key, entry['value'], entry)
+        return entry['value']
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = (), ttl: int = None,
+            versions: Dict[str, int] = None, compute_time: float = 0):
+        """
+        Store a value
+
+        Pass the tag `versions` read before computing the value so an
+        invalidation that happens meanwhile isn't lost.
+        """
+        ttl = ttl or self.ttl
+        tags = list(tags)
+        if versions is None:
+            versions = self._tag_versions(tags)
+        else:
+            versions = {**self._tag_versions(set(tags) - set(versions)), **versions}
+        entry = {
+            'value': value,
+            'tags': versions,
+            'fresh_until': time.time() + ttl,
+            'compute_time': compute_time,
+        }
+        cache.set(key, entry, ttl + self.stale_ttl)
+        # A value computed across an invalidation is stale already; the shared
+        # entry says so, but the local tier doesn't check versions
+        if self._tag_versions(versions) == versions:
+            self._store_local(key, value, entry)
+
+    def _compute(self, key: str, fetch: Callable[[], Any], tags: Iterable[str],
+                 extra_tags: Callable[[Any], Iterable[str]], ttl: int):
+        tags = list(tags)
+        versions = self._tag_versions(tags)
+        started = time.monotonic()
+        value = fetch()
+        compute_time = time.monotonic() - started
+        if extra_tags:
+            tags += list(extra_tags(value))
+        self.set(key, value, tags, ttl, versions=versions, compute_time=compute_time)
+        return value
+
+    def _wait_for(self, key: str, lock_key: str):
+        """Wait for another worker to store the key; MISSING if it gives up"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value']
+            if cache.get(lock_key) is None:
+                break
+        return MISSING
+
+    def get_or_set(self, key: str, fetch: Callable[[], Any], tags: Iterable[str] = (),
+                   extra_tags: Callable[[Any], Iterable[str]] = None, ttl: int = None):
+        """
+        Cached value, computing and storing it when missing or stale
+
+        `extra_tags` receives the computed value, for tags that depend on the
+        result (e.g. the IDs of the products in a list).
+        """
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        entry = cache.get(key)
+        if entry is not None and self._is_fresh(entry):
+            self._store_local(key, entry['value'], entry)
+            return entry['value']
+
+        lock_key = f'{key}:computing'
+        if not cache.add(lock_key, 1, self.lock_timeout):
+            # Another worker is recomputing: serve the stale value meanwhile
+            if entry is not None:
+                return entry['value']
+            value = self._wait_for(key, lock_key)
+            if value is not MISSING:
+                return value
+            return self._compute(key, fetch, tags, extra_tags, ttl)
+
+        try:
+            return self._compute(key, fetch, tags, extra_tags, ttl)
+        finally:
+            cache.delete(lock_key)
+
+    def invalidate_tags(self, *tags: str):
+        """Invalidate every entry carrying one of the tags"""
+        for tag in tags:
+            try:
+                cache.incr(self._tag_key(tag))
+            except ValueError:
+                cache.set(self._tag_key(tag), time.time_ns(), None)
+        self.local.evict_tags(tags)
+
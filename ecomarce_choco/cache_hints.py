@@ -0,0 +1,145 @@
+"""
+GraphQL cache hints
+Types and fields declare how long their data may be cached:
+
+    @cache_control(max_age=300, images=3600, inventory=0)
+    class ProductType(DjangoObjectType):
+        ...
+
+The type's max_age applies wherever the type is returned. A field hint
+overrides it for that field. Positive hints on root query fields also make
+FieldCacheMiddleware cache the field's resolved value; nested fields are
+served from the objects their root resolver cached (with their related
+rows prefetched), so they cost no cache round trips of their own.
+
+operation_max_age() gives the effective max-age of a query: the minimum
+over every selected field. Unhinted fields inherit from their parent;
+unhinted root fields use GRAPHQL_DEFAULT_MAX_AGE.
+"""
+from typing import Dict, Optional
+from django.conf import settings
+from django.db import models
+from graphene.utils.str_converters import to_camel_case
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, InlineFragmentNode, OperationType,
+    get_named_type, get_operation_ast, is_object_type,
+)
+
+# graphene class -> {'max_age': int | None, 'fields': {camelCaseName: int}}
+_hints: Dict[type, Dict] = {}
+
+
+def cache_control(max_age: int = None, **field_max_ages):
+    """Class decorator declaring cache hints for a graphene type"""
+    def decorator(cls):
+        _hints[cls] = {
+            'max_age': max_age,
+            'fields': {to_camel_case(name): age for name, age in field_max_ages.items()},
+        }
+        return cls
+    return decorator
+
+
+def _graphene_classes(graphql_type):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    # Root types are built from query mixins (ProductQuery, ...), so look
+    # through the whole MRO
+    return graphene_type.__mro__ if graphene_type else ()
+
+
+def type_max_age(graphql_type) -> Optional[int]:
+    """Hint declared on a type, or None"""
+    for cls in _graphene_classes(graphql_type):
+        if cls in _hints and _hints[cls]['max_age'] is not None:
+            return _hints[cls]['max_age']
+    return None
+
+
+def field_max_age(parent_type, field_name: str) -> Optional[int]:
+    """Hint declared on a field, or None"""
+    for cls in _graphene_classes(parent_type):
+        if cls in _hints and field_name in _hints[cls]['fields']:
+            return _hints[cls]['fields'][field_name]
+    return None
+
+
+def _selection_max_age(schema, parent_type, selection_set, inherited: int, fragments) -> float:
+    result = float('inf')
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            if name.startswith('__') or name not in parent_type.fields:
+                continue
+            named_type = get_named_type(parent_type.fields[name].type)
+
+            age = field_max_age(parent_type, name)
+            if age is None and is_object_type(named_type):
+                age = type_max_age(named_type)
+            if age is None:
+                age = inherited
+            result = min(result, age)
+
+            if selection.selection_set and is_object_type(named_type):
+                result = min(result, _selection_max_age(schema, named_type, selection.selection_set, age, fragments))
+
+        elif isinstance(selection, InlineFragmentNode):
+            fragment_type = parent_type
+            if selection.type_condition:
+                fragment_type = schema.get_type(selection.type_condition.name.value) or parent_type
+            result = min(result, _selection_max_age(schema, fragment_type, selection.selection_set, inherited, fragments))
+
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment:
+                fragment_type = schema.get_type(fragment.type_condition.name.value) or parent_type
+                result = min(result, _selection_max_age(schema, fragment_type, fragment.selection_set, inherited, fragments))
+    return result
+
+
+def operation_max_age(schema, document, operation_name: str = None) -> int:
+    """
+    Effective max-age (seconds) of an operation; 0 for mutations, unknown
+    operations and anything volatile
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return 0
+
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    default = getattr(settings, 'GRAPHQL_DEFAULT_MAX_AGE', 0)
+    result = _selection_max_age(schema, schema.query_type, operation.selection_set, default, fragments)
+    return default if result == float('inf') else max(int(result), 0)
+
+
+class FieldCacheMiddleware:
+    """
+    Caches the resolved value of root query fields with a positive field hint
+
+    Values are cached in the catalog cache per field and arguments for the
+    hinted max-age, the age clients may cache them for anyway. Only root
+    fields are cached: one lookup per query instead of one per object and
+    field. Querysets are evaluated before caching.
+    """
+
+    def resolve(self, next, root, info, **args):
+        if info.parent_type is not info.schema.query_type:
+            return next(root, info, **args)
+        max_age = field_max_age(info.parent_type, info.field_name)
+        if not max_age:
+            return next(root, info, **args)
+
+        from products.cache import catalog_cache
+
+        def fetch():
+            value = next(root, info, **args)
+            if isinstance(value, (models.QuerySet, models.Manager)):
+                value = list(value.all())
+            return value
+
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('field', field=info.field_name, args=args), fetch, ttl=max_age
+        )
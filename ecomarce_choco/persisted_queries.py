@@ -0,0 +1,128 @@
+"""
+Persisted GraphQL queries
+Public, read-only storefront operations that can be sent as
+GET /graphql/?id=<id>&variables=<json>, so browsers, nginx and CDNs can
+cache them. Each query lists the catalog cache tags its result depends on
+(used for the ETag); its max-age comes from the schema's cache hints.
+
+Queries can also be referenced by the SHA-256 hash of their text.
+"""
+import hashlib
+
+PERSISTED_QUERIES = {
+    'products': {
+        'query': '''
+            query Products($category: String, $brand: String, $search: String, $inStock: Boolean,
+                           $featured: Boolean, $minPrice: Decimal, $maxPrice: Decimal,
+                           $sortBy: String, $limit: Int) {
+              products(category: $category, brand: $brand, search: $search, inStock: $inStock,
+                       featured: $featured, minPrice: $minPrice, maxPrice: $maxPrice,
+                       sortBy: $sortBy, limit: $limit) {
+                id
+                name
+                slug
+                sku
+                retailPrice
+                inStock
+                hasVariants
+                averageRating
+                featured
+                images { image isPrimary altText displayOrder }
+                brand { id name slug }
+                category { id name slug }
+              }
+            }
+        ''',
+        'tags': ['products', 'categories', 'brands', 'inventory'],
+    },
+    'product': {
+        'query': '''
+            query Product($id: Int, $slug: String) {
+              product(id: $id, slug: $slug) {
+                id
+                name
+                slug
+                sku
+                description
+                unitType
+                retailPrice
+                inStock
+                hasVariants
+                averageRating
+                images { image isPrimary altText displayOrder }
+                usecaseImages { image displayOrder }
+                prices { priceType basePrice salePrice currency minQuantity }
+                inventory { quantityInStock }
+                brand { id name slug }
+                category { id name slug }
+                variantOptions { id name values { id value } }
+                variants { id sku isDefault isActive effectivePrice isInStock optionValues { id value } }
+                reviews { rating comment customerName createdAt }
+              }
+            }
+        ''',
+        'tags': ['products', 'categories', 'brands', 'inventory'],
+    },
+    'categories': {
+        'query': '''
+            query Categories($parentId: Int) {
+              categories(parentId: $parentId) {
+                id
+                name
+                slug
+                description
+                image
+                displayOrder
+                parentCategory { id }
+              }
+            }
+        ''',
+        'tags': ['categories'],
+    },
+    'categoryTree': {
+        'query': '''
+            query CategoryTree($rootSlug: String) {
+              categoryTree(rootSlug: $rootSlug) {
+                id name slug image depth
+                children {
+                  id name slug image depth
+                  children { id name slug image depth }
+                }
+              }
+            }
+        ''',
+        'tags': ['categories'],
+    },
+    'brands': {
+        'query': '''
+            query Brands($isActive: Boolean) {
+              brands(isActive: $isActive) {
+                id
+                name
+                slug
+                description
+                logo
+                displayOrder
+              }
+            }
+        ''',
+        'tags': ['brands'],
+    },
+    'searchSuggestions': {
+        'query': '''
+            query SearchSuggestions($query: String!, $limit: Int) {
+              searchSuggestions(query: $query, limit: $limit)
+            }
+        ''',
+        'tags': ['products', 'categories', 'brands'],
+    },
+}
+
+for _id, _entry in list(PERSISTED_QUERIES.items()):
+    _entry['id'] = _id
+    PERSISTED_QUERIES[hashlib.sha256(_entry['query'].encode('utf-8')).hexdigest()] = _entry
+
+
+def get_persisted_query(query_id):
+    """Persisted query entry by ID or hash, or None"""
+    return PERSISTED_QUERIES.get(query_id)
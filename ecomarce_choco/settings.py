@@ -220,6 +220,43 @@ CSRF_TRUSTED_ORIGINS = [
 if FRONTEND_URL not in CSRF_TRUSTED_ORIGINS:
     CSRF_TRUSTED_ORIGINS.append(FRONTEND_URL)
 
+# ==============================================================================
+# Cache
+# ==============================================================================
+
+# Redis is shared by all gunicorn workers (needed for gateway circuit
+# breakers); without REDIS_URL each process gets its own in-memory cache
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Catalog cache: per-process LRU in front of the shared cache (products/cache.py)
+CATALOG_CACHE_TTL = config('CATALOG_CACHE_TTL', default=300, cast=int)  # Seconds in the shared cache
+CATALOG_CACHE_LOCAL_TTL = config('CATALOG_CACHE_LOCAL_TTL', default=30, cast=int)  # Seconds in each worker's memory
+CATALOG_CACHE_LOCAL_MAX_ENTRIES = config('CATALOG_CACHE_LOCAL_MAX_ENTRIES', default=1000, cast=int)
+CATALOG_CACHE_STALE_TTL = config('CATALOG_CACHE_STALE_TTL', default=600, cast=int)  # Seconds a stale entry is served while one worker recomputes it
+CATALOG_CACHE_LOCK_TIMEOUT = config('CATALOG_CACHE_LOCK_TIMEOUT', default=10, cast=int)  # Seconds a recompute lock is held at most
+
+# Invalidation bus: evicts other workers' local entries, and bumps their tag versions
+# when there is no REDIS_URL (PostgreSQL LISTEN/NOTIFY, CatalogInvalidation table
+# polling on SQLite); started by the gunicorn hook
+CATALOG_CACHE_BUS_ENABLED = config('CATALOG_CACHE_BUS_ENABLED', default=True, cast=bool)
+CATALOG_CACHE_BUS_POLL_INTERVAL = config('CATALOG_CACHE_BUS_POLL_INTERVAL', default=1.0, cast=float)  # Seconds between polls/checks
+CATALOG_CACHE_BUS_LOCAL_TTL = config('CATALOG_CACHE_BUS_LOCAL_TTL', default=300, cast=int)  # Local TTL while the worker's listener runs
+CATALOG_CACHE_BUS_RETENTION = config('CATALOG_CACHE_BUS_RETENTION', default=3600, cast=int)  # Seconds polled rows are kept
+
 # ==============================================================================
 # GraphQL / Graphene Settings
 # ==============================================================================
@@ -228,9 +265,16 @@ GRAPHENE = {
     'SCHEMA': 'ecomarce_choco.schema.schema',
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'ecomarce_choco.cache_hints.FieldCacheMiddleware',
     ],
 }
 
+# Serve the GraphQL endpoint with AsyncGraphQLView (on by default under asgi.py)
+GRAPHQL_ASYNC_VIEW = config('GRAPHQL_ASYNC_VIEW', default=False, cast=bool)
+
+# Max-age for root query fields without a cache hint (ecomarce_choco/cache_hints.py)
+GRAPHQL_DEFAULT_MAX_AGE = config('GRAPHQL_DEFAULT_MAX_AGE', default=0, cast=int)
+
 # ==============================================================================
 # Authentication Settings
 # ==============================================================================
@@ -262,6 +306,33 @@ ZIINA_WEBHOOK_SECRET = config('ZIINA_WEBHOOK_SECRET', default='')
 ZIINA_BASE_URL = config('ZIINA_BASE_URL', default='https://api-v2.ziina.com')
 ZIINA_TEST_MODE = config('ZIINA_TEST_MODE', default=True, cast=bool)
 
+# Gateway HTTP client (shared keep-alive session per gateway)
+PAYMENT_HTTP_POOL_SIZE = config('PAYMENT_HTTP_POOL_SIZE', default=10, cast=int)  # Connections kept open per gateway
+PAYMENT_HTTP_CONNECT_TIMEOUT = config('PAYMENT_HTTP_CONNECT_TIMEOUT', default=3.05, cast=float)  # Seconds
+PAYMENT_HTTP_READ_TIMEOUT = config('PAYMENT_HTTP_READ_TIMEOUT', default=15, cast=float)  # Seconds
+PAYMENT_HTTP_MAX_RETRIES = config('PAYMENT_HTTP_MAX_RETRIES', default=2, cast=int)  # GET requests only
+PAYMENT_HTTP_BACKOFF_FACTOR = config('PAYMENT_HTTP_BACKOFF_FACTOR', default=0.3, cast=float)  # 0.3s, 0.6s, 1.2s...
+PAYMENT_HTTP_MAX_CONCURRENCY = config('PAYMENT_HTTP_MAX_CONCURRENCY', default=32, cast=int)  # Gateway calls in flight from async mutations
+
+# Gateway circuit breakers and health (state kept in the default cache)
+PAYMENT_CIRCUIT_FAILURE_THRESHOLD = config('PAYMENT_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)  # Consecutive failures before opening
+PAYMENT_CIRCUIT_RESET_TIMEOUT = config('PAYMENT_CIRCUIT_RESET_TIMEOUT', default=30, cast=int)  # Seconds before a probe call is allowed
+PAYMENT_GATEWAY_SLOW_CALL_SECONDS = config('PAYMENT_GATEWAY_SLOW_CALL_SECONDS', default=5, cast=float)  # Slower calls count as failures
+PAYMENT_HEALTH_WINDOW_MINUTES = config('PAYMENT_HEALTH_WINDOW_MINUTES', default=5, cast=int)  # Rolling histogram window
+PAYMENT_HEALTH_DEGRADED_ERROR_RATE = config('PAYMENT_HEALTH_DEGRADED_ERROR_RATE', default=0.2, cast=float)
+PAYMENT_METHODS_CACHE_TTL = config('PAYMENT_METHODS_CACHE_TTL', default=3600, cast=int)  # Seconds gateway payment methods are fresh
+PAYMENT_METHODS_CACHE_STALE_TTL = config('PAYMENT_METHODS_CACHE_STALE_TTL', default=86400, cast=int)  # Seconds stale methods may be served while refreshing
+PAYMENT_REFUND_WORKERS = config('PAYMENT_REFUND_WORKERS', default=8, cast=int)  # Concurrent gateway calls for bulk refunds
+PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL = 5  # Seconds between checks for PaymentGateway changes made by other workers
+
 # Backend URL (for payment redirects)
 # Note: FRONTEND_URL is defined above in CSRF settings
 BACKEND_URL = config('BACKEND_URL', default='http://localhost:8000')
+
+# Local gateway simulator (python manage.py run_gateway_simulator)
+# When set, all gateway API calls go to the simulator instead of the live APIs
+PAYMENT_GATEWAY_SIMULATOR_URL = config('PAYMENT_GATEWAY_SIMULATOR_URL', default='')
+if PAYMENT_GATEWAY_SIMULATOR_URL:
+    TABBY_BASE_URL = f"{PAYMENT_GATEWAY_SIMULATOR_URL.rstrip('/')}/tabby"
+    TAMARA_BASE_URL = f"{PAYMENT_GATEWAY_SIMULATOR_URL.rstrip('/')}/tamara"
+    ZIINA_BASE_URL = f"{PAYMENT_GATEWAY_SIMULATOR_URL.rstrip('/')}/ziina"
@@ -15,11 +15,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from .views import AsyncGraphQLView, GraphQLView
+
+# Async payment mutations only overlap their gateway calls under ASGI
+graphql_view = AsyncGraphQLView if settings.GRAPHQL_ASYNC_VIEW else GraphQLView
 
 urlpatterns = [
     # Django Admin
@@ -27,7 +31,10 @@ urlpatterns = [
     
     # GraphQL API endpoint
     # graphiql=True enables the interactive GraphiQL interface
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql/', csrf_exempt(graphql_view.as_view(graphiql=True))),
+    
+    # Payment gateway webhooks (/webhooks/<gateway>/)
+    path('', include('payments.urls')),
 ]
 
 # Serve media files in development
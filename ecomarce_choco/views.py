@@ -0,0 +1,223 @@
+"""
+Project GraphQL view
+"""
+import hashlib
+import inspect
+import json
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.middleware import get_user
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, models
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql import OperationType, execute, get_operation_ast, parse, validate
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+
+from .cache_hints import operation_max_age
+from .persisted_queries import get_persisted_query
+
+
+async def _await_result(result):
+    return await result
+
+
+class GraphQLView(BaseGraphQLView):
+    """
+    GraphQL view that also runs async resolvers and persisted queries
+    
+    Mutations that call payment gateways are async, so graphql-core returns an
+    awaitable for those operations. This view runs it to completion, so under
+    WSGI the request still holds its worker for the whole gateway call; serve
+    AsyncGraphQLView from an ASGI worker to overlap them.
+    
+    Persisted queries (persisted_queries.py) are selected with `id`. Over GET
+    their responses get a strong ETag built from the catalog cache versions
+    they depend on, plus Cache-Control from the schema's cache hints, and a
+    matching If-None-Match is answered with 304 before the query runs.
+    Requests from signed-in users are never cached.
+    """
+    
+    def dispatch(self, request, *args, **kwargs):
+        persisted = None
+        if request.method == 'GET' and request.GET.get('id') and not self.request_wants_html(request):
+            persisted = get_persisted_query(request.GET['id'])
+        if persisted is None:
+            return super().dispatch(request, *args, **kwargs)
+        
+        if get_http_authorization(request) or request.user.is_authenticated:
+            response = super().dispatch(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_store=True)
+            return response
+        
+        etag = self.get_etag(request, persisted)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=304)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or json.loads(response.content).get('errors'):
+                patch_cache_control(response, no_store=True)
+                return response
+        
+        response['ETag'] = etag
+        max_age = self.get_max_age(persisted)
+        if max_age:
+            patch_cache_control(response, public=True, max_age=max_age, stale_while_revalidate=max_age * 5)
+        else:
+            # Volatile fields (stock): always revalidate, 304 while unchanged
+            patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
+    
+    def get_max_age(self, persisted):
+        """Effective max-age of a persisted query from the cache hints"""
+        if 'max_age' not in persisted:
+            persisted['max_age'] = operation_max_age(self.schema.graphql_schema, parse(persisted['query']))
+        return persisted['max_age']
+    
+    @staticmethod
+    def get_etag(request, persisted):
+        """Strong ETag for a persisted query, its variables and the catalog versions"""
+        from products.cache import catalog_cache
+        
+        try:
+            variables = json.loads(request.GET.get('variables') or '{}')
+        except ValueError:
+            variables = request.GET.get('variables')
+        raw = json.dumps(
+            [persisted['id'], variables, catalog_cache.tag_versions(persisted['tags'])],
+            sort_keys=True
+        )
+        return '"%s"' % hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    
+    @staticmethod
+    def get_graphql_params(request, data):
+        query, variables, operation_name, id = BaseGraphQLView.get_graphql_params(request, data)
+        if id and not query:
+            persisted = get_persisted_query(id)
+            if persisted is None:
+                raise HttpError(HttpResponseBadRequest("Unknown persisted query id."))
+            query = persisted['query']
+        return query, variables, operation_name, id
+    
+    def execute_graphql_request(self, *args, **kwargs):
+        result = super().execute_graphql_request(*args, **kwargs)
+        if inspect.isawaitable(result):
+            return async_to_sync(_await_result)(result)
+        return result
+
+
+class SyncResolverMiddleware:
+    """
+    Runs synchronous resolvers through sync_to_async
+    
+    Used by AsyncGraphQLView: the mutations themselves are async, but the
+    fields of their payloads are ordinary resolvers that may touch the
+    database, which Django doesn't allow on the event loop.
+    """
+    
+    def resolve(self, next, root, info, **kwargs):
+        resolver = info.parent_type.fields[info.field_name].resolve
+        if inspect.iscoroutinefunction(resolver):
+            return next(root, info, **kwargs)
+        if resolver is None and not isinstance(root, models.Model):
+            # Plain attribute of a payload object, no database access
+            return next(root, info, **kwargs)
+        return sync_to_async(next)(root, info, **kwargs)
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    GraphQL view for ASGI deployments
+    
+    Mutations whose root fields all have async resolvers (the payment gateway
+    mutations) execute on the event loop, so one worker keeps serving other
+    requests while their gateway calls are in flight. Everything else -
+    queries, persisted queries, GraphiQL, batches, invalid documents, rejected
+    tokens - goes to the sync GraphQLView in a thread, unchanged.
+    """
+    view_is_async = True
+    
+    async def dispatch(self, request, *args, **kwargs):
+        params = self.get_async_params(request)
+        if params is not None:
+            response = await self.execute_async(request, *params)
+            if response is not None:
+                return response
+        return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+    
+    def get_async_params(self, request):
+        """(document, variables, operation_name) if the request can run on the event loop"""
+        if request.method != 'POST' or self.batch:
+            return None
+        if graphene_settings.ATOMIC_MUTATIONS or connection.settings_dict.get('ATOMIC_MUTATIONS'):
+            return None
+        try:
+            query, variables, operation_name, _ = self.get_graphql_params(request, self.parse_body(request))
+            document = parse(query)
+        except Exception:
+            return None
+        
+        operation = get_operation_ast(document, operation_name)
+        if operation is None or operation.operation != OperationType.MUTATION:
+            return None
+        fields = self.schema.graphql_schema.mutation_type.fields
+        for selection in operation.selection_set.selections:
+            field = fields.get(selection.name.value) if getattr(selection, 'name', None) else None
+            if field is None or not inspect.iscoroutinefunction(field.resolve):
+                return None
+        return document, variables, operation_name
+    
+    async def execute_async(self, request, document, variables, operation_name):
+        """Execute an async mutation; None to fall back to the sync view"""
+        schema = self.schema.graphql_schema
+        if validate(schema, document, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS):
+            return None
+        if not await sync_to_async(self.authenticate)(request):
+            return None
+        
+        result = execute(
+            schema,
+            document,
+            root_value=self.get_root_value(request),
+            context_value=self.get_context(request),
+            variable_values=variables,
+            operation_name=operation_name,
+            middleware=[SyncResolverMiddleware()],
+            execution_context_class=self.execution_context_class,
+        )
+        if inspect.isawaitable(result):
+            result = await result
+        
+        status_code = 200
+        response = {}
+        if result.errors:
+            response['errors'] = [self.format_error(e) for e in result.errors]
+        if result.errors and any(not getattr(e, 'path', None) for e in result.errors):
+            status_code = 400
+        else:
+            response['data'] = result.data
+        return HttpResponse(
+            status=status_code, content=self.json_encode(request, response), content_type='application/json'
+        )
+    
+    @staticmethod
+    def authenticate(request):
+        """
+        Resolve the session or JWT user before running on the event loop
+        
+        Stands in for JSONWebTokenMiddleware on the async path. False when
+        the token is rejected, so the sync view reports the error as usual.
+        """
+        user = get_user(request) if hasattr(request, 'session') else AnonymousUser()
+        if user.is_anonymous and get_http_authorization(request) is not None:
+            try:
+                user = authenticate(request=request) or user
+            except JSONWebTokenError:
+                return False
+        request.user = user
+        return True
@@ -7,6 +7,7 @@ from graphene_django import DjangoObjectType
 from django.utils import timezone
 from django.db import transaction
 from django.db import IntegrityError
+from django.db.models import Prefetch, prefetch_related_objects
 from django.core.exceptions import ValidationError
 from datetime import timedelta
 import logging
@@ -15,6 +16,7 @@ from decimal import Decimal
 
 from .models import Cart, CartItem, Order, OrderItem, ShippingAddress, OrderStatusHistory
 from products.models import Product, ProductVariant
+from products.pricing import load_price_tiers, reprice_items
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +26,30 @@ def _require_staff(info):
     if not user.is_authenticated or not user.is_staff:
         raise Exception("Not authorized")
 
+
+def _reprice_cart(cart):
+    """
+    Bring the cart's item prices up to date (quantity tiers, scheduled prices)
+
+    Reprices the cart's prefetched items in place when they are prefetched,
+    so totals computed from them afterwards use the new prices. Tiers are
+    loaded in one query and changed items saved in one update.
+    """
+    changed = reprice_items(list(cart.items.all()))
+    if changed:
+        CartItem.objects.bulk_update(changed, ['price_at_addition'])
+    return changed
+
+
+def _cart_items_prefetch():
+    """Cart items with everything CartType renders"""
+    return Prefetch(
+        'items',
+        queryset=CartItem.objects.select_related('product', 'variant').prefetch_related(
+            'variant__option_values__option_value'
+        )
+    )
+
 # ============================================================================
 # GraphQL Types
 # ============================================================================
@@ -69,7 +95,12 @@ class CartType(DjangoObjectType):
         fields = '__all__'
     
     def resolve_items(self, info):
-        return self.items.all().select_related('product', 'variant')
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            # Already loaded (and repriced for display) by the cart query
+            return self.items.all()
+        return self.items.all().select_related('product', 'variant').prefetch_related(
+            'variant__option_values__option_value'
+        )
     
     def resolve_subtotal(self, info):
         subtotal = sum((item.subtotal for item in self.items.all()), Decimal('0'))
@@ -193,6 +224,11 @@ class OrderQuery(graphene.ObjectType):
             session_key=session_key,
             defaults={'expires_at': timezone.now() + timedelta(days=2)}
         )
+        if not created:
+            # Show current tier/scheduled prices without writing; the cart
+            # mutations and checkout save them
+            prefetch_related_objects([cart], _cart_items_prefetch())
+            reprice_items(list(cart.items.all()))
         return cart
     
     def resolve_order(self, info, order_number):
@@ -316,16 +352,13 @@ class AddToCart(graphene.Mutation):
                         message=f"Only {product.inventory.available_quantity} items available"
                     )
                 
-                # Get current retail price
-                price = product.prices.filter(
-                    price_type='RETAIL', 
-                    is_active=True
-                ).first()
+                # Current retail tiers (precomputed, honour valid_from/valid_until)
+                tiers = load_price_tiers([product.id], 'RETAIL')[product.id]
                 
-                if not price:
+                if not tiers:
                     return AddToCart(success=False, message="Price not available for this product")
                 
-                price_value = price.get_effective_price()
+                price_value = tiers.unit_price(quantity)
                 display_name = product.name
             
             # Get or create cart item (unique by product + variant)
@@ -352,6 +385,8 @@ class AddToCart(graphene.Mutation):
                     )
                 
                 cart_item.quantity = new_quantity
+                # The larger quantity may reach a cheaper tier
+                cart_item.price_at_addition = price_value if variant else tiers.unit_price(new_quantity)
                 cart_item.save()
                 message = f"Updated cart: {display_name} quantity is now {new_quantity}"
             else:
@@ -413,8 +448,9 @@ class UpdateCartItem(graphene.Mutation):
                     message=f"Only {cart_item.product.inventory.available_quantity} items available"
                 )
             
-            # Update quantity
+            # Update quantity, at the tier price for the new quantity
             cart_item.quantity = quantity
+            reprice_items([cart_item])
             cart_item.save()
             
             return UpdateCartItem(
@@ -549,6 +585,9 @@ class CreateRetailOrder(graphene.Mutation):
                             message=f"Not enough stock for {cart_item.product.name}. Only {cart_item.product.inventory.available_quantity} available"
                         )
             
+            # Charge current prices for the quantities ordered
+            _reprice_cart(cart)
+            
             # Calculate totals
             subtotal = sum(item.subtotal for item in cart.items.all())
             vat_rate = Decimal('0.05')  # 5% VAT in UAE
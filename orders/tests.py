@@ -1,3 +1,72 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+
+from products.models import Brand, Category, Inventory, Product, ProductPrice, ProductVariant
+from products.pricing import reprice_items
+from .models import Cart, CartItem
+
+
+class CartPricingTests(TestCase):
+    """Cart items follow the quantity tiers in effect"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Chocolate', slug='chocolate')
+        brand = Brand.objects.create(name='Callebaut', slug='callebaut')
+        self.product = Product.objects.create(sku='CHOC-1', name='Dark', slug='dark', category=category, brand=brand)
+        Inventory.objects.create(product=self.product, quantity_in_stock=100)
+        ProductPrice.objects.create(product=self.product, base_price=Decimal('10.00'))
+        self.bulk = ProductPrice.objects.create(product=self.product, base_price=Decimal('8.00'), min_quantity=5)
+
+    def query(self, query):
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertNotIn('errors', response)
+        return response['data']
+
+    def add_to_cart(self, quantity):
+        return self.query(
+            'mutation { addToCart(sessionKey: "s", productId: %d, quantity: %d) { cartItem { id priceAtAddition } } }'
+            % (self.product.id, quantity)
+        )['addToCart']['cartItem']
+
+    def test_adding_to_cart_applies_the_tier_for_the_new_quantity(self):
+        self.assertEqual(Decimal(self.add_to_cart(3)['priceAtAddition']), Decimal('10.00'))
+        self.assertEqual(Decimal(self.add_to_cart(3)['priceAtAddition']), Decimal('8.00'))
+        self.assertEqual(CartItem.objects.get().price_at_addition, Decimal('8.00'))
+
+    def test_cart_query_shows_current_prices_without_saving_them(self):
+        self.add_to_cart(6)
+        self.bulk.base_price = Decimal('7.00')
+        self.bulk.save()
+
+        with self.assertNumQueries(3):
+            cart = self.query('{ cart(sessionKey: "s") { subtotal items { priceAtAddition } } }')['cart']
+
+        self.assertEqual(Decimal(cart['items'][0]['priceAtAddition']), Decimal('7.00'))
+        self.assertEqual(Decimal(cart['subtotal']), Decimal('42.00'))
+        self.assertEqual(CartItem.objects.get().price_at_addition, Decimal('8.00'))
+
+    def test_repricing_loads_tiers_and_variants_once(self):
+        cart = Cart.objects.create(session_key='s', expires_at=timezone.now() + timedelta(days=1))
+        for index in range(3):
+            variant = ProductVariant.objects.create(
+                product=self.product, sku=f'CHOC-1-{index}', price=Decimal('12.00'), sale_price=Decimal('11.00')
+            )
+            CartItem.objects.create(
+                cart=cart, product=self.product, variant=variant, quantity=1, price_at_addition=Decimal('12.00')
+            )
+            CartItem.objects.create(cart=cart, product=self.product, quantity=6, price_at_addition=Decimal('10.00'))
+
+        items = list(CartItem.objects.order_by('id'))
+        with self.assertNumQueries(2):
+            changed = reprice_items(items)
+
+        self.assertEqual(len(changed), 6)
+        self.assertEqual([item.price_at_addition for item in items], [Decimal('11.00'), Decimal('8.00')] * 3)
 
-# Create your tests here.
+        # Variants loaded with the items are used as they are
+        items = list(CartItem.objects.select_related('variant'))
+        with self.assertNumQueries(1):
+            reprice_items(items)
@@ -0,0 +1,60 @@
+"""
+Django management command to archive old webhook payloads and gateway responses
+Run: python manage.py archive_payment_payloads --days 90
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.services.archive import archive_gateway_responses, archive_webhooks, count_archivable
+
+
+class Command(BaseCommand):
+    help = "Move webhook payloads and gateway responses older than N days into compressed archive rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=90,
+            help='Archive data older than this many days',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows archived per transaction',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches (keeps load on the database low)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many rows would be archived without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n🔍 DRY RUN - No changes will be made\n'))
+            counts = count_archivable(options['days'])
+            self.stdout.write(f"Webhooks to archive: {counts['webhooks']}")
+            self.stdout.write(f"Payments to archive: {counts['payments']}")
+            return
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        for label, archive in (('webhooks', archive_webhooks), ('payments', archive_gateway_responses)):
+            total = 0
+            while True:
+                archived = archive(cutoff, options['batch_size'])
+                if not archived:
+                    break
+                total += archived
+                self.stdout.write(f'Archived {total} {label}...')
+                time.sleep(options['sleep'])
+            self.stdout.write(self.style.SUCCESS(f'✅ Archived {total} {label}'))
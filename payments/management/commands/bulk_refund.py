@@ -0,0 +1,72 @@
+"""
+Django management command to refund many payments at once
+Run: python manage.py bulk_refund refunds.csv --reason "Damaged shipment"
+
+The CSV needs payment_id and amount columns (reason is optional per row).
+"""
+import csv
+import sys
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.services.refunds import bulk_refund
+
+
+class Command(BaseCommand):
+    help = "Refund the payments listed in a CSV file (payment_id,amount[,reason])"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV file with payment_id,amount[,reason] ('-' for stdin)")
+        parser.add_argument('--reason', default=None, help='Reason for rows without one')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'PAYMENT_REFUND_WORKERS', 8),
+            help='Concurrent gateway calls',
+        )
+
+    def handle(self, *args, **options):
+        items = self.read_items(options['file'])
+        if not items:
+            raise CommandError('No refunds found in the file')
+
+        self.stdout.write(f'Refunding {len(items)} payment(s) with {options["workers"]} worker(s)...')
+
+        succeeded = failed = 0
+        for result in bulk_refund(items, reason=options['reason'], workers=options['workers']):
+            if result['success']:
+                succeeded += 1
+                self.stdout.write(self.style.SUCCESS(
+                    f"✓ {result['payment_id']}: {result['amount']} refunded ({result['refund_id']})"
+                ))
+            else:
+                failed += 1
+                self.stdout.write(self.style.ERROR(
+                    f"✗ {result['payment_id']}: {result['message']}"
+                ))
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {succeeded} refunded, {failed} failed'))
+
+    def read_items(self, path):
+        handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            reader = csv.DictReader(handle)
+            if not reader.fieldnames or not {'payment_id', 'amount'} <= set(reader.fieldnames):
+                raise CommandError('CSV must have payment_id and amount columns')
+
+            items = []
+            for line, row in enumerate(reader, start=2):
+                try:
+                    amount = Decimal(row['amount'])
+                except (InvalidOperation, TypeError):
+                    raise CommandError(f"Line {line}: invalid amount {row['amount']!r}")
+                items.append({
+                    'payment_id': row['payment_id'].strip(),
+                    'amount': amount,
+                    'reason': (row.get('reason') or '').strip() or None,
+                })
+            return items
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
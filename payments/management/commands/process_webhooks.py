@@ -0,0 +1,73 @@
+"""
+Django management command to settle queued payment gateway webhooks
+Run: python manage.py process_webhooks --workers 4
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from payments.services.webhooks import process_pending_webhooks, release_stale_claims
+
+
+class Command(BaseCommand):
+    help = "Process webhooks stored by the payment webhook endpoints (in order per payment)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker threads (payments processed in parallel)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Webhooks claimed per batch',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=300,
+            help='Seconds after which webhooks claimed by a dead worker are re-queued',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Processing webhooks with {options['workers']} worker(s)...")
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='webhook') as executor:
+            try:
+                while True:
+                    released = release_stale_claims(options['stale_after'])
+                    if released:
+                        self.stdout.write(self.style.WARNING(f'Re-queued {released} stale webhook(s)'))
+
+                    processed = process_pending_webhooks(executor, options['batch_size'])
+                    total += processed
+
+                    if processed:
+                        self.stdout.write(f'Processed {processed} webhook(s)')
+                        continue
+
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('\nStopping...'))
+            finally:
+                connections.close_all()
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Processed {total} webhook(s)'))
@@ -0,0 +1,96 @@
+"""
+Django management command to re-check pending payments with their gateway
+Run: python manage.py reconcile_payments --older-than 30 [--refunds]
+"""
+from django.core.management.base import BaseCommand
+
+from payments.services.reconciliation import reconcile_payments, reconcile_refunds
+
+
+class Command(BaseCommand):
+    help = "Verify stale PENDING payments with their gateway and settle them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=30,
+            help='Only payments pending for more than this many minutes',
+        )
+        parser.add_argument(
+            '--gateway',
+            action='append',
+            dest='gateways',
+            help='Only reconcile this gateway (can be repeated)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of payments to check',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Concurrent gateway calls',
+        )
+        parser.add_argument(
+            '--rate-limit',
+            type=float,
+            default=5.0,
+            help='Gateway calls per second, per gateway',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Results settled per transaction',
+        )
+        parser.add_argument(
+            '--refunds',
+            action='store_true',
+            help='Also resolve refunds kept pending after an unknown gateway outcome',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Verify with the gateways without updating payments',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('\n🔍 DRY RUN - No changes will be made\n'))
+
+        def progress(stats):
+            self.stdout.write(
+                f"Checked {stats['checked']}: {stats['settled']} settled, "
+                f"{stats['unchanged']} unchanged, {stats['errors']} errors"
+            )
+
+        stats = reconcile_payments(
+            older_than=options['older_than'],
+            gateways=options['gateways'],
+            limit=options['limit'],
+            workers=options['workers'],
+            rate_limit=options['rate_limit'],
+            batch_size=options['batch_size'],
+            dry_run=dry_run,
+            progress=progress,
+        )
+
+        label = 'would be settled' if dry_run else 'settled'
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Checked {stats['checked']} payment(s): {stats['settled']} {label}, "
+            f"{stats['unchanged']} still pending, {stats['errors']} error(s)"
+        ))
+
+        if options['refunds']:
+            stats = reconcile_refunds(older_than=options['older_than'], dry_run=dry_run)
+            label = 'would be completed' if dry_run else 'completed'
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Checked {stats['checked']} pending refund(s): {stats['completed']} {label}, "
+                f"{stats['unresolved']} still unconfirmed"
+            ))
@@ -0,0 +1,91 @@
+"""
+Django management command to run the local payment gateway simulator
+Run: python manage.py run_gateway_simulator --port 8099
+Then start Django with PAYMENT_GATEWAY_SIMULATOR_URL=http://localhost:8099
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.services.simulator import SimulatorConfig, create_server
+
+
+class Command(BaseCommand):
+    help = "Serve fake Tabby, Tamara and Ziina APIs for load and latency testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+        parser.add_argument('--port', type=int, default=8099, help='Port to listen on')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=50,
+            help='Mean response latency in milliseconds',
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=20,
+            help='Standard deviation of the latency in milliseconds',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of API calls answered with HTTP 503 (0-1)',
+        )
+        parser.add_argument(
+            '--decline-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of payments that end up failed instead of completed (0-1)',
+        )
+        parser.add_argument(
+            '--webhook-delay',
+            type=float,
+            default=1.0,
+            help='Seconds between creating a payment and completing it',
+        )
+        parser.add_argument(
+            '--no-webhooks',
+            action='store_true',
+            help='Complete payments without calling the webhook endpoints',
+        )
+        parser.add_argument(
+            '--backend-url',
+            default=settings.BACKEND_URL,
+            help='Base URL the webhooks are sent to (default: BACKEND_URL)',
+        )
+
+    def handle(self, *args, **options):
+        config = SimulatorConfig(
+            latency_ms=options['latency'],
+            jitter_ms=options['jitter'],
+            error_rate=options['error_rate'],
+            decline_rate=options['decline_rate'],
+            webhook_delay=options['webhook_delay'],
+            webhooks=not options['no_webhooks'],
+            backend_url=options['backend_url'],
+            ziina_webhook_secret=getattr(settings, 'ZIINA_WEBHOOK_SECRET', ''),
+        )
+        server = create_server(options['host'], options['port'], config)
+        url = f"http://{options['host']}:{options['port']}"
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Gateway simulator listening on {url}'))
+        self.stdout.write(f'   Point Django at it with PAYMENT_GATEWAY_SIMULATOR_URL={url}')
+        if config.webhooks:
+            self.stdout.write(f"   Webhooks go to {config.backend_url.rstrip('/')}/webhooks/<gateway>/")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nStopping...'))
+        finally:
+            server.simulator.stop()
+            server.server_close()
+
+        stats = server.simulator.stats.counts
+        self.stdout.write(
+            f"Requests: {stats['requests']} ({stats['errors_injected']} simulated errors), "
+            f"payments: {stats['payments']}, "
+            f"webhooks: {stats['webhooks_sent']} sent / {stats['webhooks_failed']} failed"
+        )
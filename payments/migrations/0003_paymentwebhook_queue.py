@@ -0,0 +1,50 @@
+# Generated by Django 5.1 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_alter_payment_payment_method_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='event_id',
+            field=models.CharField(blank=True, help_text='Gateway event ID (or body hash) used for deduplication', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='payment_reference',
+            field=models.CharField(blank=True, help_text='Gateway payment ID the event refers to', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='paymentwebhook',
+            name='status',
+            field=models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSING', 'Processing'), ('PROCESSED', 'Processed'), ('FAILED', 'Failed')], default='RECEIVED', max_length=20),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paymentwebhook',
+            unique_together={('gateway', 'event_id')},
+        ),
+        migrations.AddIndex(
+            model_name='paymentwebhook',
+            index=models.Index(fields=['status', 'id'], name='webhook_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentwebhook',
+            index=models.Index(fields=['payment_reference', 'status'], name='webhook_reference_status_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_paymentwebhook_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ),
+    ]
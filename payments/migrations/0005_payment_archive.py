@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_payment_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('WEBHOOK', 'Webhook payload'), ('PAYMENT', 'Payment gateway response')], max_length=20)),
+                ('object_id', models.BigIntegerField(help_text='PaymentWebhook or Payment ID')),
+                ('data', models.BinaryField(help_text='zlib-compressed JSON')),
+                ('original_created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'payment_archives',
+            },
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, help_text='gateway_response moved to PaymentArchive', null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentwebhook',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, help_text='payload moved to PaymentArchive', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='paymentwebhook',
+            index=models.Index(fields=['created_at'], name='webhook_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paymentarchive',
+            unique_together={('source', 'object_id')},
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
+import json
 import uuid
+import zlib
 
 
 class PaymentGateway(models.Model):
@@ -79,6 +81,7 @@ class Payment(models.Model):
     captured_at = models.DateTimeField(null=True, blank=True)
     failed_at = models.DateTimeField(null=True, blank=True)
     refunded_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="gateway_response moved to PaymentArchive")
     
     # Additional
     failure_reason = models.TextField(blank=True)
@@ -87,6 +90,10 @@ class Payment(models.Model):
     class Meta:
         db_table = 'payments'
         ordering = ['-created_at']
+        indexes = [
+            # Stale pending payments for reconciliation
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.payment_id:
@@ -144,25 +151,75 @@ class Refund(models.Model):
 
 
 class PaymentWebhook(models.Model):
-    """Log webhooks from payment gateways"""
+    """Log webhooks from payment gateways
+    
+    Webhooks are stored as soon as they arrive (RECEIVED) and settled later by
+    the `process_webhooks` worker, which claims them (PROCESSING) and processes
+    them in arrival order per payment_reference.
+    """
     STATUS_CHOICES = [
         ('RECEIVED', 'Received'),
+        ('PROCESSING', 'Processing'),
         ('PROCESSED', 'Processed'),
         ('FAILED', 'Failed'),
     ]
     
     gateway = models.ForeignKey(PaymentGateway, on_delete=models.CASCADE)
     payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True)
+    event_id = models.CharField(max_length=255, null=True, blank=True, help_text="Gateway event ID (or body hash) used for deduplication")
+    payment_reference = models.CharField(max_length=255, blank=True, help_text="Gateway payment ID the event refers to")
     webhook_type = models.CharField(max_length=100)
     payload = models.JSONField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RECEIVED')
+    attempts = models.IntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="payload moved to PaymentArchive")
 
     class Meta:
         db_table = 'payment_webhooks'
         ordering = ['-created_at']
+        unique_together = ['gateway', 'event_id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_status_idx'),
+            models.Index(fields=['payment_reference', 'status'], name='webhook_reference_status_idx'),
+            models.Index(fields=['created_at'], name='webhook_created_idx'),
+        ]
 
     def __str__(self):
         return f"Webhook {self.webhook_type} - {self.status}"
+
+
+class PaymentArchive(models.Model):
+    """Compressed cold storage for old webhook payloads and gateway responses
+    
+    Filled by `manage.py archive_payment_payloads`, which then trims the live
+    PaymentWebhook.payload / Payment.gateway_response to the fields we query.
+    """
+    SOURCE_CHOICES = [
+        ('WEBHOOK', 'Webhook payload'),
+        ('PAYMENT', 'Payment gateway response'),
+    ]
+    
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    object_id = models.BigIntegerField(help_text="PaymentWebhook or Payment ID")
+    data = models.BinaryField(help_text="zlib-compressed JSON")
+    original_created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'payment_archives'
+        unique_together = ['source', 'object_id']
+
+    def __str__(self):
+        return f"Archived {self.source} {self.object_id}"
+
+    @staticmethod
+    def compress(value):
+        return zlib.compress(json.dumps(value, separators=(',', ':'), default=str).encode('utf-8'), 9)
+
+    def get_data(self):
+        """Decompressed JSON as stored before archival"""
+        return json.loads(zlib.decompress(bytes(self.data)))
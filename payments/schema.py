@@ -3,19 +3,33 @@ Payments GraphQL Schema
 Handles payment gateway integration and processing
 """
 import graphene
+from asgiref.sync import sync_to_async
 from graphene_django import DjangoObjectType
+from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
 from typing import Dict, Any
+import json
 import logging
 
 from .models import PaymentGateway, Payment, Refund, PaymentWebhook
 from orders.models import Order, OrderStatusHistory
+from .services.health import get_all_gateway_health
 from .services.manager import payment_manager
+from .services.refunds import bulk_refund, finish_refund, reserve_refunds
+from .services.registry import gateway_registry
+from .services.settlement import settle_payment
+from .services.webhooks import ingest_webhook
 
 logger = logging.getLogger(__name__)
 
 
+def _require_staff(info):
+    user = info.context.user
+    if not user.is_authenticated or not user.is_staff:
+        raise Exception("Not authorized")
+
+
 # ============================================================================
 # GraphQL Types
 # ============================================================================
@@ -48,6 +62,16 @@ class PaymentWebhookType(DjangoObjectType):
         fields = '__all__'
 
 
+class RefundResultType(graphene.ObjectType):
+    """Outcome of one refund in a bulk refund"""
+    payment_id = graphene.String()
+    amount = graphene.Decimal()
+    success = graphene.Boolean()
+    message = graphene.String()
+    refund_id = graphene.String()
+
+
+
 # ============================================================================
 # Input Types
 # ============================================================================
@@ -97,6 +121,13 @@ class PaymentVerificationInput(graphene.InputObjectType):
     gateway_name = graphene.String(required=True)
 
 
+class BulkRefundItemInput(graphene.InputObjectType):
+    """One refund in a bulk refund"""
+    payment_id = graphene.String(required=True)
+    amount = graphene.Decimal(required=True)
+    reason = graphene.String()
+
+
 class RefundInput(graphene.InputObjectType):
     """Input for processing refund"""
     payment_id = graphene.String(required=True)
@@ -139,6 +170,15 @@ class PaymentQuery(graphene.ObjectType):
         description="Get available payment gateways for amount"
     )
     
+    payment_methods = graphene.JSONString(
+        gateway_name=graphene.String(required=True),
+        description="Get payment methods offered by a gateway"
+    )
+    
+    gateway_health = graphene.JSONString(
+        description="Circuit state, error rate and latency histogram per gateway (staff only)"
+    )
+    
     def resolve_payment_gateways(self, info, is_active=None):
         """Get payment gateways"""
         queryset = PaymentGateway.objects.all()
@@ -176,12 +216,21 @@ class PaymentQuery(graphene.ObjectType):
             )
             return {
                 'suitable_gateways': suitable_gateways,
-                'all_gateways': payment_manager.get_available_gateways()
+                'all_gateways': gateway_registry.public()
             }
         else:
             return {
-                'all_gateways': payment_manager.get_available_gateways()
+                'all_gateways': gateway_registry.public()
             }
+    
+    def resolve_payment_methods(self, info, gateway_name):
+        """Get gateway payment methods (served from cache)"""
+        return payment_manager.get_payment_methods(gateway_name)
+    
+    def resolve_gateway_health(self, info):
+        """Get rolling gateway health"""
+        _require_staff(info)
+        return get_all_gateway_health(list(payment_manager.gateways))
 
 
 # ============================================================================
@@ -202,7 +251,7 @@ class CreatePaymentSession(graphene.Mutation):
     expires_at = graphene.DateTime()
     gateway_response = graphene.JSONString()
     
-    def mutate(self, info, input, gateway_name):
+    async def mutate(self, info, input, gateway_name):
         try:
             # Convert input to dict format expected by payment manager
             order_data = {
@@ -263,14 +312,12 @@ class CreatePaymentSession(graphene.Mutation):
                     'postalCode': getattr(addr, 'postal_code', None)
                 }
             
-            # Create payment session
-            result = payment_manager.create_payment_session(order_data, gateway_name)
+            # Create payment session (the gateway call doesn't block the event loop)
+            result = await payment_manager.acreate_payment_session(order_data, gateway_name)
             
             if result['success']:
-                # Get Order by order_number
-                try:
-                    order = Order.objects.get(order_number=order_data['order_id'])
-                except Order.DoesNotExist:
+                payment = await sync_to_async(CreatePaymentSession.save_payment)(order_data, gateway_name, result)
+                if payment is None:
                     return CreatePaymentSession(
                         success=False,
                         message=f"Order not found: {order_data['order_id']}",
@@ -280,37 +327,6 @@ class CreatePaymentSession(graphene.Mutation):
                         gateway_response={}
                     )
                 
-                # Get PaymentGateway instance
-                try:
-                    payment_gateway = PaymentGateway.objects.get(name=gateway_name)
-                except PaymentGateway.DoesNotExist:
-                    # Create PaymentGateway if it doesn't exist (for development)
-                    payment_gateway = PaymentGateway.objects.create(
-                        name=gateway_name,
-                        display_name=gateway_name.title(),
-                        is_active=True,
-                        is_test_mode=True,
-                        api_key='',
-                        api_secret='',
-                        supported_currencies=['AED']
-                    )
-                
-                # Save payment record to database
-                payment = Payment.objects.create(
-                    order=order,
-                    payment_id=result['payment_id'],
-                    gateway=payment_gateway,
-                    payment_method='CREDIT_CARD',  # Default, can be updated later
-                    amount=order_data['amount'],
-                    currency=order_data['currency'],
-                    status='PENDING',
-                    gateway_response={
-                        **result.get('gateway_response', {}),
-                        'payment_url': result.get('payment_url'),
-                        'expires_at': result.get('expires_at')
-                    }
-                )
-                
                 return CreatePaymentSession(
                     success=True,
                     message="Payment session created successfully",
@@ -338,6 +354,31 @@ class CreatePaymentSession(graphene.Mutation):
                 expires_at=None,
                 gateway_response={}
             )
+    
+    @staticmethod
+    def save_payment(order_data, gateway_name, result):
+        """Save the payment record for a new session (None if the order doesn't exist)"""
+        # Get Order by order_number
+        try:
+            order = Order.objects.get(order_number=order_data['order_id'])
+        except Order.DoesNotExist:
+            return None
+        
+        # Save payment record to database (gateway row comes from the registry)
+        return Payment.objects.create(
+            order=order,
+            payment_id=result['payment_id'],
+            gateway_id=gateway_registry.get_gateway_id(gateway_name),
+            payment_method='CREDIT_CARD',  # Default, can be updated later
+            amount=order_data['amount'],
+            currency=order_data['currency'],
+            status='PENDING',
+            gateway_response={
+                **result.get('gateway_response', {}),
+                'payment_url': result.get('payment_url'),
+                'expires_at': result.get('expires_at')
+            }
+        )
 
 
 class VerifyPayment(graphene.Mutation):
@@ -353,80 +394,16 @@ class VerifyPayment(graphene.Mutation):
     transaction_id = graphene.String()
     gateway_response = graphene.JSONString()
     
-    def mutate(self, info, input):
+    async def mutate(self, info, input):
         try:
             # Verify payment with gateway
-            result = payment_manager.verify_payment(
+            result = await payment_manager.averify_payment(
                 input['payment_id'], 
                 input['gateway_name']
             )
             
             if result['success']:
-                # Update payment record
-                try:
-                    payment = Payment.objects.get(payment_id=input['payment_id'])
-                    
-                    # Convert status from Ziina format to model format
-                    status_lower = result.get('status', '').lower()
-                    status_mapping = {
-                        'completed': 'CAPTURED',
-                        'pending': 'PENDING',
-                        'failed': 'FAILED',
-                        'cancelled': 'CANCELLED',
-                        'canceled': 'CANCELLED',
-                        'authorized': 'AUTHORIZED',
-                        'refunded': 'REFUNDED'
-                    }
-                    payment_status = status_mapping.get(status_lower, 'PENDING')
-                    
-                    payment.status = payment_status
-                    payment.gateway_transaction_id = result.get('transaction_id', '')
-                    payment.gateway_response = result.get('gateway_response', {})
-                    
-                    # Set appropriate timestamp based on status
-                    if payment_status == 'CAPTURED':
-                        payment.captured_at = timezone.now()
-                    elif payment_status == 'AUTHORIZED':
-                        payment.authorized_at = timezone.now()
-                    elif payment_status == 'FAILED':
-                        payment.failed_at = timezone.now()
-                    
-                    payment.save()
-                    
-                    # Update order status if payment successful
-                    if payment_status == 'CAPTURED':
-                        order = payment.order
-                        if order.status == 'PENDING':
-                            order.status = 'CONFIRMED'
-                            order.confirmed_at = timezone.now()
-                            order.save()
-                            
-                            # Create status history
-                            OrderStatusHistory.objects.create(
-                                order=order,
-                                status='CONFIRMED',
-                                notes=f'Payment confirmed via Ziina - Payment ID: {input["payment_id"]}'
-                            )
-                            
-                            # Deduct inventory (reserved → deducted)
-                            from products.models import Product, ProductVariant
-                            for item in order.items.all():
-                                if item.variant:
-                                    variant = item.variant
-                                    variant.reserved_quantity = max(0, variant.reserved_quantity - item.quantity)
-                                    variant.quantity_in_stock = max(0, variant.quantity_in_stock - item.quantity)
-                                    variant.save()
-                                else:
-                                    if hasattr(item.product, 'inventory'):
-                                        inventory = item.product.inventory
-                                        inventory.reserved_quantity = max(0, inventory.reserved_quantity - item.quantity)
-                                        inventory.quantity_in_stock = max(0, inventory.quantity_in_stock - item.quantity)
-                                        inventory.save()
-                    
-                except Payment.DoesNotExist:
-                    pass
-                except Exception as e:
-                    logger.error(f"Error updating payment: {str(e)}", exc_info=True)
+                await sync_to_async(VerifyPayment.update_payment)(input, result)
                 
                 return VerifyPayment(
                     success=True,
@@ -455,6 +432,23 @@ class VerifyPayment(graphene.Mutation):
                 transaction_id='',
                 gateway_response={}
             )
+    
+    @staticmethod
+    def update_payment(input, result):
+        """Apply the verified status to the payment record"""
+        try:
+            payment = Payment.objects.get(payment_id=input['payment_id'])
+            settle_payment(
+                payment,
+                result.get('status'),
+                gateway_response=result.get('gateway_response', {}),
+                transaction_id=result.get('transaction_id', ''),
+                source=input['gateway_name'].title()
+            )
+        except Payment.DoesNotExist:
+            pass
+        except Exception as e:
+            logger.error(f"Error updating payment: {str(e)}", exc_info=True)
 
 
 class ProcessRefund(graphene.Mutation):
@@ -469,40 +463,50 @@ class ProcessRefund(graphene.Mutation):
     amount = graphene.Decimal()
     gateway_response = graphene.JSONString()
     
-    def mutate(self, info, input):
+    async def mutate(self, info, input):
+        # In a thread: resolving the session user queries the database
+        await sync_to_async(_require_staff)(info)
         try:
+            item = {
+                'payment_id': input['payment_id'],
+                'amount': Decimal(str(input['amount'])),
+                'reason': input.get('reason'),
+            }
+            
+            # Create the PENDING refund (guards against refunding twice)
+            reserved, rejected = await sync_to_async(reserve_refunds)([item])
+            if rejected:
+                return ProcessRefund(
+                    success=False,
+                    message=rejected[0]['message'],
+                    refund_id='',
+                    amount=Decimal('0'),
+                    gateway_response={}
+                )
+            refund, _ = reserved[0]
+            
             # Process refund through gateway
-            result = payment_manager.refund_payment(
+            result = await payment_manager.arefund_payment(
                 input['payment_id'],
-                Decimal(str(input['amount'])),
-                input['gateway_name'],
-                input.get('reason')
+                item['amount'],
+                refund.payment.gateway.name,
+                refund.reason
             )
+            outcome = await sync_to_async(finish_refund)(refund, item, result)
             
-            if result['success']:
-                # Create refund record
-                refund = Refund.objects.create(
-                    payment_id=input['payment_id'],
-                    refund_id=result['refund_id'],
-                    gateway=input['gateway_name'],
-                    amount=Decimal(str(input['amount'])),
-                    reason=input.get('reason', 'Customer requested refund'),
-                    status='processed',
-                    gateway_response=result.get('gateway_response', {})
-                )
-                
+            if outcome['success']:
                 return ProcessRefund(
                     success=True,
                     message="Refund processed successfully",
-                    refund_id=result['refund_id'],
-                    amount=Decimal(str(input['amount'])),
+                    refund_id=refund.refund_id,
+                    amount=item['amount'],
                     gateway_response=result.get('gateway_response', {})
                 )
             else:
                 return ProcessRefund(
                     success=False,
-                    message=result.get('error', 'Refund processing failed'),
-                    refund_id='',
+                    message=outcome['message'],
+                    refund_id=refund.refund_id,
                     amount=Decimal('0'),
                     gateway_response=result
                 )
@@ -517,8 +521,46 @@ class ProcessRefund(graphene.Mutation):
             )
 
 
+class BulkProcessRefund(graphene.Mutation):
+    """Refund many payments at once (staff only)"""
+    
+    class Arguments:
+        items = graphene.List(graphene.NonNull(BulkRefundItemInput), required=True)
+        reason = graphene.String()
+    
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(RefundResultType)
+    
+    def mutate(self, info, items, reason=None):
+        _require_staff(info)
+        try:
+            results = list(bulk_refund(
+                [
+                    {'payment_id': item.payment_id, 'amount': item.amount, 'reason': item.reason}
+                    for item in items
+                ],
+                reason=reason,
+                workers=getattr(settings, 'PAYMENT_REFUND_WORKERS', 8),
+            ))
+            succeeded = sum(1 for result in results if result['success'])
+            
+            return BulkProcessRefund(
+                success=succeeded == len(results),
+                message=f"{succeeded} of {len(results)} refunds processed",
+                results=[RefundResultType(**result) for result in results]
+            )
+        except Exception as e:
+            logger.error(f"Error processing bulk refund: {str(e)}", exc_info=True)
+            return BulkProcessRefund(
+                success=False,
+                message=f"Error processing refunds: {str(e)}",
+                results=[]
+            )
+
+
 class HandleWebhook(graphene.Mutation):
-    """Handle webhook from payment gateway"""
+    """Queue a gateway webhook by hand (staff only, e.g. to replay a missed event)"""
     
     class Arguments:
         payload = graphene.JSONString(required=True)
@@ -531,33 +573,27 @@ class HandleWebhook(graphene.Mutation):
     amount = graphene.Decimal()
     
     def mutate(self, info, payload, gateway_name):
+        _require_staff(info)
         try:
-            # Handle webhook
-            result = payment_manager.handle_webhook(payload, gateway_name)
+            # Queue the webhook exactly like the webhook endpoints do
+            raw_body = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+            queued = ingest_webhook(gateway_name, raw_body, {})
+            if not queued['success']:
+                return HandleWebhook(
+                    success=False,
+                    message=queued.get('error', 'Webhook processing failed'),
+                    payment_id='',
+                    status='error',
+                    amount=Decimal('0')
+                )
+            
+            # Parse the payload for the response (settlement happens in the worker)
+            result = payment_manager.handle_webhook(json.loads(raw_body), gateway_name)
             
             if result['success']:
-                # Log webhook
-                webhook = PaymentWebhook.objects.create(
-                    gateway=gateway_name,
-                    payload=payload,
-                    payment_id=result['payment_id'],
-                    status=result['status'],
-                    amount=result['amount'],
-                    processed_at=timezone.now()
-                )
-                
-                # Update payment if exists
-                try:
-                    payment = Payment.objects.get(payment_id=result['payment_id'])
-                    payment.status = result['status']
-                    payment.gateway_response = payload
-                    payment.save()
-                except Payment.DoesNotExist:
-                    pass
-                
                 return HandleWebhook(
                     success=True,
-                    message="Webhook processed successfully",
+                    message="Webhook already received" if queued['duplicate'] else "Webhook queued for processing",
                     payment_id=result['payment_id'],
                     status=result['status'],
                     amount=result['amount']
@@ -590,4 +626,5 @@ class PaymentMutation(graphene.ObjectType):
     create_payment_session = CreatePaymentSession.Field()
     verify_payment = VerifyPayment.Field()
     process_refund = ProcessRefund.Field()
+    bulk_process_refund = BulkProcessRefund.Field()
     handle_webhook = HandleWebhook.Field()
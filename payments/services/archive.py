@@ -0,0 +1,124 @@
+"""
+Payment payload archival
+Moves old webhook payloads and gateway responses into compressed
+PaymentArchive rows and trims the live rows (`manage.py archive_payment_payloads`)
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, Any
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Keys kept on the live rows after archival (everything else is archived only)
+WEBHOOK_PAYLOAD_KEYS = ('id', 'payment_id', 'order_id', 'event', 'event_id', 'type', 'status')
+GATEWAY_RESPONSE_KEYS = ('id', 'status', 'payment_url', 'expires_at')
+
+
+def _trim(data, keys) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        return {}
+    return {key: data[key] for key in keys if key in data}
+
+
+def archive_webhooks(cutoff, batch_size: int = 500) -> int:
+    """
+    Archive one batch of settled webhooks created before `cutoff`
+    
+    Only PROCESSED and FAILED webhooks are archived; the worker still needs
+    the payload of queued ones.
+    
+    Returns:
+        Number of webhooks archived (0 when there is nothing left)
+    """
+    from ..models import PaymentArchive, PaymentWebhook
+    
+    with transaction.atomic():
+        webhooks = list(
+            PaymentWebhook.objects.select_for_update(skip_locked=True)
+            .filter(archived_at__isnull=True, created_at__lt=cutoff, status__in=['PROCESSED', 'FAILED'])
+            .order_by('id')
+            .only('id', 'payload', 'created_at')[:batch_size]
+        )
+        if not webhooks:
+            return 0
+        
+        PaymentArchive.objects.bulk_create(
+            [
+                PaymentArchive(
+                    source='WEBHOOK',
+                    object_id=webhook.id,
+                    data=PaymentArchive.compress(webhook.payload),
+                    original_created_at=webhook.created_at,
+                )
+                for webhook in webhooks
+            ],
+            ignore_conflicts=True,
+        )
+        
+        now = timezone.now()
+        for webhook in webhooks:
+            webhook.payload = _trim(webhook.payload, WEBHOOK_PAYLOAD_KEYS)
+            webhook.archived_at = now
+        PaymentWebhook.objects.bulk_update(webhooks, ['payload', 'archived_at'])
+    
+    return len(webhooks)
+
+
+def archive_gateway_responses(cutoff, batch_size: int = 500) -> int:
+    """
+    Archive the gateway_response of one batch of settled payments
+    created before `cutoff` (PENDING payments are left alone)
+    
+    Returns:
+        Number of payments archived (0 when there is nothing left)
+    """
+    from ..models import PaymentArchive, Payment
+    
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update(skip_locked=True)
+            .filter(archived_at__isnull=True, created_at__lt=cutoff)
+            .exclude(status='PENDING')
+            .order_by('id')
+            .only('id', 'gateway_response', 'created_at')[:batch_size]
+        )
+        if not payments:
+            return 0
+        
+        PaymentArchive.objects.bulk_create(
+            [
+                PaymentArchive(
+                    source='PAYMENT',
+                    object_id=payment.id,
+                    data=PaymentArchive.compress(payment.gateway_response),
+                    original_created_at=payment.created_at,
+                )
+                for payment in payments
+            ],
+            ignore_conflicts=True,
+        )
+        
+        now = timezone.now()
+        for payment in payments:
+            payment.gateway_response = _trim(payment.gateway_response, GATEWAY_RESPONSE_KEYS)
+            payment.archived_at = now
+        Payment.objects.bulk_update(payments, ['gateway_response', 'archived_at'])
+    
+    return len(payments)
+
+
+def count_archivable(days: int) -> Dict[str, int]:
+    """Number of webhooks and payments an archival run would touch"""
+    from ..models import Payment, PaymentWebhook
+    
+    cutoff = timezone.now() - timedelta(days=days)
+    return {
+        'webhooks': PaymentWebhook.objects.filter(
+            archived_at__isnull=True, created_at__lt=cutoff, status__in=['PROCESSED', 'FAILED']
+        ).count(),
+        'payments': Payment.objects.filter(
+            archived_at__isnull=True, created_at__lt=cutoff
+        ).exclude(status='PENDING').count(),
+    }
@@ -2,16 +2,92 @@
 Base payment service class
 Common functionality for all payment gateways
 """
+import hashlib
 import logging
+import os
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
+from ecomarce_choco.cache import get_or_refresh
+from .health import GatewaySession
+
 logger = logging.getLogger(__name__)
 
+# Shared HTTP sessions, one per gateway per process
+_http_sessions: Dict[Tuple[str, int], requests.Session] = {}
+_http_sessions_lock = threading.Lock()
+
+# Threads that run gateway calls for the async API (see BasePaymentService.a* methods)
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_http_session(gateway_name: str) -> requests.Session:
+    """
+    Get the shared keep-alive HTTP session for a gateway
+    
+    Connections are pooled per gateway and reused across requests, so only
+    the first call pays the TCP/TLS handshake. Idempotent requests (GET,
+    HEAD, OPTIONS) are retried with exponential backoff on connection errors
+    and 429/5xx responses; POSTs are never retried. Every call is timed and
+    goes through the gateway's circuit breaker (see health.py).
+    Sessions are keyed by PID so forked workers never share sockets.
+    """
+    key = (gateway_name, os.getpid())
+    session = _http_sessions.get(key)
+    if session is not None:
+        return session
+    
+    with _http_sessions_lock:
+        session = _http_sessions.get(key)
+        if session is None:
+            retry = Retry(
+                total=getattr(settings, 'PAYMENT_HTTP_MAX_RETRIES', 2),
+                backoff_factor=getattr(settings, 'PAYMENT_HTTP_BACKOFF_FACTOR', 0.3),
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+                raise_on_status=False,
+            )
+            pool_size = getattr(settings, 'PAYMENT_HTTP_POOL_SIZE', 10)
+            adapter = HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+                max_retries=retry,
+            )
+            session = GatewaySession(gateway_name)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_sessions[key] = session
+    return session
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """
+    Get the thread pool that runs gateway calls for async callers
+    
+    The pooled sessions are thread-safe, so an ASGI worker can keep up to
+    PAYMENT_HTTP_MAX_CONCURRENCY gateway calls in flight while its event loop
+    keeps serving other requests.
+    """
+    global _io_executor
+    if _io_executor is None:
+        with _http_sessions_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PAYMENT_HTTP_MAX_CONCURRENCY', 32),
+                    thread_name_prefix='payment-gateway-io',
+                )
+    return _io_executor
+
 
 class BasePaymentService(ABC):
     """
@@ -23,6 +99,19 @@ class BasePaymentService(ABC):
         self.gateway_name = self.__class__.__name__
         self.logger = logger
     
+    @property
+    def http(self) -> requests.Session:
+        """Pooled keep-alive session for this gateway"""
+        return get_http_session(self.gateway_name)
+    
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """(connect, read) timeouts for gateway API calls"""
+        return (
+            getattr(settings, 'PAYMENT_HTTP_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'PAYMENT_HTTP_READ_TIMEOUT', 15),
+        )
+    
     @abstractmethod
     def create_payment_session(self, order_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -78,6 +167,68 @@ class BasePaymentService(ABC):
         """
         pass
     
+    async def acreate_payment_session(self, order_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of create_payment_session"""
+        return await self._run_async(self.create_payment_session, order_data)
+    
+    async def averify_payment(self, payment_id: str) -> Dict[str, Any]:
+        """Async variant of verify_payment"""
+        return await self._run_async(self.verify_payment, payment_id)
+    
+    async def arefund_payment(self, payment_id: str, amount: Decimal, reason: str = None) -> Dict[str, Any]:
+        """Async variant of refund_payment"""
+        return await self._run_async(self.refund_payment, payment_id, amount, reason)
+    
+    async def _run_async(self, func, *args):
+        """Run a blocking gateway call on the gateway I/O thread pool"""
+        return await sync_to_async(func, thread_sensitive=False, executor=get_io_executor())(*args)
+    
+    def get_cached_payment_methods(self) -> Dict[str, Any]:
+        """
+        get_payment_methods served from the shared cache
+        
+        Stale results are served while one worker refreshes them in the
+        background, so checkout never waits on this call once it's warm.
+        Errors are not cached.
+        """
+        return get_or_refresh(
+            f'payment_methods:{self.gateway_name}',
+            self.get_payment_methods,
+            ttl=getattr(settings, 'PAYMENT_METHODS_CACHE_TTL', 3600),
+            stale_ttl=getattr(settings, 'PAYMENT_METHODS_CACHE_STALE_TTL', 86400),
+            should_cache=lambda result: result.get('success', False),
+        )
+    
+    @property
+    def signs_webhooks(self) -> bool:
+        """
+        Whether webhook payloads can be trusted as-is
+        Unsigned webhooks are only a trigger: process_webhooks takes the
+        payment status from verify_payment instead of the payload
+        """
+        return False
+    
+    def verify_webhook_signature(self, raw_body: bytes, headers: Dict[str, str]) -> bool:
+        """
+        Verify a webhook against the raw request body before it is stored
+        Gateways without signed webhooks accept everything (see signs_webhooks)
+        """
+        return True
+    
+    def get_webhook_event_id(self, payload: Dict[str, Any], raw_body: bytes) -> str:
+        """
+        Unique ID of a webhook event, used to drop gateway retries
+        Falls back to a hash of the raw body (retries resend the same body)
+        """
+        event_id = payload.get('event_id') or payload.get('webhook_id')
+        if event_id:
+            return str(event_id)
+        return hashlib.sha256(raw_body).hexdigest()
+    
+    def get_webhook_reference(self, payload: Dict[str, Any]) -> str:
+        """Gateway payment ID a webhook refers to"""
+        return str(payload.get('payment_id') or payload.get('id') or '')
+    
     def format_amount(self, amount: Decimal) -> str:
         """Format amount for payment gateway (usually in smallest currency unit)"""
         # Convert AED to fils (1 AED = 100 fils)
@@ -125,6 +276,17 @@ class BasePaymentService(ABC):
             'gateway': self.gateway_name
         }
     
+    def create_refund_error_response(self, error_message: str, outcome_unknown: bool = True) -> Dict[str, Any]:
+        """
+        Error response for a refund call
+        Unless the gateway explicitly declined (or was never reached), the
+        refund may have gone through: 'outcome_unknown' keeps it reserved
+        until reconcile_refunds resolves it
+        """
+        response = self.create_error_response(error_message)
+        response['outcome_unknown'] = outcome_unknown
+        return response
+    
     def create_success_response(self, **kwargs) -> Dict[str, Any]:
         """Create standardized success response"""
         response = {
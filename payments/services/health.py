@@ -0,0 +1,232 @@
+"""
+Payment gateway health
+Circuit breakers and rolling latency/error histograms per gateway, kept in the
+Django cache so every worker sees the same state
+"""
+import logging
+import time
+from typing import Dict, Any, List
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CIRCUIT_CLOSED = 'CLOSED'
+CIRCUIT_OPEN = 'OPEN'
+CIRCUIT_HALF_OPEN = 'HALF_OPEN'
+
+
+class GatewayUnavailable(requests.exceptions.ConnectionError):
+    """Raised instead of calling a gateway whose circuit is open"""
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _key(gateway_name: str, *parts) -> str:
+    return ':'.join(['payment_health', gateway_name, *map(str, parts)])
+
+
+def _incr(key: str, delta: int, timeout: int):
+    """Increment a counter, creating it if needed (atomic on shared backends)"""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout):
+            cache.incr(key, delta)
+
+
+def _bucket_label(seconds: float) -> str:
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return f'le_{bound}'
+    return 'le_inf'
+
+
+# ============================================================================
+# Circuit Breaker
+# ============================================================================
+
+def get_circuit_state(gateway_name: str) -> str:
+    """Current circuit state without taking the half-open probe"""
+    circuit = cache.get(_key(gateway_name, 'circuit'))
+    if not circuit:
+        return CIRCUIT_CLOSED
+    if time.time() - circuit['opened_at'] < _setting('PAYMENT_CIRCUIT_RESET_TIMEOUT', 30):
+        return CIRCUIT_OPEN
+    return CIRCUIT_HALF_OPEN
+
+
+def allow_request(gateway_name: str) -> bool:
+    """
+    Check whether a call to the gateway may go out
+    
+    While the circuit is open calls fail fast. Once the reset timeout has
+    passed a single worker gets to send a probe; its result closes or
+    re-opens the circuit.
+    """
+    state = get_circuit_state(gateway_name)
+    if state == CIRCUIT_CLOSED:
+        return True
+    if state == CIRCUIT_OPEN:
+        return False
+    return cache.add(_key(gateway_name, 'probe'), 1, _setting('PAYMENT_CIRCUIT_RESET_TIMEOUT', 30))
+
+
+def _open_circuit(gateway_name: str, reason: str):
+    reset_timeout = _setting('PAYMENT_CIRCUIT_RESET_TIMEOUT', 30)
+    cache.set(_key(gateway_name, 'circuit'), {'opened_at': time.time(), 'reason': reason}, reset_timeout * 10)
+    cache.delete(_key(gateway_name, 'probe'))
+    logger.warning(f"{gateway_name} circuit opened: {reason}")
+
+
+def _close_circuit(gateway_name: str):
+    cache.delete_many([
+        _key(gateway_name, 'circuit'),
+        _key(gateway_name, 'probe'),
+        _key(gateway_name, 'failures'),
+    ])
+    logger.info(f"{gateway_name} circuit closed")
+
+
+# ============================================================================
+# Recording
+# ============================================================================
+
+def record_call(gateway_name: str, duration: float, success: bool):
+    """
+    Record one gateway call in the histogram and update the circuit
+    
+    Slow calls (over PAYMENT_GATEWAY_SLOW_CALL_SECONDS) count as failures so a
+    gateway that hangs is cut off like one that errors.
+    """
+    window = _setting('PAYMENT_HEALTH_WINDOW_MINUTES', 5)
+    timeout = (window + 1) * 60
+    minute = int(time.time() // 60)
+    
+    _incr(_key(gateway_name, minute, 'calls'), 1, timeout)
+    _incr(_key(gateway_name, minute, _bucket_label(duration)), 1, timeout)
+    _incr(_key(gateway_name, minute, 'latency_ms'), int(duration * 1000), timeout)
+    
+    slow = duration > _setting('PAYMENT_GATEWAY_SLOW_CALL_SECONDS', 5)
+    if slow:
+        logger.warning(f"Slow {gateway_name} call: {duration:.2f}s")
+    
+    if success and not slow:
+        if get_circuit_state(gateway_name) != CIRCUIT_CLOSED:
+            _close_circuit(gateway_name)
+        elif cache.get(_key(gateway_name, 'failures')):
+            cache.delete(_key(gateway_name, 'failures'))
+        return
+    
+    _incr(_key(gateway_name, minute, 'errors'), 1, timeout)
+    failures_key = _key(gateway_name, 'failures')
+    _incr(failures_key, 1, timeout)
+    
+    if get_circuit_state(gateway_name) == CIRCUIT_HALF_OPEN:
+        _open_circuit(gateway_name, 'probe failed')
+    elif (cache.get(failures_key) or 0) >= _setting('PAYMENT_CIRCUIT_FAILURE_THRESHOLD', 5):
+        _open_circuit(gateway_name, 'consecutive failures')
+
+
+class GatewaySession(requests.Session):
+    """
+    HTTP session that times every gateway call and respects the circuit
+    
+    Connection errors, timeouts, 429 and 5xx responses count as failures.
+    """
+    
+    def __init__(self, gateway_name: str):
+        super().__init__()
+        self.gateway_name = gateway_name
+    
+    def request(self, method, url, *args, **kwargs):
+        if not allow_request(self.gateway_name):
+            raise GatewayUnavailable(f"{self.gateway_name} is temporarily unavailable")
+        
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            record_call(self.gateway_name, time.monotonic() - start, success=False)
+            raise
+        
+        success = response.status_code != 429 and response.status_code < 500
+        record_call(self.gateway_name, time.monotonic() - start, success=success)
+        return response
+
+
+# ============================================================================
+# Reporting
+# ============================================================================
+
+def _percentile(histogram: Dict[str, int], total: int, fraction: float):
+    """Upper bound of the bucket holding the given fraction of calls"""
+    if not total:
+        return None
+    threshold = total * fraction
+    seen = 0
+    for bound in LATENCY_BUCKETS:
+        seen += histogram.get(f'le_{bound}', 0)
+        if seen >= threshold:
+            return bound
+    return None
+
+
+def get_gateway_health(gateway_name: str) -> Dict[str, Any]:
+    """
+    Rolling health of a gateway over the last PAYMENT_HEALTH_WINDOW_MINUTES
+    
+    Returns:
+        Dict with circuit state, call/error counts, latency percentiles
+        (bucket upper bounds, seconds), histogram and 'degraded' flag
+    """
+    window = _setting('PAYMENT_HEALTH_WINDOW_MINUTES', 5)
+    current = int(time.time() // 60)
+    labels = ['calls', 'errors', 'latency_ms'] + [f'le_{bound}' for bound in LATENCY_BUCKETS] + ['le_inf']
+    
+    keys = {
+        _key(gateway_name, minute, label): label
+        for minute in range(current - window + 1, current + 1)
+        for label in labels
+    }
+    totals = dict.fromkeys(labels, 0)
+    for key, value in cache.get_many(list(keys)).items():
+        totals[keys[key]] += value
+    
+    calls = totals['calls']
+    error_rate = totals['errors'] / calls if calls else 0.0
+    histogram = {label: totals[label] for label in labels if label.startswith('le_')}
+    p95 = _percentile(histogram, calls, 0.95)
+    circuit_state = get_circuit_state(gateway_name)
+    
+    degraded = circuit_state != CIRCUIT_CLOSED or (
+        calls >= _setting('PAYMENT_HEALTH_MIN_CALLS', 5) and (
+            error_rate >= _setting('PAYMENT_HEALTH_DEGRADED_ERROR_RATE', 0.2)
+            or (p95 or 0) > _setting('PAYMENT_GATEWAY_SLOW_CALL_SECONDS', 5)
+        )
+    )
+    
+    return {
+        'gateway': gateway_name,
+        'circuit_state': circuit_state,
+        'calls': calls,
+        'errors': totals['errors'],
+        'error_rate': round(error_rate, 4),
+        'avg_latency_ms': round(totals['latency_ms'] / calls) if calls else None,
+        'p50': _percentile(histogram, calls, 0.50),
+        'p95': p95,
+        'p99': _percentile(histogram, calls, 0.99),
+        'histogram': histogram,
+        'degraded': degraded,
+    }
+
+
+def get_all_gateway_health(gateway_names: List[str]) -> List[Dict[str, Any]]:
+    """Health of several gateways"""
+    return [get_gateway_health(name) for name in gateway_names]
@@ -4,7 +4,10 @@ Manages all payment gateways and provides unified interface
 """
 from typing import Dict, Any, Optional
 from decimal import Decimal
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from .health import get_gateway_health, CIRCUIT_OPEN
+from .registry import gateway_registry
 from .tabby import TabbyService
 from .tamara import TamaraService
 from .ziina import ZiinaService
@@ -46,6 +49,8 @@ class PaymentManager:
             gateway_name = self.default_gateway
         
         gateway = self.get_gateway(gateway_name)
+        if not self._is_active(gateway_name):
+            return gateway.create_error_response(f"{gateway_name.title()} payments are currently disabled")
         
         # Add gateway-specific data formatting
         formatted_order_data = self._format_order_data(order_data, gateway_name)
@@ -66,6 +71,24 @@ class PaymentManager:
         gateway = self.get_gateway(gateway_name)
         return gateway.verify_payment(payment_id)
     
+    async def acreate_payment_session(self, order_data: Dict[str, Any], gateway_name: str = None) -> Dict[str, Any]:
+        """Async variant of create_payment_session"""
+        if not gateway_name:
+            gateway_name = self.default_gateway
+        
+        gateway = self.get_gateway(gateway_name)
+        if not await sync_to_async(self._is_active)(gateway_name):
+            return gateway.create_error_response(f"{gateway_name.title()} payments are currently disabled")
+        
+        formatted_order_data = self._format_order_data(order_data, gateway_name)
+        
+        return await gateway.acreate_payment_session(formatted_order_data)
+    
+    async def averify_payment(self, payment_id: str, gateway_name: str) -> Dict[str, Any]:
+        """Async variant of verify_payment"""
+        gateway = self.get_gateway(gateway_name)
+        return await gateway.averify_payment(payment_id)
+    
     def handle_webhook(self, payload: Dict[str, Any], gateway_name: str) -> Dict[str, Any]:
         """
         Handle webhook from specified gateway
@@ -96,47 +119,41 @@ class PaymentManager:
         gateway = self.get_gateway(gateway_name)
         return gateway.refund_payment(payment_id, amount, reason)
     
+    async def arefund_payment(self, payment_id: str, amount: Decimal, gateway_name: str, reason: str = None) -> Dict[str, Any]:
+        """Async variant of refund_payment"""
+        gateway = self.get_gateway(gateway_name)
+        return await gateway.arefund_payment(payment_id, amount, reason)
+    
+    def get_payment_methods(self, gateway_name: str) -> Dict[str, Any]:
+        """
+        Get payment methods offered by a gateway (cached)
+        
+        Args:
+            gateway_name: Payment gateway name
+        
+        Returns:
+            Dict with 'methods' from the gateway
+        """
+        gateway = self.get_gateway(gateway_name)
+        return gateway.get_cached_payment_methods()
+    
     def get_available_gateways(self) -> Dict[str, Any]:
         """
         Get list of available payment gateways
         
         Returns:
-            Dict with available gateways and their capabilities
-        """
-        return {
-            'TABBY': {
-                'name': 'Tabby',
-                'type': 'BNPL',
-                'description': 'Buy Now, Pay Later - 4 installments',
-                'supported_currencies': ['AED'],
-                'min_amount': Decimal('50.00'),
-                'max_amount': Decimal('10000.00'),
-                'features': ['installments', 'no_interest', 'instant_approval']
-            },
-            'TAMARA': {
-                'name': 'Tamara',
-                'type': 'BNPL',
-                'description': 'Buy Now, Pay Later - Flexible installments',
-                'supported_currencies': ['AED'],
-                'min_amount': Decimal('100.00'),
-                'max_amount': Decimal('15000.00'),
-                'features': ['flexible_installments', 'no_interest', 'instant_approval']
-            },
-            'ZIINA': {
-                'name': 'Ziina',
-                'type': 'INSTANT',
-                'description': 'UAE Central Bank licensed instant payments with Apple Pay',
-                'supported_currencies': ['AED'],
-                'min_amount': Decimal('1.00'),
-                'max_amount': Decimal('50000.00'),
-                'features': ['apple_pay', 'instant_payment', 'refund_support', 'arabic_support']
-            }
-        }
+            Dict with available gateways and their capabilities (read-only,
+            served from the gateway registry)
+        """
+        return gateway_registry.all()
     
     def get_suitable_gateways(self, amount: Decimal, customer_preference: str = None) -> list:
         """
         Get list of suitable payment gateways for given amount
         
+        Gateways whose circuit is open are left out and degraded gateways
+        are listed last, so customers are steered to healthy providers.
+        
         Args:
             amount: Payment amount
             customer_preference: Customer's preferred payment type
@@ -148,6 +165,9 @@ class PaymentManager:
         suitable = []
         
         for gateway_name, gateway_info in available_gateways.items():
+            if not gateway_info['is_active'] or gateway_name not in self.gateways:
+                continue
+            
             # Check amount limits
             if amount < gateway_info['min_amount'] or amount > gateway_info['max_amount']:
                 continue
@@ -161,8 +181,17 @@ class PaymentManager:
             
             suitable.append(gateway_name)
         
+        health = {name: get_gateway_health(name) for name in suitable}
+        suitable = [name for name in suitable if health[name]['circuit_state'] != CIRCUIT_OPEN]
+        suitable.sort(key=lambda name: health[name]['degraded'])
+        
         return suitable
     
+    def _is_active(self, gateway_name: str) -> bool:
+        """Whether the gateway is enabled in its PaymentGateway row (default: yes)"""
+        info = gateway_registry.get(gateway_name)
+        return info is None or info['is_active']
+    
     def _format_order_data(self, order_data: Dict[str, Any], gateway_name: str) -> Dict[str, Any]:
         """
         Format order data for specific gateway requirements
@@ -0,0 +1,232 @@
+"""
+Payment reconciliation
+Re-checks PENDING payments with their gateway when the webhook never
+arrived, and refunds whose gateway call had an unknown outcome
+(`manage.py reconcile_payments [--refunds]`)
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from typing import Dict, Any, List, Tuple, Iterable
+from django.db import transaction
+from django.utils import timezone
+
+from .manager import payment_manager
+from .refunds import finish_refund
+from .settlement import settle_payment, normalize_payment_status
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket
+    
+    Allows `rate` calls per second on average with bursts of up to `burst`.
+    """
+    
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a call is allowed"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def get_stale_pending_payments(older_than: int = 30, gateways: List[str] = None,
+                               limit: int = None) -> Iterable[Tuple[int, str, str]]:
+    """
+    Pending payments created more than `older_than` minutes ago
+    
+    Returns:
+        Iterator of (pk, gateway payment ID, gateway name), oldest first
+    """
+    from ..models import Payment
+    
+    queryset = Payment.objects.filter(
+        status='PENDING',
+        created_at__lt=timezone.now() - timedelta(minutes=older_than),
+        gateway__isnull=False,
+    )
+    if gateways:
+        queryset = queryset.filter(gateway__name__in=[name.upper() for name in gateways])
+    
+    queryset = queryset.order_by('created_at').values_list('pk', 'payment_id', 'gateway__name')
+    if limit:
+        queryset = queryset[:limit]
+    return queryset.iterator(chunk_size=1000)
+
+
+def settle_results(results: List[Tuple[int, Dict[str, Any]]]) -> int:
+    """
+    Apply a batch of verification results in one transaction
+    
+    Each payment is settled in its own savepoint so one bad row doesn't undo
+    the rest of the batch.
+    
+    Returns:
+        Number of payments whose status changed
+    """
+    from ..models import Payment
+    
+    payments = Payment.objects.select_related('gateway').in_bulk([pk for pk, _ in results])
+    changed = 0
+    with transaction.atomic():
+        for pk, result in results:
+            payment = payments.get(pk)
+            if not payment:
+                continue
+            try:
+                if settle_payment(
+                    payment,
+                    result.get('status'),
+                    gateway_response=result.get('gateway_response', {}),
+                    transaction_id=result.get('transaction_id', ''),
+                    source=f'{payment.gateway.display_name} reconciliation'
+                ):
+                    changed += 1
+            except Exception as e:
+                logger.error(f"Error settling payment {payment.payment_id}: {str(e)}", exc_info=True)
+    return changed
+
+
+def reconcile_payments(older_than: int = 30, gateways: List[str] = None, limit: int = None,
+                       workers: int = 8, rate_limit: float = 5.0, batch_size: int = 100,
+                       dry_run: bool = False, progress=None) -> Dict[str, int]:
+    """
+    Verify stale pending payments with their gateways and settle the results
+    
+    Gateway calls run on a thread pool, throttled per gateway: the calling
+    thread takes a rate limit token before submitting each call, so workers
+    never sit idle waiting for one. Only the workers talk to the gateways;
+    settlement happens on the calling thread in batches, so the workers
+    never hold database connections.
+    
+    Args:
+        older_than: Minutes a payment must have been pending
+        gateways: Only reconcile these gateways (default: all)
+        limit: Maximum number of payments to check
+        workers: Number of concurrent gateway calls
+        rate_limit: Gateway calls per second, per gateway
+        batch_size: Results settled per transaction
+        dry_run: Verify only, don't update anything
+        progress: Optional callable receiving the stats dict after each batch
+    
+    Returns:
+        Dict with 'checked', 'settled', 'unchanged' and 'errors' counts
+    """
+    stats = {'checked': 0, 'settled': 0, 'unchanged': 0, 'errors': 0}
+    limiters: Dict[str, RateLimiter] = {}
+    pending_results: List[Tuple[int, Dict[str, Any]]] = []
+    
+    def verify(pk: int, payment_id: str, gateway_name: str):
+        try:
+            return pk, payment_manager.verify_payment(payment_id, gateway_name)
+        except Exception as e:
+            logger.error(f"Error verifying payment {payment_id} with {gateway_name}: {str(e)}")
+            return pk, {'success': False, 'error': str(e)}
+    
+    def collect(done):
+        for future in done:
+            pk, result = future.result()
+            stats['checked'] += 1
+            if not result.get('success'):
+                stats['errors'] += 1
+            elif normalize_payment_status(result.get('status')) == 'PENDING':
+                stats['unchanged'] += 1
+            else:
+                pending_results.append((pk, result))
+    
+    def flush():
+        if not pending_results:
+            return
+        batch = pending_results[:]
+        pending_results.clear()
+        if dry_run:
+            stats['settled'] += len(batch)
+        else:
+            settled = settle_results(batch)
+            stats['settled'] += settled
+            stats['unchanged'] += len(batch) - settled
+        if progress:
+            progress(dict(stats))
+    
+    # Keep a bounded number of calls queued so memory stays flat for large runs
+    max_in_flight = workers * 4
+    in_flight = set()
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as executor:
+        for pk, payment_id, gateway_name in get_stale_pending_payments(older_than, gateways, limit):
+            if gateway_name not in limiters:
+                limiters[gateway_name] = RateLimiter(rate_limit)
+            limiters[gateway_name].acquire()
+            in_flight.add(executor.submit(verify, pk, payment_id, gateway_name))
+            
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+                if len(pending_results) >= batch_size:
+                    flush()
+        
+        done, _ = wait(in_flight)
+        collect(done)
+    
+    flush()
+    return stats
+
+
+def reconcile_refunds(older_than: int = 30, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Resolve refunds left PENDING by an unknown gateway outcome
+
+    When the gateway now reports the payment refunded, its pending refunds
+    are completed. The others stay reserved and are logged for a manual
+    check with the gateway; they are never released automatically, as the
+    money may already have gone back to the customer.
+
+    Returns:
+        Dict with 'checked', 'completed' and 'unresolved' counts
+    """
+    from ..models import Refund
+
+    stats = {'checked': 0, 'completed': 0, 'unresolved': 0}
+    refunds = Refund.objects.filter(
+        status='PENDING',
+        created_at__lt=timezone.now() - timedelta(minutes=older_than),
+        payment__gateway__isnull=False,
+    ).select_related('payment__gateway').order_by('created_at')
+
+    for refund in refunds.iterator(chunk_size=500):
+        payment = refund.payment
+        stats['checked'] += 1
+        try:
+            result = payment_manager.verify_payment(payment.payment_id, payment.gateway.name)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        if result.get('success') and normalize_payment_status(result.get('status')) == 'REFUNDED':
+            stats['completed'] += 1
+            if not dry_run:
+                finish_refund(refund, {'payment_id': payment.payment_id, 'amount': refund.amount}, {'success': True})
+        else:
+            stats['unresolved'] += 1
+            logger.warning(
+                f"Refund {refund.refund_id} of {refund.amount} on payment {payment.payment_id} is unconfirmed, "
+                f"check it with {payment.gateway.name}"
+            )
+    return stats
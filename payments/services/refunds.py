@@ -0,0 +1,181 @@
+"""
+Refund processing
+Refunds are reserved (PENDING Refund rows) under a lock on their payments,
+sent to the gateways concurrently and then completed or failed one by one;
+refunds with an unknown outcome stay reserved for reconcile_refunds
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from typing import Dict, Any, Iterator, List, Tuple
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .manager import payment_manager
+
+logger = logging.getLogger(__name__)
+
+# Payments that can be refunded
+REFUNDABLE_STATUSES = ('CAPTURED',)
+
+
+def _result(item: Dict[str, Any], success: bool, message: str, refund=None) -> Dict[str, Any]:
+    return {
+        'payment_id': item['payment_id'],
+        'amount': item['amount'],
+        'success': success,
+        'message': message,
+        'refund_id': refund.refund_id if refund else None,
+    }
+
+
+def reserve_refunds(items: List[Dict[str, Any]], reason: str = None) -> Tuple[List[Tuple[Any, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Validate refund requests and create their PENDING Refund rows
+
+    The payments are locked while the rows are created, and PENDING refunds
+    count against the refundable amount, so two concurrent requests can't
+    refund the same money twice.
+
+    Args:
+        items: Dicts with 'payment_id' (gateway payment ID), 'amount' and
+            optional 'reason'
+        reason: Default reason for items without one
+
+    Returns:
+        (reserved, rejected): reserved is a list of (Refund, item) pairs,
+        rejected a list of per-item results
+    """
+    from ..models import Payment, Refund
+
+    reserved, rejected = [], []
+    payment_ids = {item['payment_id'] for item in items}
+
+    with transaction.atomic():
+        payments = {
+            payment.payment_id: payment
+            for payment in Payment.objects.select_for_update().select_related('gateway')
+            .filter(payment_id__in=payment_ids)
+        }
+        refunded = dict(
+            Refund.objects.filter(payment__in=payments.values(), status__in=['PENDING', 'COMPLETED'])
+            .values('payment').annotate(total=Sum('amount')).values_list('payment', 'total')
+        )
+
+        refunds = []
+        for item in items:
+            payment = payments.get(item['payment_id'])
+            amount = Decimal(str(item['amount']))
+            if not payment:
+                rejected.append(_result(item, False, 'Payment not found'))
+                continue
+            if payment.status not in REFUNDABLE_STATUSES:
+                rejected.append(_result(item, False, f'Payment is {payment.status}, only captured payments can be refunded'))
+                continue
+            if not payment.gateway:
+                rejected.append(_result(item, False, 'Payment has no gateway'))
+                continue
+
+            already_refunded = refunded.get(payment.id) or Decimal('0')
+            if amount <= 0 or already_refunded + amount > payment.amount:
+                rejected.append(_result(
+                    item, False,
+                    f'Refund of {amount} exceeds the refundable amount ({payment.amount - already_refunded})'
+                ))
+                continue
+
+            refunded[payment.id] = already_refunded + amount
+            refund = Refund(
+                payment=payment,
+                order_id=payment.order_id,
+                amount=amount,
+                reason=item.get('reason') or reason or 'Customer requested refund',
+                status='PENDING',
+            )
+            # bulk_create skips save(), so set the ID here
+            refund.refund_id = refund.generate_refund_id()
+            refunds.append((refund, item))
+
+        Refund.objects.bulk_create([refund for refund, _ in refunds])
+        reserved.extend(refunds)
+
+    return reserved, rejected
+
+
+def send_refund(refund) -> Dict[str, Any]:
+    """Send a reserved refund to its gateway (no database access)"""
+    try:
+        return payment_manager.refund_payment(
+            refund.payment.payment_id,
+            refund.amount,
+            refund.payment.gateway.name,
+            refund.reason
+        )
+    except Exception as e:
+        logger.error(f"Error refunding payment {refund.payment.payment_id}: {str(e)}", exc_info=True)
+        # The call may have reached the gateway
+        return {'success': False, 'error': str(e), 'outcome_unknown': True}
+
+
+def finish_refund(refund, item: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Record the gateway result on a reserved refund
+
+    Only an explicit decline releases the amount again. After a timeout,
+    connection error or 5xx ('outcome_unknown') the gateway may have
+    refunded anyway, so the refund stays PENDING and reserved until
+    reconcile_refunds resolves it. A payment is marked REFUNDED once
+    completed refunds cover its full amount.
+    """
+    from ..models import Payment, Refund
+
+    now = timezone.now()
+    if not result.get('success'):
+        message = result.get('error', 'Refund failed')
+        if result.get('outcome_unknown'):
+            Refund.objects.filter(pk=refund.pk).update(notes=message)
+            logger.warning(f"Refund {refund.refund_id} outcome unknown, kept pending: {message}")
+            return _result(item, False, f'{message} - refund kept pending until the gateway confirms it', refund)
+        Refund.objects.filter(pk=refund.pk).update(status='FAILED', notes=message)
+        return _result(item, False, message, refund)
+
+    with transaction.atomic():
+        Refund.objects.filter(pk=refund.pk).update(
+            status='COMPLETED',
+            gateway_refund_id=result.get('refund_id') or '',
+            completed_at=now,
+        )
+        payment = Payment.objects.select_for_update().get(pk=refund.payment_id)
+        completed = payment.refunds.filter(status='COMPLETED').aggregate(total=Sum('amount'))['total'] or 0
+        if completed >= payment.amount and payment.status != 'REFUNDED':
+            payment.status = 'REFUNDED'
+            payment.refunded_at = now
+            payment.save(update_fields=['status', 'refunded_at', 'updated_at'])
+
+    return _result(item, True, 'Refund processed successfully', refund)
+
+
+def bulk_refund(items: List[Dict[str, Any]], reason: str = None, workers: int = 8) -> Iterator[Dict[str, Any]]:
+    """
+    Refund many payments at once
+
+    Rejected items are yielded first, then each reserved refund as soon as
+    its gateway call finishes. Gateway calls run on a bounded thread pool;
+    all database work stays on the calling thread.
+
+    Yields:
+        Per-item dicts with 'payment_id', 'amount', 'success', 'message' and
+        'refund_id'
+    """
+    reserved, rejected = reserve_refunds(items, reason)
+    yield from rejected
+
+    if not reserved:
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='refund') as executor:
+        futures = {executor.submit(send_refund, refund): (refund, item) for refund, item in reserved}
+        for future in as_completed(futures):
+            refund, item = futures[future]
+            yield finish_refund(refund, item, future.result())
@@ -0,0 +1,178 @@
+"""
+Payment gateway registry
+Process-level cache of gateway capabilities and PaymentGateway rows, so
+checkout and gateway queries don't hit the database on every call
+"""
+import copy
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Any, Optional
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Built-in capabilities; PaymentGateway rows override these (display_name,
+# is_active, supported_currencies and min_amount/max_amount/type/description/
+# features in `config`)
+DEFAULT_GATEWAYS = {
+    'TABBY': {
+        'name': 'Tabby',
+        'type': 'BNPL',
+        'description': 'Buy Now, Pay Later - 4 installments',
+        'supported_currencies': ['AED'],
+        'min_amount': Decimal('50.00'),
+        'max_amount': Decimal('10000.00'),
+        'features': ['installments', 'no_interest', 'instant_approval']
+    },
+    'TAMARA': {
+        'name': 'Tamara',
+        'type': 'BNPL',
+        'description': 'Buy Now, Pay Later - Flexible installments',
+        'supported_currencies': ['AED'],
+        'min_amount': Decimal('100.00'),
+        'max_amount': Decimal('15000.00'),
+        'features': ['flexible_installments', 'no_interest', 'instant_approval']
+    },
+    'ZIINA': {
+        'name': 'Ziina',
+        'type': 'INSTANT',
+        'description': 'UAE Central Bank licensed instant payments with Apple Pay',
+        'supported_currencies': ['AED'],
+        'min_amount': Decimal('1.00'),
+        'max_amount': Decimal('50000.00'),
+        'features': ['apple_pay', 'instant_payment', 'refund_support', 'arabic_support']
+    }
+}
+
+# Bumped whenever a PaymentGateway row changes so every process reloads
+VERSION_CACHE_KEY = 'payment_gateway_registry_version'
+
+
+class GatewayRegistry:
+    """
+    Gateway capabilities merged with their PaymentGateway rows
+
+    Loaded once per process and reloaded when the shared version changes
+    (checked at most every PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL seconds).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gateways: Optional[Dict[str, Dict[str, Any]]] = None
+        self._public: Optional[Dict[str, Dict[str, Any]]] = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _load(self):
+        from ..models import PaymentGateway
+
+        gateways = copy.deepcopy(DEFAULT_GATEWAYS)
+        for name, info in gateways.items():
+            info.update({'id': None, 'is_active': True, 'is_test_mode': True})
+
+        for row in PaymentGateway.objects.all():
+            info = gateways.setdefault(row.name, {
+                'name': row.display_name,
+                'type': '',
+                'description': '',
+                'supported_currencies': [],
+                'min_amount': Decimal('0'),
+                'max_amount': Decimal('0'),
+                'features': [],
+            })
+            info.update({
+                'id': row.id,
+                'name': row.display_name or info['name'],
+                'is_active': row.is_active,
+                'is_test_mode': row.is_test_mode,
+            })
+            if row.supported_currencies:
+                info['supported_currencies'] = list(row.supported_currencies)
+            for key in ('type', 'description', 'features'):
+                if key in row.config:
+                    info[key] = row.config[key]
+            for key in ('min_amount', 'max_amount'):
+                if key in row.config:
+                    info[key] = Decimal(str(row.config[key]))
+
+        # JSON-safe copy for GraphQL, built once instead of per query
+        public = {}
+        for name, info in gateways.items():
+            public[name] = {
+                key: str(value) if isinstance(value, Decimal) else value
+                for key, value in info.items()
+                if key != 'id'
+            }
+        return gateways, public
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        interval = getattr(settings, 'PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL', 5)
+        if self._gateways is not None and now - self._checked_at < interval:
+            return
+
+        with self._lock:
+            if self._gateways is not None and now - self._checked_at < interval:
+                return
+            version = cache.get(VERSION_CACHE_KEY)
+            if self._gateways is None or version != self._version:
+                self._gateways, self._public = self._load()
+                self._version = version
+            self._checked_at = now
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        """All gateways (Decimal amounts); treat as read-only"""
+        self._ensure_loaded()
+        return self._gateways
+
+    def public(self) -> Dict[str, Dict[str, Any]]:
+        """All gateways with JSON-safe values (amounts as strings)"""
+        self._ensure_loaded()
+        return self._public
+
+    def get(self, gateway_name: str) -> Optional[Dict[str, Any]]:
+        """Single gateway by name, or None"""
+        return self.all().get(gateway_name.upper())
+
+    def get_gateway_id(self, gateway_name: str) -> int:
+        """
+        PaymentGateway primary key for a gateway
+
+        Creates the row when it's missing (development setups), so callers
+        can set foreign keys without looking the row up.
+        """
+        from ..models import PaymentGateway
+
+        gateway_name = gateway_name.upper()
+        info = self.get(gateway_name)
+        if info and info['id']:
+            return info['id']
+
+        gateway, _ = PaymentGateway.objects.get_or_create(
+            name=gateway_name,
+            defaults={
+                'display_name': gateway_name.title(),
+                'is_active': True,
+                'is_test_mode': True,
+                'api_key': '',
+                'api_secret': '',
+                'supported_currencies': ['AED'],
+            }
+        )
+        return gateway.id
+
+    def invalidate(self):
+        """Drop the cached gateways here and in every other process"""
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, 1, None)
+        with self._lock:
+            self._gateways = None
+            self._public = None
+
+
+gateway_registry = GatewayRegistry()
@@ -0,0 +1,140 @@
+"""
+Payment settlement
+Applies a gateway payment status to the Payment and its Order
+"""
+import logging
+from typing import Dict, Any, Optional
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+# Gateway status (any gateway, any case) -> Payment.status
+STATUS_MAPPING = {
+    'completed': 'CAPTURED',
+    'success': 'CAPTURED',
+    'captured': 'CAPTURED',
+    'closed': 'CAPTURED',
+    'authorized': 'AUTHORIZED',
+    'approved': 'AUTHORIZED',
+    'pending': 'PENDING',
+    'created': 'PENDING',
+    'new': 'PENDING',
+    'requires_payment_instrument': 'PENDING',
+    'requires_user_action': 'PENDING',
+    'failed': 'FAILED',
+    'rejected': 'FAILED',
+    'declined': 'FAILED',
+    'cancelled': 'CANCELLED',
+    'canceled': 'CANCELLED',
+    'expired': 'CANCELLED',
+    'refunded': 'REFUNDED',
+}
+
+# Settled statuses and the only statuses they may still move to; anything
+# else is a late, replayed or out-of-order event
+TERMINAL_TRANSITIONS = {
+    'CAPTURED': {'REFUNDED'},
+    'REFUNDED': set(),
+    'CANCELLED': set(),
+}
+
+
+def normalize_payment_status(status: Optional[str]) -> str:
+    """Convert a gateway status to a Payment.status value"""
+    return STATUS_MAPPING.get((status or '').lower(), 'PENDING')
+
+
+def settle_payment(payment, status: str, gateway_response: Dict[str, Any] = None,
+                   transaction_id: str = None, source: str = '') -> bool:
+    """
+    Apply a gateway status to a payment
+
+    Updates the payment, and when the payment is captured confirms the order
+    and deducts the reserved inventory. Safe to call repeatedly with the same
+    status: the order is only confirmed while it is still PENDING. Captured,
+    refunded and cancelled payments are settled for good (see
+    TERMINAL_TRANSITIONS); other statuses for them are logged and ignored.
+
+    Args:
+        payment: Payment instance
+        status: Gateway status (e.g. 'completed', 'CLOSED') or Payment.status
+        gateway_response: Raw gateway data to store on the payment
+        transaction_id: Gateway transaction ID
+        source: Short label for the order history note (e.g. 'Ziina webhook')
+
+    Returns:
+        True if the payment status changed
+    """
+    from orders.models import OrderStatusHistory
+
+    payment_status = normalize_payment_status(status)
+
+    with transaction.atomic():
+        # Re-read under lock so concurrent settlements of one payment serialize
+        payment = type(payment).objects.select_for_update().get(pk=payment.pk)
+
+        # Never move a settled payment back to pending
+        if payment_status == 'PENDING' and payment.status != 'PENDING':
+            return False
+
+        allowed = TERMINAL_TRANSITIONS.get(payment.status)
+        if allowed is not None and payment_status != payment.status and payment_status not in allowed:
+            logger.warning(
+                f"Ignoring {payment_status} for {payment.status} payment {payment.payment_id} "
+                f"(via {source or 'gateway'})"
+            )
+            return False
+
+        changed = payment.status != payment_status
+        payment.status = payment_status
+        if transaction_id:
+            payment.gateway_transaction_id = transaction_id
+        if gateway_response is not None:
+            payment.gateway_response = gateway_response
+
+        # Set appropriate timestamp based on status
+        now = timezone.now()
+        if changed and payment_status == 'CAPTURED':
+            payment.captured_at = now
+        elif changed and payment_status == 'AUTHORIZED':
+            payment.authorized_at = now
+        elif changed and payment_status == 'FAILED':
+            payment.failed_at = now
+        elif changed and payment_status == 'REFUNDED':
+            payment.refunded_at = now
+
+        payment.save()
+
+        # Update order status if payment successful
+        if payment_status == 'CAPTURED':
+            order = payment.order
+            if order.status == 'PENDING':
+                order.status = 'CONFIRMED'
+                order.confirmed_at = now
+                order.save()
+
+                # Create status history
+                OrderStatusHistory.objects.create(
+                    order=order,
+                    status='CONFIRMED',
+                    notes=f'Payment confirmed via {source or "gateway"} - Payment ID: {payment.payment_id}'
+                )
+
+                # Deduct inventory (reserved → deducted)
+                for item in order.items.select_related('variant', 'product__inventory'):
+                    if item.variant:
+                        variant = item.variant
+                        variant.reserved_quantity = max(0, variant.reserved_quantity - item.quantity)
+                        variant.quantity_in_stock = max(0, variant.quantity_in_stock - item.quantity)
+                        variant.save()
+                    elif hasattr(item.product, 'inventory'):
+                        inventory = item.product.inventory
+                        inventory.reserved_quantity = max(0, inventory.reserved_quantity - item.quantity)
+                        inventory.quantity_in_stock = max(0, inventory.quantity_in_stock - item.quantity)
+                        inventory.save()
+
+                logger.info(f"Order {order.order_number} confirmed and inventory deducted for customer {order.customer_name}")
+
+    return changed
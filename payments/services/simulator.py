@@ -0,0 +1,355 @@
+"""
+Payment gateway simulator
+Local stand-in for the Tabby, Tamara and Ziina APIs used for load and latency
+testing (`manage.py run_gateway_simulator`). Each gateway is served under its
+own prefix (/tabby, /tamara, /ziina) and completed payments are reported back
+to the webhook endpoints like the real gateways do.
+"""
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatorConfig:
+    """Simulator behaviour"""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 20, error_rate: float = 0.0,
+                 decline_rate: float = 0.0, webhook_delay: float = 1.0, webhooks: bool = True,
+                 backend_url: str = 'http://localhost:8000', ziina_webhook_secret: str = ''):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.webhook_delay = webhook_delay
+        self.webhooks = webhooks
+        self.backend_url = backend_url
+        self.ziina_webhook_secret = ziina_webhook_secret
+
+
+class SimulatorStats:
+    """Counters reported when the simulator stops"""
+
+    FIELDS = ('requests', 'errors_injected', 'payments', 'webhooks_sent', 'webhooks_failed')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+        self.lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counts[name] += amount
+
+
+class GatewaySimulator:
+    """In-memory payments, API routing and webhook delivery"""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.stats = SimulatorStats()
+        self.payments: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+        # Webhooks are scheduled on a heap and sent by a small thread pool
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._schedule_ready = threading.Condition()
+        self._webhook_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='simulator-webhook')
+        self._webhook_http = requests.Session()
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_webhooks, name='simulator-dispatch', daemon=True)
+        self._dispatcher.start()
+
+        self.routes = [
+            ('POST', r'^/tabby/api/v2/payments$', self.tabby_create),
+            ('GET', r'^/tabby/api/v2/payments/(?P<payment_id>[^/]+)$', self.tabby_get),
+            ('POST', r'^/tabby/api/v2/payments/(?P<payment_id>[^/]+)/refunds$', self.tabby_refund),
+            ('GET', r'^/tabby/api/v2/payment_methods$', self.payment_methods),
+            ('POST', r'^/tamara/checkout$', self.tamara_create),
+            ('GET', r'^/tamara/orders/(?P<payment_id>[^/]+)$', self.tamara_get),
+            ('POST', r'^/tamara/refunds$', self.tamara_refund),
+            ('GET', r'^/tamara/payment-methods$', self.payment_methods),
+            ('POST', r'^/ziina/api/payment_intent$', self.ziina_create),
+            ('GET', r'^/ziina/api/payment_intent/(?P<payment_id>[^/]+)$', self.ziina_get),
+            ('POST', r'^/ziina/refund$', self.ziina_refund),
+            ('POST', r'^/ziina/api/webhook$', self.ziina_register_webhook),
+            ('GET', r'^/ziina/payment-methods$', self.payment_methods),
+            ('POST', r'^/ziina/apple-pay/sessions$', self.ziina_apple_pay_session),
+        ]
+        self.routes = [(method, re.compile(pattern), handler) for method, pattern, handler in self.routes]
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Route a request, applying the configured latency and error rate"""
+        self.stats.incr('requests')
+
+        delay = max(0.0, random.gauss(self.config.latency_ms, self.config.jitter_ms)) / 1000
+        if delay:
+            time.sleep(delay)
+
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            self.stats.incr('errors_injected')
+            return 503, {'message': 'Simulated gateway error'}
+
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                return handler(body, **match.groupdict())
+        return 404, {'message': f'No simulated endpoint for {method} {path}'}
+
+    def stop(self):
+        self._running = False
+        with self._schedule_ready:
+            self._schedule_ready.notify()
+        self._webhook_pool.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------------
+    # Payments
+    # ------------------------------------------------------------------
+
+    def _create_payment(self, gateway: str, amount: Decimal, reference: str) -> Dict[str, Any]:
+        payment = {
+            'id': str(uuid.uuid4()),
+            'gateway': gateway,
+            'amount': amount,
+            'reference': reference,
+            'status': 'pending',
+            'created_at': time.time(),
+        }
+        with self.lock:
+            self.payments[(gateway, payment['id'])] = payment
+        self.stats.incr('payments')
+
+        # The customer "completes" checkout after webhook_delay seconds
+        self._schedule_completion(payment, self.config.webhook_delay)
+        return payment
+
+    def _get_payment(self, gateway: str, payment_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.payments.get((gateway, payment_id))
+
+    def _schedule_completion(self, payment: Dict[str, Any], delay: float):
+        with self._schedule_ready:
+            heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._sequence), payment))
+            self._schedule_ready.notify()
+
+    def _complete(self, payment: Dict[str, Any]):
+        declined = self.config.decline_rate and random.random() < self.config.decline_rate
+        with self.lock:
+            if payment['status'] == 'pending':
+                payment['status'] = 'failed' if declined else 'completed'
+        if self.config.webhooks:
+            self._send_webhook(payment)
+
+    # ------------------------------------------------------------------
+    # Webhooks
+    # ------------------------------------------------------------------
+
+    def _dispatch_webhooks(self):
+        while self._running:
+            with self._schedule_ready:
+                while self._running and (not self._schedule or self._schedule[0][0] > time.monotonic()):
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule else None
+                    self._schedule_ready.wait(timeout)
+                if not self._running:
+                    return
+                _, _, payment = heapq.heappop(self._schedule)
+            self._webhook_pool.submit(self._complete, payment)
+
+    def _webhook_payload(self, payment: Dict[str, Any]) -> Dict[str, Any]:
+        gateway, status, amount = payment['gateway'], payment['status'], str(payment['amount'])
+        event_id = str(uuid.uuid4())
+        if gateway == 'tabby':
+            tabby_status = {'completed': 'CLOSED', 'failed': 'REJECTED'}.get(status, 'CREATED')
+            return {'event_id': event_id, 'id': payment['id'], 'status': tabby_status.lower(), 'amount': amount}
+        if gateway == 'tamara':
+            tamara_status = {'completed': 'COMPLETED', 'failed': 'DECLINED'}.get(status, 'PENDING')
+            return {
+                'event_id': event_id,
+                'order_id': payment['id'],
+                'order_reference_id': payment['reference'],
+                'status': tamara_status.lower(),
+                'total_amount': {'amount': amount, 'currency': 'AED'},
+            }
+        return {'event_id': event_id, 'payment_id': payment['id'], 'status': status, 'amount': amount}
+
+    def _send_webhook(self, payment: Dict[str, Any]):
+        gateway = payment['gateway']
+        raw_body = json.dumps(self._webhook_payload(payment)).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if gateway == 'ziina':
+            headers['X-Hmac-Signature'] = hmac.new(
+                self.config.ziina_webhook_secret.encode('utf-8'),
+                raw_body,
+                hashlib.sha256
+            ).hexdigest()
+
+        url = f"{self.config.backend_url.rstrip('/')}/webhooks/{gateway}/"
+        try:
+            response = self._webhook_http.post(url, data=raw_body, headers=headers, timeout=10)
+            if response.status_code == 200:
+                self.stats.incr('webhooks_sent')
+                return
+            logger.warning(f"Webhook to {url} returned HTTP {response.status_code}")
+        except requests.RequestException as e:
+            logger.warning(f"Webhook to {url} failed: {str(e)}")
+        self.stats.incr('webhooks_failed')
+
+    # ------------------------------------------------------------------
+    # Tabby
+    # ------------------------------------------------------------------
+
+    def tabby_create(self, body):
+        payment_data = body.get('payment', {})
+        payment = self._create_payment(
+            'tabby',
+            Decimal(str(payment_data.get('amount', '0'))),
+            payment_data.get('order', {}).get('reference_id', '')
+        )
+        return 201, {
+            'id': payment['id'],
+            'status': 'created',
+            'configuration': {
+                'available_products': [{'web_url': f"https://simulator.local/tabby/checkout/{payment['id']}"}]
+            },
+        }
+
+    def tabby_get(self, body, payment_id):
+        payment = self._get_payment('tabby', payment_id)
+        if not payment:
+            return 404, {'message': 'Payment not found'}
+        status = {'completed': 'CLOSED', 'failed': 'REJECTED'}.get(payment['status'], 'CREATED')
+        return 200, {'payment': {'id': payment['id'], 'status': status, 'amount': str(payment['amount'])}}
+
+    def tabby_refund(self, body, payment_id):
+        if not self._get_payment('tabby', payment_id):
+            return 404, {'message': 'Payment not found'}
+        return 201, {'id': str(uuid.uuid4()), 'amount': body.get('amount')}
+
+    # ------------------------------------------------------------------
+    # Tamara
+    # ------------------------------------------------------------------
+
+    def tamara_create(self, body):
+        payment = self._create_payment(
+            'tamara',
+            Decimal(str(body.get('total_amount', {}).get('amount', '0'))),
+            body.get('order_reference_id', '')
+        )
+        return 200, {
+            'order_id': payment['id'],
+            'checkout_id': str(uuid.uuid4()),
+            'checkout_url': f"https://simulator.local/tamara/checkout/{payment['id']}",
+            'status': 'new',
+        }
+
+    def tamara_get(self, body, payment_id):
+        payment = self._get_payment('tamara', payment_id)
+        if not payment:
+            return 404, {'message': 'Order not found'}
+        status = {'completed': 'COMPLETED', 'failed': 'DECLINED'}.get(payment['status'], 'PENDING')
+        return 200, {
+            'order_id': payment['id'],
+            'order_reference_id': payment['reference'],
+            'status': status,
+            'total_amount': {'amount': str(payment['amount']), 'currency': 'AED'},
+        }
+
+    def tamara_refund(self, body):
+        return 200, {'refund_id': str(uuid.uuid4())}
+
+    # ------------------------------------------------------------------
+    # Ziina
+    # ------------------------------------------------------------------
+
+    def ziina_create(self, body):
+        payment = self._create_payment(
+            'ziina',
+            Decimal(int(body.get('amount', 0))) / 100,
+            body.get('message', '')
+        )
+        return 201, {
+            'id': payment['id'],
+            'status': 'requires_payment_instrument',
+            'redirect_url': f"https://simulator.local/ziina/pay/{payment['id']}",
+            'expiry': str(int((payment['created_at'] + 3600) * 1000)),
+        }
+
+    def ziina_get(self, body, payment_id):
+        payment = self._get_payment('ziina', payment_id)
+        if not payment:
+            return 404, {'message': 'Payment intent not found'}
+        status = payment['status'] if payment['status'] != 'pending' else 'requires_payment_instrument'
+        return 200, {
+            'id': payment['id'],
+            'status': status,
+            'amount': int(payment['amount'] * 100),
+            'transaction_id': payment['id'] if payment['status'] == 'completed' else None,
+        }
+
+    def ziina_refund(self, body):
+        return 201, {'refund_id': body.get('refund_id') or str(uuid.uuid4())}
+
+    def ziina_register_webhook(self, body):
+        return 200, {'success': True}
+
+    def ziina_apple_pay_session(self, body):
+        session_id = str(uuid.uuid4())
+        return 201, {'session_id': session_id, 'payment_url': f'https://simulator.local/ziina/apple-pay/{session_id}'}
+
+    # ------------------------------------------------------------------
+    # Shared
+    # ------------------------------------------------------------------
+
+    def payment_methods(self, body):
+        return 200, {'methods': [{'type': 'card'}, {'type': 'apple_pay'}]}
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """Keep-alive JSON handler delegating to the server's GatewaySimulator"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            status, data = 400, {'message': 'Invalid JSON'}
+        else:
+            status, data = self.server.simulator.handle(self.command, self.path.split('?')[0], body)
+
+        response = json.dumps(data, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def create_server(host: str, port: int, config: SimulatorConfig) -> ThreadingHTTPServer:
+    """Create the simulator HTTP server (call serve_forever() to run it)"""
+    server = ThreadingHTTPServer((host, port), SimulatorRequestHandler)
+    server.daemon_threads = True
+    server.simulator = GatewaySimulator(config)
+    return server
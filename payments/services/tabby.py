@@ -9,6 +9,7 @@ from typing import Dict, Any
 from django.conf import settings
 from django.utils import timezone
 from .base import BasePaymentService
+from .health import GatewayUnavailable
 
 
 class TabbyService(BasePaymentService):
@@ -84,11 +85,11 @@ class TabbyService(BasePaymentService):
             }
             
             # Make API request to Tabby
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/api/v2/payments",
                 headers=self.headers,
                 json=payment_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 201:
@@ -137,10 +138,10 @@ class TabbyService(BasePaymentService):
         Verify payment status with Tabby
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/api/v2/payments/{payment_id}",
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -223,11 +224,11 @@ class TabbyService(BasePaymentService):
                 "reason": reason or "Customer requested refund"
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/api/v2/payments/{payment_id}/refunds",
                 headers=self.headers,
                 json=refund_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 201:
@@ -248,23 +249,31 @@ class TabbyService(BasePaymentService):
                 error_data = response.json() if response.content else {}
                 error_message = error_data.get('message', f'HTTP {response.status_code}')
                 
-                return self.create_error_response(f"Tabby refund failed: {error_message}")
+                # A 4xx is a decline; a 5xx may come after the refund was made
+                return self.create_refund_error_response(
+                    f"Tabby refund failed: {error_message}",
+                    outcome_unknown=response.status_code >= 500
+                )
                 
+        except GatewayUnavailable as e:
+            # Circuit open: the request was never sent
+            return self.create_refund_error_response(f"Tabby API error: {str(e)}", outcome_unknown=False)
+        
         except requests.RequestException as e:
-            return self.create_error_response(f"Tabby API error: {str(e)}")
+            return self.create_refund_error_response(f"Tabby API error: {str(e)}")
         
         except Exception as e:
-            return self.create_error_response(f"Unexpected error: {str(e)}")
+            return self.create_refund_error_response(f"Unexpected error: {str(e)}")
     
     def get_payment_methods(self) -> Dict[str, Any]:
         """
         Get available Tabby payment methods
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/api/v2/payment_methods",
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
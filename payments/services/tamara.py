@@ -9,6 +9,7 @@ from typing import Dict, Any
 from django.conf import settings
 from django.utils import timezone
 from .base import BasePaymentService
+from .health import GatewayUnavailable
 
 
 class TamaraService(BasePaymentService):
@@ -93,11 +94,11 @@ class TamaraService(BasePaymentService):
             }
             
             # Make API request to Tamara
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/checkout",
                 headers=self.headers,
                 json=payment_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -146,10 +147,10 @@ class TamaraService(BasePaymentService):
         Verify payment status with Tamara
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/orders/{payment_id}",
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -221,6 +222,10 @@ class TamaraService(BasePaymentService):
         except Exception as e:
             return self.create_error_response(f"Webhook processing error: {str(e)}")
     
+    def get_webhook_reference(self, payload: Dict[str, Any]) -> str:
+        """Tamara webhooks refer to the payment by order_id"""
+        return str(payload.get('order_id') or '')
+    
     def refund_payment(self, payment_id: str, amount: Decimal, reason: str = None) -> Dict[str, Any]:
         """
         Process refund through Tamara
@@ -236,11 +241,11 @@ class TamaraService(BasePaymentService):
                 "reason": reason or "Customer requested refund"
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/refunds",
                 headers=self.headers,
                 json=refund_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -261,23 +266,31 @@ class TamaraService(BasePaymentService):
                 error_data = response.json() if response.content else {}
                 error_message = error_data.get('message', f'HTTP {response.status_code}')
                 
-                return self.create_error_response(f"Tamara refund failed: {error_message}")
+                # A 4xx is a decline; a 5xx may come after the refund was made
+                return self.create_refund_error_response(
+                    f"Tamara refund failed: {error_message}",
+                    outcome_unknown=response.status_code >= 500
+                )
                 
+        except GatewayUnavailable as e:
+            # Circuit open: the request was never sent
+            return self.create_refund_error_response(f"Tamara API error: {str(e)}", outcome_unknown=False)
+        
         except requests.RequestException as e:
-            return self.create_error_response(f"Tamara API error: {str(e)}")
+            return self.create_refund_error_response(f"Tamara API error: {str(e)}")
         
         except Exception as e:
-            return self.create_error_response(f"Unexpected error: {str(e)}")
+            return self.create_refund_error_response(f"Unexpected error: {str(e)}")
     
     def get_payment_methods(self) -> Dict[str, Any]:
         """
         Get available Tamara payment methods
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/payment-methods",
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -0,0 +1,284 @@
+"""
+Webhook ingestion queue
+Webhooks are verified and stored on arrival, then settled by a worker pool
+(`manage.py process_webhooks`) in arrival order per payment
+"""
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Any, Iterable, List, Set
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .manager import payment_manager
+from .registry import gateway_registry
+from .settlement import settle_payment
+
+logger = logging.getLogger(__name__)
+
+# A failed event is retried this many times before it is left FAILED
+MAX_WEBHOOK_ATTEMPTS = 5
+
+
+def ingest_webhook(gateway_name: str, raw_body: bytes, headers: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Verify and store a webhook without processing it
+
+    Args:
+        gateway_name: Payment gateway name (TABBY, TAMARA, ZIINA)
+        raw_body: Request body exactly as received
+        headers: Request headers
+
+    Returns:
+        Dict with 'success', 'webhook_id' and 'duplicate' (or 'error')
+
+    Raises:
+        json.JSONDecodeError: If the body is not valid JSON
+    """
+    from ..models import PaymentWebhook
+
+    gateway_name = gateway_name.upper()
+    service = payment_manager.get_gateway(gateway_name)
+
+    if not service.verify_webhook_signature(raw_body, headers):
+        return {'success': False, 'error': 'Invalid webhook signature'}
+
+    payload = json.loads(raw_body)
+    if not isinstance(payload, dict):
+        return {'success': False, 'error': 'Webhook payload must be a JSON object'}
+
+    webhook, created = PaymentWebhook.objects.get_or_create(
+        gateway_id=gateway_registry.get_gateway_id(gateway_name),
+        event_id=service.get_webhook_event_id(payload, raw_body),
+        defaults={
+            'payment_reference': service.get_webhook_reference(payload),
+            'webhook_type': str(payload.get('event') or payload.get('type') or payload.get('status') or '')[:100],
+            'payload': payload,
+        }
+    )
+
+    return {'success': True, 'webhook_id': webhook.id, 'duplicate': not created}
+
+
+def release_stale_claims(stale_after: int = 300) -> int:
+    """Return webhooks claimed by a worker that died back to the queue"""
+    from ..models import PaymentWebhook
+
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return PaymentWebhook.objects.filter(
+        status='PROCESSING',
+        claimed_at__lt=cutoff
+    ).update(status='RECEIVED', claimed_at=None)
+
+
+def _lock_references(references: Iterable[str]) -> Set[str]:
+    """
+    Take a transaction-level advisory lock per payment reference
+
+    Returns:
+        The references locked; the others are being claimed by another worker
+    """
+    references = list(references)
+    if not references or connection.vendor != 'postgresql':
+        # SQLite allows one writer at a time, so claims can't interleave
+        return set(references)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT ref FROM unnest(%s::text[]) AS ref "
+            "WHERE pg_try_advisory_xact_lock(hashtext('payment_webhook:' || ref))",
+            [references]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def claim_webhooks(batch_size: int = 100) -> List[List[int]]:
+    """
+    Claim a batch of received webhooks for this worker
+
+    Events are claimed per payment: the worker locks the payment reference
+    (advisory lock, so two workers can't claim the same payment at once),
+    skips payments with an event already in flight and then claims all of
+    that payment's received events together, so events for one payment are
+    never processed concurrently or out of order.
+
+    Returns:
+        Claimed webhook IDs grouped per payment, oldest first in each group
+    """
+    from ..models import PaymentWebhook
+
+    in_flight = PaymentWebhook.objects.filter(status='PROCESSING').exclude(
+        payment_reference=''
+    ).values('payment_reference')
+
+    with transaction.atomic():
+        candidates = list(
+            PaymentWebhook.objects.select_for_update(skip_locked=True)
+            .filter(status='RECEIVED')
+            .exclude(payment_reference__in=in_flight)
+            .order_by('id')
+            .values_list('id', 'payment_reference')[:batch_size]
+        )
+        if not candidates:
+            return []
+
+        # With the references locked, re-read each payment's queue: another
+        # worker may have claimed some of its events since the query above,
+        # or held rows of it locked and so hidden them from it
+        references = _lock_references({reference for _, reference in candidates if reference})
+        references -= set(
+            PaymentWebhook.objects.filter(status='PROCESSING', payment_reference__in=references)
+            .values_list('payment_reference', flat=True)
+        )
+        claimed = sorted(
+            [(webhook_id, reference) for webhook_id, reference in candidates if not reference]
+            + list(
+                PaymentWebhook.objects.filter(status='RECEIVED', payment_reference__in=references)
+                .values_list('id', 'payment_reference')
+            )
+        )
+        if not claimed:
+            return []
+
+        PaymentWebhook.objects.filter(id__in=[webhook_id for webhook_id, _ in claimed], status='RECEIVED').update(
+            status='PROCESSING',
+            claimed_at=timezone.now()
+        )
+
+    groups = OrderedDict()
+    for webhook_id, reference in claimed:
+        # Events without a reference can't be ordered against anything
+        key = reference or f'__webhook_{webhook_id}'
+        groups.setdefault(key, []).append(webhook_id)
+    return list(groups.values())
+
+
+def _webhook_result(webhook) -> Dict[str, Any]:
+    """
+    Payment ID and status a webhook reports
+
+    Unsigned webhooks (see BasePaymentService.signs_webhooks) could have
+    been sent by anyone, so their status is confirmed with the gateway.
+
+    Raises:
+        RuntimeError: If the gateway can't confirm the payment (retried)
+    """
+    gateway_name = webhook.gateway.name
+    result = payment_manager.handle_webhook(webhook.payload, gateway_name)
+    if not result['success'] or not result.get('payment_id') or payment_manager.get_gateway(gateway_name).signs_webhooks:
+        return dict(result, gateway_response=webhook.payload)
+
+    verified = payment_manager.verify_payment(result['payment_id'], gateway_name)
+    if not verified['success']:
+        raise RuntimeError(f"Could not verify payment {result['payment_id']}: {verified.get('error')}")
+    return dict(
+        result,
+        status=verified.get('status'),
+        gateway_response=verified.get('gateway_response') or webhook.payload
+    )
+
+
+def process_webhook(webhook_id: int) -> bool:
+    """
+    Settle a single claimed webhook
+
+    The gateway is consulted first (for unsigned webhooks), then the payment
+    update and the PROCESSED flag are committed together, so an event is
+    applied exactly once even if the worker dies mid-way.
+
+    Returns:
+        True if the webhook was processed, False if it failed
+    """
+    from ..models import Payment, PaymentWebhook
+
+    try:
+        webhook = PaymentWebhook.objects.select_related('gateway').get(id=webhook_id)
+        if webhook.status != 'PROCESSING':
+            # Already handled by another worker
+            return True
+        result = _webhook_result(webhook)
+
+        with transaction.atomic():
+            webhook = PaymentWebhook.objects.select_for_update().select_related('gateway').get(id=webhook_id)
+            if webhook.status != 'PROCESSING':
+                return True
+
+            gateway_name = webhook.gateway.name
+            if not result['success']:
+                webhook.status = 'FAILED'
+                webhook.error_message = result.get('error', 'Processing failed')
+                webhook.processed_at = timezone.now()
+                webhook.save()
+                logger.error(f"{gateway_name} webhook {webhook.id} rejected: {webhook.error_message}")
+                return True
+
+            payment = Payment.objects.filter(payment_id=result.get('payment_id')).first()
+            if payment:
+                settle_payment(
+                    payment,
+                    result.get('status'),
+                    gateway_response=result['gateway_response'],
+                    source=f'{webhook.gateway.display_name} webhook'
+                )
+            else:
+                logger.warning(f"Payment {result.get('payment_id')} not found for {gateway_name} webhook {webhook.id}")
+
+            webhook.payment = payment
+            webhook.status = 'PROCESSED'
+            webhook.processed_at = timezone.now()
+            webhook.attempts += 1
+            webhook.save()
+            return True
+
+    except Exception as e:
+        logger.error(f"Error processing webhook {webhook_id}: {str(e)}", exc_info=True)
+        webhook = PaymentWebhook.objects.filter(id=webhook_id).first()
+        if webhook:
+            webhook.attempts += 1
+            webhook.error_message = str(e)
+            webhook.claimed_at = None
+            webhook.status = 'FAILED' if webhook.attempts >= MAX_WEBHOOK_ATTEMPTS else 'RECEIVED'
+            webhook.save(update_fields=['attempts', 'error_message', 'claimed_at', 'status'])
+        return False
+
+
+def process_webhook_group(webhook_ids: List[int]) -> int:
+    """
+    Process one payment's webhooks in order
+
+    Stops at the first failure and returns the remaining events to the queue
+    so a later event is never applied before an earlier one.
+
+    Returns:
+        Number of webhooks processed
+    """
+    from ..models import PaymentWebhook
+
+    processed = 0
+    try:
+        for index, webhook_id in enumerate(webhook_ids):
+            if not process_webhook(webhook_id):
+                PaymentWebhook.objects.filter(
+                    id__in=webhook_ids[index + 1:],
+                    status='PROCESSING'
+                ).update(status='RECEIVED', claimed_at=None)
+                break
+            processed += 1
+    finally:
+        close_old_connections()
+    return processed
+
+
+def process_pending_webhooks(executor: ThreadPoolExecutor, batch_size: int = 100) -> int:
+    """
+    Claim one batch and process it on the given worker pool
+
+    Returns:
+        Number of webhooks processed
+    """
+    groups = claim_webhooks(batch_size)
+    if not groups:
+        return 0
+    return sum(executor.map(process_webhook_group, groups))
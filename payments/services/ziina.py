@@ -11,6 +11,7 @@ from typing import Dict, Any
 from django.conf import settings
 from django.utils import timezone
 from .base import BasePaymentService
+from .health import GatewayUnavailable
 
 
 class ZiinaService(BasePaymentService):
@@ -59,11 +60,11 @@ class ZiinaService(BasePaymentService):
             }
             
             # Make API request to Ziina (using official API endpoint)
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/api/payment_intent",
                 headers=self.headers,
                 json=payment_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 201:
@@ -112,10 +113,10 @@ class ZiinaService(BasePaymentService):
         Verify payment status with Ziina
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/api/payment_intent/{payment_id}",
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -164,11 +165,8 @@ class ZiinaService(BasePaymentService):
         Handle Ziina webhook notifications
         """
         try:
-            # Verify webhook signature
-            signature = payload.get('signature')
-            if not self._verify_webhook_signature(payload, signature):
-                return self.create_error_response("Invalid webhook signature")
-            
+            # Signature is verified against the raw body when the webhook is
+            # received (see verify_webhook_signature)
             payment_id = payload.get('payment_id')
             status = payload.get('status')
             amount = self.parse_amount(payload.get('amount', '0'))
@@ -202,11 +200,11 @@ class ZiinaService(BasePaymentService):
                 "refund_id": f"REF_{payment_id}_{int(timezone.now().timestamp())}"
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/refund",
                 headers=self.headers,
                 json=refund_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 201:
@@ -227,13 +225,52 @@ class ZiinaService(BasePaymentService):
                 error_data = response.json() if response.content else {}
                 error_message = error_data.get('message', f'HTTP {response.status_code}')
                 
-                return self.create_error_response(f"Ziina refund failed: {error_message}")
+                # A 4xx is a decline; a 5xx may come after the refund was made
+                return self.create_refund_error_response(
+                    f"Ziina refund failed: {error_message}",
+                    outcome_unknown=response.status_code >= 500
+                )
                 
+        except GatewayUnavailable as e:
+            # Circuit open: the request was never sent
+            return self.create_refund_error_response(f"Ziina API error: {str(e)}", outcome_unknown=False)
+        
         except requests.RequestException as e:
-            return self.create_error_response(f"Ziina API error: {str(e)}")
+            return self.create_refund_error_response(f"Ziina API error: {str(e)}")
         
         except Exception as e:
-            return self.create_error_response(f"Unexpected error: {str(e)}")
+            return self.create_refund_error_response(f"Unexpected error: {str(e)}")
+    
+    @property
+    def signs_webhooks(self) -> bool:
+        """Webhooks are signed once ZIINA_WEBHOOK_SECRET is set"""
+        return bool(self.webhook_secret)
+    
+    def verify_webhook_signature(self, raw_body: bytes, headers: Dict[str, str]) -> bool:
+        """
+        Verify Ziina webhook signature
+        Ziina signs the raw request body (HMAC-SHA256) in the X-Hmac-Signature
+        header; older payloads carry the signature inside the JSON body.
+        Without a secret nothing can be checked, and the webhook is only
+        used as a trigger to verify the payment
+        """
+        if not self.signs_webhooks:
+            return True
+        
+        signature = headers.get('X-Hmac-Signature')
+        if signature:
+            expected_signature = hmac.new(
+                self.webhook_secret.encode('utf-8'),
+                raw_body,
+                hashlib.sha256
+            ).hexdigest()
+            return hmac.compare_digest(signature, expected_signature)
+        
+        try:
+            payload = json.loads(raw_body)
+        except ValueError:
+            return False
+        return self._verify_webhook_signature(payload, payload.get('signature'))
     
     def _verify_webhook_signature(self, payload: Dict[str, Any], signature: str) -> bool:
         """
@@ -271,11 +308,11 @@ class ZiinaService(BasePaymentService):
                 "secret": secret or self.webhook_secret
             }
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/api/webhook",
                 headers=self.headers,
                 json=webhook_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -310,10 +347,10 @@ class ZiinaService(BasePaymentService):
         try:
             # Note: Payment methods endpoint not documented in official API
             # May need to verify with Ziina support
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/payment-methods",
                 headers=self.headers,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -369,11 +406,11 @@ class ZiinaService(BasePaymentService):
             
             # Note: Apple Pay endpoint not documented in official API
             # May need to verify with Ziina support
-            response = requests.post(
+            response = self.http.post(
                 f"{self.base_url}/apple-pay/sessions",
                 headers=self.headers,
                 json=apple_pay_request,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 201:
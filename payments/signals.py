@@ -0,0 +1,15 @@
+"""
+Payment signals
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import PaymentGateway
+from .services.registry import gateway_registry
+
+
+@receiver([post_save, post_delete], sender=PaymentGateway)
+def invalidate_gateway_registry(sender, **kwargs):
+    """Reload gateway configuration in every process once the change is committed"""
+    transaction.on_commit(gateway_registry.invalidate)
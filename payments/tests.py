@@ -1,3 +1,815 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from ecomarce_choco.views import AsyncGraphQLView
+
+from orders.models import Order
+from .models import Payment, PaymentArchive, PaymentGateway, PaymentWebhook, Refund
+from .services.archive import archive_gateway_responses, archive_webhooks, count_archivable
+from .services.health import (
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, GatewaySession, GatewayUnavailable, allow_request,
+    get_circuit_state, get_gateway_health, record_call
+)
+from .services.manager import payment_manager
+from .services.reconciliation import RateLimiter, reconcile_payments, reconcile_refunds, settle_results
+from .services.refunds import bulk_refund, reserve_refunds
+from .services.registry import VERSION_CACHE_KEY, GatewayRegistry
+from .services.settlement import settle_payment
+from .services.webhooks import claim_webhooks, process_webhook_group, release_stale_claims
+
+# URLconf for AsyncGraphQLViewTests (the project picks the view at import time)
+urlpatterns = [path('graphql/', csrf_exempt(AsyncGraphQLView.as_view()))]
+
+
+def create_gateway(name='ZIINA'):
+    gateway, _ = PaymentGateway.objects.get_or_create(
+        name=name, defaults={'display_name': name.title(), 'api_key': 'key', 'api_secret': 'secret'}
+    )
+    return gateway
+
+
+def create_payment(gateway, status='PENDING'):
+    order = Order.objects.create(
+        customer_name='Customer', customer_email='customer@example.com', customer_phone='0500000000',
+        subtotal=Decimal('100.00'), tax_amount=Decimal('5.00'), total_amount=Decimal('105.00')
+    )
+    return Payment.objects.create(
+        order=order, gateway=gateway, payment_method='CREDIT_CARD', amount=Decimal('105.00'), status=status
+    )
+
+
+@override_settings(PAYMENT_CIRCUIT_FAILURE_THRESHOLD=3, PAYMENT_CIRCUIT_RESET_TIMEOUT=30)
+class CircuitBreakerTests(TestCase):
+    """Circuit state and health histograms (services/health.py)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def fail(self, times=1, duration=0.05):
+        for _ in range(times):
+            record_call('TEST', duration, success=False)
+
+    def test_consecutive_failures_open_the_circuit(self):
+        self.fail(2)
+        record_call('TEST', 0.05, success=True)
+        self.fail(2)
+        self.assertEqual(get_circuit_state('TEST'), CIRCUIT_CLOSED)
+
+        with self.assertLogs('payments.services.health', 'WARNING'):
+            self.fail()
+
+        self.assertEqual(get_circuit_state('TEST'), CIRCUIT_OPEN)
+        self.assertFalse(allow_request('TEST'))
+        self.assertEqual(get_circuit_state('OTHER'), CIRCUIT_CLOSED)
+
+    def test_slow_calls_count_as_failures(self):
+        with override_settings(PAYMENT_GATEWAY_SLOW_CALL_SECONDS=1), self.assertLogs('payments.services.health'):
+            for _ in range(3):
+                record_call('TEST', 2.0, success=True)
+
+        self.assertEqual(get_circuit_state('TEST'), CIRCUIT_OPEN)
+
+    def after_reset_timeout(self):
+        return mock.patch('payments.services.health.time.time', return_value=time.time() + 31)
+
+    def test_half_open_circuit_lets_one_probe_through(self):
+        with self.assertLogs('payments.services.health'):
+            self.fail(3)
+
+        with self.after_reset_timeout():
+            self.assertEqual(get_circuit_state('TEST'), CIRCUIT_HALF_OPEN)
+            self.assertTrue(allow_request('TEST'))
+            self.assertFalse(allow_request('TEST'))
+
+            with self.assertLogs('payments.services.health', 'INFO'):
+                record_call('TEST', 0.05, success=True)
+
+        self.assertEqual(get_circuit_state('TEST'), CIRCUIT_CLOSED)
+        self.assertTrue(allow_request('TEST'))
+
+    def test_failed_probe_reopens_the_circuit(self):
+        with self.assertLogs('payments.services.health'):
+            self.fail(3)
+            with self.after_reset_timeout():
+                self.assertTrue(allow_request('TEST'))
+                self.fail()
+
+        self.assertEqual(get_circuit_state('TEST'), CIRCUIT_OPEN)
+
+    def test_session_fails_fast_while_open_and_counts_server_errors(self):
+        session = GatewaySession('TEST')
+        response = requests.Response()
+        response.status_code = 503
+
+        with mock.patch.object(requests.Session, 'request', return_value=response) as send, \
+                self.assertLogs('payments.services.health'):
+            for _ in range(3):
+                session.get('https://gateway.test/ping')
+            with self.assertRaises(GatewayUnavailable):
+                session.get('https://gateway.test/ping')
+
+        self.assertEqual(send.call_count, 3)
+
+    def test_health_report(self):
+        for duration in (0.05, 0.05, 0.2, 0.4):
+            record_call('TEST', duration, success=True)
+        self.fail(duration=3)
+
+        health = get_gateway_health('TEST')
+
+        self.assertEqual((health['calls'], health['errors'], health['error_rate']), (5, 1, 0.2))
+        self.assertEqual((health['p50'], health['p95']), (0.25, 5))
+        self.assertEqual(health['histogram']['le_0.1'], 2)
+        self.assertTrue(health['degraded'])
+        self.assertEqual(health['circuit_state'], CIRCUIT_CLOSED)
+
+
+class WebhookQueueTests(TestCase):
+    """Claiming and processing of queued webhooks (services/webhooks.py)"""
+
+    def setUp(self):
+        self.gateway = create_gateway()
+
+    def webhook(self, reference, status='RECEIVED', **kwargs):
+        return PaymentWebhook.objects.create(
+            gateway=self.gateway,
+            payment_reference=reference,
+            webhook_type='payment.updated',
+            payload={'id': reference},
+            status=status,
+            **kwargs
+        ).id
+
+    def test_claims_are_grouped_per_payment_in_arrival_order(self):
+        a1 = self.webhook('pay_a')
+        b1 = self.webhook('pay_b')
+        a2 = self.webhook('pay_a')
+        loose = self.webhook('')
+
+        groups = claim_webhooks()
+
+        self.assertEqual(groups, [[a1, a2], [b1], [loose]])
+        self.assertEqual(PaymentWebhook.objects.filter(status='PROCESSING').count(), 4)
+
+    def test_payment_with_an_event_in_flight_is_skipped(self):
+        self.webhook('pay_a', status='PROCESSING', claimed_at=timezone.now())
+        waiting = self.webhook('pay_a')
+        other = self.webhook('pay_b')
+
+        self.assertEqual(claim_webhooks(), [[other]])
+        self.assertEqual(PaymentWebhook.objects.get(id=waiting).status, 'RECEIVED')
+
+    def test_a_payment_is_claimed_as_a_whole_group(self):
+        first = self.webhook('pay_a')
+        second = self.webhook('pay_a')
+
+        # The batch only reaches the first event, the second comes along
+        self.assertEqual(claim_webhooks(batch_size=1), [[first, second]])
+        self.assertEqual(claim_webhooks(), [])
+
+    def test_failure_returns_the_rest_of_the_group_to_the_queue(self):
+        first = self.webhook('pay_a')
+        second = self.webhook('pay_a')
+        groups = claim_webhooks()
+
+        with mock.patch('payments.services.webhooks.payment_manager.handle_webhook', side_effect=RuntimeError('down')), \
+                self.assertLogs('payments.services.webhooks', 'ERROR'):
+            self.assertEqual(process_webhook_group(groups[0]), 0)
+
+        first_webhook = PaymentWebhook.objects.get(id=first)
+        self.assertEqual((first_webhook.status, first_webhook.attempts), ('RECEIVED', 1))
+        self.assertEqual(PaymentWebhook.objects.get(id=second).status, 'RECEIVED')
+
+    def test_rejected_event_is_marked_failed_and_the_group_continues(self):
+        first = self.webhook('pay_a')
+        second = self.webhook('pay_a')
+        groups = claim_webhooks()
+
+        with mock.patch(
+            'payments.services.webhooks.payment_manager.handle_webhook',
+            return_value={'success': False, 'error': 'Unknown event'}
+        ), self.assertLogs('payments.services.webhooks', 'ERROR'):
+            self.assertEqual(process_webhook_group(groups[0]), 2)
+
+        self.assertEqual(
+            list(PaymentWebhook.objects.filter(id__in=[first, second]).values_list('status', flat=True)),
+            ['FAILED', 'FAILED']
+        )
+
+    def test_stale_claims_are_released(self):
+        stale = self.webhook('pay_a', status='PROCESSING', claimed_at=timezone.now() - timedelta(minutes=10))
+        fresh = self.webhook('pay_b', status='PROCESSING', claimed_at=timezone.now())
+
+        self.assertEqual(release_stale_claims(stale_after=300), 1)
+        self.assertEqual(PaymentWebhook.objects.get(id=stale).status, 'RECEIVED')
+        self.assertEqual(PaymentWebhook.objects.get(id=fresh).status, 'PROCESSING')
+
+
+class WebhookSettlementTests(TestCase):
+    """Webhooks only settle payments the gateway vouches for"""
+
+    def setUp(self):
+        self.payment = create_payment(create_gateway('TABBY'))
+
+    def post_webhook(self, gateway, payload, **headers):
+        return self.client.post(
+            f'/webhooks/{gateway}/', json.dumps(payload), content_type='application/json', headers=headers
+        )
+
+    def process(self):
+        return sum(process_webhook_group(group) for group in claim_webhooks())
+
+    def verified(self, status, gateway='TABBY'):
+        return mock.patch.object(
+            payment_manager.get_gateway(gateway), 'verify_payment',
+            return_value={'success': True, 'status': status, 'gateway_response': {'status': status}}
+        )
+
+    def test_unsigned_webhook_status_is_not_trusted(self):
+        response = self.post_webhook('tabby', {'id': self.payment.payment_id, 'status': 'CLOSED'})
+        self.assertEqual(response.status_code, 200)
+
+        with self.verified('pending') as verify_payment:
+            self.assertEqual(self.process(), 1)
+
+        verify_payment.assert_called_once_with(self.payment.payment_id)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'PENDING')
+        self.assertEqual(self.payment.order.status, 'PENDING')
+
+    def test_unsigned_webhook_settles_the_verified_status(self):
+        self.post_webhook('tabby', {'id': self.payment.payment_id, 'status': 'CLOSED'})
+
+        with self.verified('completed'):
+            self.process()
+
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.gateway_response), ('CAPTURED', {'status': 'completed'}))
+        self.assertEqual(self.payment.order.status, 'CONFIRMED')
+
+    def test_webhook_is_retried_while_the_gateway_cannot_confirm(self):
+        self.post_webhook('tabby', {'id': self.payment.payment_id, 'status': 'CLOSED'})
+
+        with mock.patch.object(
+            payment_manager.get_gateway('TABBY'), 'verify_payment', return_value={'success': False, 'error': 'down'}
+        ), self.assertLogs('payments.services.webhooks', 'ERROR'):
+            self.assertEqual(self.process(), 0)
+
+        self.assertEqual(PaymentWebhook.objects.get().status, 'RECEIVED')
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'PENDING')
+
+    def test_signed_webhook_is_settled_from_its_payload(self):
+        payment = create_payment(create_gateway('ZIINA'))
+        body = json.dumps({'payment_id': payment.payment_id, 'status': 'completed', 'amount': '10500'})
+        signature = hmac.new(b'secret', body.encode(), hashlib.sha256).hexdigest()
+
+        with mock.patch.object(payment_manager.get_gateway('ZIINA'), 'webhook_secret', 'secret'):
+            with self.assertLogs('payments.views', 'ERROR'):
+                unsigned = self.client.post('/webhooks/ziina/', body, content_type='application/json')
+            signed = self.client.post(
+                '/webhooks/ziina/', body, content_type='application/json', headers={'X-Hmac-Signature': signature}
+            )
+            with self.verified('pending', gateway='ZIINA') as verify_payment:
+                self.process()
+
+        self.assertEqual((unsigned.status_code, signed.status_code), (400, 200))
+        verify_payment.assert_not_called()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'CAPTURED')
+
+    def test_handle_webhook_requires_staff(self):
+        query = 'mutation { handleWebhook(gatewayName: "TABBY", payload: "{}") { success } }'
+
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+
+        self.assertEqual(response['errors'][0]['message'], 'Not authorized')
+        self.assertFalse(PaymentWebhook.objects.exists())
+
+
+class SettlementTests(TestCase):
+    """settle_payment status transitions"""
+
+    def setUp(self):
+        self.payment = create_payment(create_gateway())
+
+    def settle(self, status):
+        changed = settle_payment(self.payment, status, source='test')
+        self.payment.refresh_from_db()
+        return changed
+
+    def test_capture_confirms_the_order_once(self):
+        self.assertTrue(self.settle('completed'))
+        self.assertFalse(self.settle('completed'))
+
+        self.assertEqual(self.payment.status, 'CAPTURED')
+        self.assertEqual(self.payment.order.status, 'CONFIRMED')
+        self.assertEqual(self.payment.order.status_history.filter(status='CONFIRMED').count(), 1)
+
+    def test_failed_event_replayed_after_capture_is_ignored(self):
+        self.settle('completed')
+
+        with self.assertLogs('payments.services.settlement', 'WARNING'):
+            self.assertFalse(self.settle('failed'))
+            self.assertFalse(self.settle('cancelled'))
+
+        self.assertEqual((self.payment.status, self.payment.failed_at), ('CAPTURED', None))
+        self.assertEqual(self.payment.order.status, 'CONFIRMED')
+
+    def test_captured_payment_can_be_refunded_but_not_reopened(self):
+        self.settle('completed')
+        self.assertTrue(self.settle('refunded'))
+        self.assertIsNotNone(self.payment.refunded_at)
+
+        with self.assertLogs('payments.services.settlement', 'WARNING'):
+            self.assertFalse(self.settle('completed'))
+        self.assertFalse(self.settle('pending'))
+        self.assertEqual(self.payment.status, 'REFUNDED')
+
+    def test_cancelled_payment_stays_cancelled(self):
+        self.settle('cancelled')
+
+        with self.assertLogs('payments.services.settlement', 'WARNING'):
+            self.assertFalse(self.settle('completed'))
+
+        self.assertEqual(self.payment.status, 'CANCELLED')
+        self.assertEqual(self.payment.order.status, 'PENDING')
+
+    def test_failed_payment_can_still_be_captured(self):
+        self.settle('failed')
+
+        self.assertTrue(self.settle('completed'))
+        self.assertEqual(self.payment.status, 'CAPTURED')
+
+
+class RefundTests(TestCase):
+    """Refund reservation and the processRefund mutation"""
+
+    def setUp(self):
+        self.payment = create_payment(create_gateway(), status='CAPTURED')
+
+    def process_refund(self, amount):
+        query = 'mutation { processRefund(input: {paymentId: "%s", amount: "%s", gatewayName: "ZIINA"}) { success message } }'
+        return self.client.post(
+            '/graphql/', {'query': query % (self.payment.payment_id, amount)}, content_type='application/json'
+        ).json()
+
+    def test_pending_refunds_count_against_the_refundable_amount(self):
+        reserved, rejected = reserve_refunds([{'payment_id': self.payment.payment_id, 'amount': '100'}])
+        self.assertEqual((len(reserved), rejected), (1, []))
+
+        reserved, rejected = reserve_refunds([{'payment_id': self.payment.payment_id, 'amount': '10'}])
+        self.assertEqual(reserved, [])
+        self.assertIn('exceeds the refundable amount', rejected[0]['message'])
+
+    def test_only_captured_payments_can_be_refunded(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status='PENDING')
+
+        _, rejected = reserve_refunds([{'payment_id': self.payment.payment_id, 'amount': '10'}])
+
+        self.assertIn('only captured payments', rejected[0]['message'])
+
+    def test_process_refund_requires_staff(self):
+        response = self.process_refund('10')
+
+        self.assertEqual(response['errors'][0]['message'], 'Not authorized')
+        self.assertFalse(Refund.objects.exists())
+
+    def test_full_refund_marks_the_payment_refunded(self):
+        self.client.force_login(get_user_model().objects.create_user(username='staff', password='x', is_staff=True))
+        gateway = payment_manager.get_gateway(self.payment.gateway.name)
+
+        with mock.patch.object(gateway, 'refund_payment', return_value={'success': True, 'refund_id': 'R1'}):
+            response = self.process_refund('105.00')
+
+        self.assertTrue(response['data']['processRefund']['success'])
+        self.assertEqual(Refund.objects.get().status, 'COMPLETED')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'REFUNDED')
+
+
+class RefundOutcomeTests(TestCase):
+    """Refunds are only released on an explicit decline"""
+
+    def setUp(self):
+        cache.clear()
+        self.payment = create_payment(create_gateway(), status='CAPTURED')
+
+    def refund(self, amount='105.00', **gateway_call):
+        """Refund through the real Ziina client with the HTTP call mocked"""
+        with mock.patch.object(requests.Session, 'request', **gateway_call), \
+                self.assertLogs('payments.services.refunds', 'WARNING'):
+            return list(bulk_refund([{'payment_id': self.payment.payment_id, 'amount': amount}]))[0]
+
+    def gateway_response(self, status_code, body):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps(body).encode()
+        return response
+
+    def assert_reserved(self):
+        self.assertEqual(Refund.objects.get().status, 'PENDING')
+        _, rejected = reserve_refunds([{'payment_id': self.payment.payment_id, 'amount': '1'}])
+        self.assertIn('exceeds the refundable amount', rejected[0]['message'])
+
+    def test_timeout_keeps_the_refund_reserved(self):
+        result = self.refund(side_effect=requests.Timeout('read timed out'))
+
+        self.assertFalse(result['success'])
+        self.assertIn('kept pending', result['message'])
+        self.assert_reserved()
+
+    def test_server_error_keeps_the_refund_reserved(self):
+        self.refund(return_value=self.gateway_response(502, {'message': 'Bad gateway'}))
+
+        self.assert_reserved()
+
+    def test_decline_releases_the_amount(self):
+        with mock.patch.object(
+            requests.Session, 'request', return_value=self.gateway_response(400, {'message': 'Already refunded'})
+        ):
+            result = list(bulk_refund([{'payment_id': self.payment.payment_id, 'amount': '105.00'}]))[0]
+
+        self.assertEqual(result['message'], 'Ziina refund failed: Already refunded')
+        self.assertEqual(Refund.objects.get().status, 'FAILED')
+        reserved, _ = reserve_refunds([{'payment_id': self.payment.payment_id, 'amount': '105.00'}])
+        self.assertEqual(len(reserved), 1)
+
+    def test_reconciliation_completes_refunds_the_gateway_confirms(self):
+        self.refund(side_effect=requests.Timeout('read timed out'))
+        gateway = payment_manager.get_gateway('ZIINA')
+
+        with mock.patch.object(gateway, 'verify_payment', return_value={'success': True, 'status': 'pending'}), \
+                self.assertLogs('payments.services.reconciliation', 'WARNING'):
+            self.assertEqual(reconcile_refunds(older_than=0), {'checked': 1, 'completed': 0, 'unresolved': 1})
+        self.assert_reserved()
+
+        with mock.patch.object(gateway, 'verify_payment', return_value={'success': True, 'status': 'refunded'}):
+            self.assertEqual(reconcile_refunds(older_than=0), {'checked': 1, 'completed': 1, 'unresolved': 0})
+        self.assertEqual(Refund.objects.get().status, 'COMPLETED')
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'REFUNDED')
+
+
+class ReconciliationTests(TestCase):
+    """Throttled, batched reconciliation of stale pending payments (services/reconciliation.py)"""
+
+    def setUp(self):
+        self.clock = 1000.0
+        self.sleeps = []
+
+    def fake_sleep(self, seconds):
+        self.sleeps.append(threading.current_thread())
+        # A real sleep always lets some time pass, even for float rounding leftovers
+        self.clock += max(seconds, 0.001)
+
+    def fake_clock(self):
+        return mock.patch.multiple(
+            'payments.services.reconciliation.time', monotonic=lambda: self.clock, sleep=self.fake_sleep
+        )
+
+    def stale_payments(self, count, gateway='ZIINA'):
+        return [(pk, f'pay_{pk}', gateway) for pk in range(1, count + 1)]
+
+    def test_rate_limiter_allows_a_burst_then_the_rate(self):
+        with self.fake_clock():
+            limiter = RateLimiter(rate=5)
+            for _ in range(15):
+                limiter.acquire()
+
+        # 5 calls from the full bucket, then one every 0.2s
+        self.assertAlmostEqual(self.clock - 1000.0, 2.0, delta=0.05)
+
+    def test_tokens_are_taken_before_submitting(self):
+        verify_threads = []
+
+        def verify_payment(payment_id, gateway_name):
+            verify_threads.append(threading.current_thread())
+            return {'success': True, 'status': 'PENDING'}
+
+        with self.fake_clock(), \
+                mock.patch.object(payment_manager, 'verify_payment', side_effect=verify_payment), \
+                mock.patch('payments.services.reconciliation.get_stale_pending_payments', return_value=[
+                    payment for pair in zip(self.stale_payments(10), self.stale_payments(10, 'TABBY'))
+                    for payment in pair
+                ]):
+            stats = reconcile_payments(workers=4, rate_limit=5)
+
+        self.assertEqual(stats, {'checked': 20, 'settled': 0, 'unchanged': 20, 'errors': 0})
+        # The two gateways are throttled separately: 10 calls each at 5/s
+        self.assertAlmostEqual(self.clock - 1000.0, 1.0, delta=0.05)
+        self.assertEqual(set(self.sleeps), {threading.current_thread()})
+        self.assertNotIn(threading.current_thread(), verify_threads)
+
+    def test_calls_in_flight_are_bounded(self):
+        submitted, finished, most_in_flight = [0], [0], [0]
+
+        def stale_payments(*args):
+            for payment in self.stale_payments(50):
+                most_in_flight[0] = max(most_in_flight[0], submitted[0] - finished[0])
+                submitted[0] += 1
+                yield payment
+
+        def verify_payment(payment_id, gateway_name):
+            time.sleep(0.002)
+            finished[0] += 1
+            return {'success': True, 'status': 'PENDING'}
+
+        with mock.patch.object(payment_manager, 'verify_payment', side_effect=verify_payment), \
+                mock.patch('payments.services.reconciliation.get_stale_pending_payments', side_effect=stale_payments):
+            stats = reconcile_payments(workers=2, rate_limit=1000)
+
+        self.assertEqual(stats['checked'], 50)
+        # workers * 4 calls queued at most
+        self.assertLessEqual(most_in_flight[0], 8)
+
+    def test_results_are_settled_in_batches(self):
+        gateway = create_gateway()
+        payments = [create_payment(gateway) for _ in range(5)]
+        Payment.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        statuses = {payment.payment_id: status for payment, status in zip(
+            payments, ['CAPTURED', 'CAPTURED', 'FAILED', 'PENDING', 'CAPTURED']
+        )}
+        progress = []
+
+        with mock.patch.object(payment_manager, 'verify_payment', side_effect=lambda payment_id, gateway_name: {
+            'success': True, 'status': statuses[payment_id]
+        }), mock.patch('payments.services.reconciliation.settle_results', wraps=settle_results) as settle:
+            stats = reconcile_payments(workers=1, batch_size=2, progress=progress.append)
+
+        self.assertEqual(stats, {'checked': 5, 'settled': 4, 'unchanged': 1, 'errors': 0})
+        # The 4 results to settle went through settle_results, reporting progress after each batch
+        self.assertEqual(sum(len(call.args[0]) for call in settle.call_args_list), 4)
+        self.assertEqual(len(progress), settle.call_count)
+        self.assertEqual(progress[-1], stats)
+        self.assertEqual(
+            list(Payment.objects.order_by('created_at', 'pk').values_list('status', flat=True)),
+            ['CAPTURED', 'CAPTURED', 'FAILED', 'PENDING', 'CAPTURED']
+        )
+
+    def test_one_bad_result_does_not_undo_the_batch(self):
+        gateway = create_gateway()
+        first, second = create_payment(gateway), create_payment(gateway)
+
+        def settle(payment, status, **kwargs):
+            if payment.pk == first.pk:
+                raise ValueError('bad row')
+            return settle_payment(payment, status, **kwargs)
+
+        with mock.patch('payments.services.reconciliation.settle_payment', side_effect=settle), \
+                self.assertLogs('payments.services.reconciliation', 'ERROR'):
+            changed = settle_results([
+                (first.pk, {'status': 'CAPTURED'}), (second.pk, {'status': 'CAPTURED'}), (0, {'status': 'CAPTURED'})
+            ])
+
+        self.assertEqual(changed, 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('PENDING', 'CAPTURED'))
+
+    def test_dry_run_changes_nothing(self):
+        payment = create_payment(create_gateway())
+        Payment.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+        with mock.patch.object(payment_manager, 'verify_payment', return_value={'success': True, 'status': 'CAPTURED'}):
+            stats = reconcile_payments(dry_run=True)
+
+        self.assertEqual(stats['settled'], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'PENDING')
+
+
+class GatewayRegistryTests(TestCase):
+    """Process-level gateway registry (services/registry.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.gateway = create_gateway()
+        self.registry = GatewayRegistry()
+
+    def test_gateways_are_loaded_once(self):
+        self.assertEqual(self.registry.get('ziina')['id'], self.gateway.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.registry.get_gateway_id('ZIINA'), self.gateway.id)
+            self.assertEqual(self.registry.public()['ZIINA']['min_amount'], '1.00')
+
+    @override_settings(PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL=0)
+    def test_version_bump_reloads_other_processes(self):
+        self.registry.all()
+        PaymentGateway.objects.filter(pk=self.gateway.pk).update(display_name='Ziina Pay', is_active=False)
+        self.assertEqual(self.registry.get('ZIINA')['name'], 'Ziina')
+
+        # Another process saved the gateway
+        GatewayRegistry().invalidate()
+
+        self.assertEqual(self.registry.get('ZIINA')['name'], 'Ziina Pay')
+        self.assertFalse(self.registry.get('ZIINA')['is_active'])
+
+    def test_version_is_checked_at_most_every_interval(self):
+        with override_settings(PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL=60):
+            self.registry.all()
+            GatewayRegistry().invalidate()
+            PaymentGateway.objects.filter(pk=self.gateway.pk).update(display_name='Ziina Pay')
+
+            with self.assertNumQueries(0):
+                self.assertEqual(self.registry.get('ZIINA')['name'], 'Ziina')
+
+        with override_settings(PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL=0):
+            self.assertEqual(self.registry.get('ZIINA')['name'], 'Ziina Pay')
+
+    @override_settings(PAYMENT_GATEWAY_REGISTRY_CHECK_INTERVAL=0)
+    def test_saving_a_gateway_bumps_the_version_on_commit(self):
+        self.registry.all()
+        version = cache.get(VERSION_CACHE_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gateway.config = {'min_amount': '5.00'}
+            self.gateway.save()
+            self.assertEqual(cache.get(VERSION_CACHE_KEY), version)
+
+        self.assertNotEqual(cache.get(VERSION_CACHE_KEY), version)
+        self.assertEqual(self.registry.get('ZIINA')['min_amount'], Decimal('5.00'))
+
+
+class PaymentMethodsCacheTests(TestCase):
+    """get_cached_payment_methods (stale-while-revalidate in ecomarce_choco/cache.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.service = payment_manager.get_gateway('ZIINA')
+        self.key = f'payment_methods:{self.service.gateway_name}'
+        # Run background refreshes inline
+        patcher = mock.patch('ecomarce_choco.cache._refresh_executor', mock.Mock(submit=lambda fn, *args: fn(*args)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def methods(self, *names):
+        return {'success': True, 'payment_methods': list(names)}
+
+    def test_cache_hit_skips_the_gateway(self):
+        with mock.patch.object(self.service, 'get_payment_methods', return_value=self.methods('card')) as fetch:
+            self.assertEqual(self.service.get_cached_payment_methods(), self.methods('card'))
+            self.assertEqual(self.service.get_cached_payment_methods(), self.methods('card'))
+
+        fetch.assert_called_once_with()
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        with mock.patch.object(self.service, 'get_payment_methods', return_value=self.methods('card')):
+            self.service.get_cached_payment_methods()
+        cache.set(self.key, dict(cache.get(self.key), fresh_until=time.time() - 1), 60)
+
+        with mock.patch.object(
+            self.service, 'get_payment_methods', return_value=self.methods('card', 'apple_pay')
+        ) as fetch:
+            self.assertEqual(self.service.get_cached_payment_methods(), self.methods('card'))
+            self.assertEqual(self.service.get_cached_payment_methods(), self.methods('card', 'apple_pay'))
+
+        fetch.assert_called_once_with()
+        self.assertGreater(cache.get(self.key)['fresh_until'], time.time())
+        self.assertIsNone(cache.get(f'{self.key}:refreshing'))
+
+    def test_errors_are_not_cached(self):
+        error = {'success': False, 'error': 'Gateway timeout'}
+        with mock.patch.object(self.service, 'get_payment_methods', return_value=error) as fetch:
+            self.assertEqual(self.service.get_cached_payment_methods(), error)
+            self.service.get_cached_payment_methods()
+
+        self.assertEqual(fetch.call_count, 2)
+        self.assertIsNone(cache.get(self.key))
+
+
+class PaymentArchiveTests(TestCase):
+    """Archival of old webhook payloads and gateway responses (services/archive.py)"""
+
+    def setUp(self):
+        self.gateway = create_gateway()
+        self.cutoff = timezone.now() - timedelta(days=90)
+        self.old = self.cutoff - timedelta(days=1)
+
+    def webhook(self, status='PROCESSED', created_at=None):
+        webhook = PaymentWebhook.objects.create(
+            gateway=self.gateway, webhook_type='payment.updated', status=status,
+            payload={'id': 'pay_1', 'status': 'completed', 'customer': {'email': 'customer@example.com'}}
+        )
+        PaymentWebhook.objects.filter(pk=webhook.pk).update(created_at=created_at or self.old)
+        return webhook
+
+    def payment(self, status='CAPTURED', created_at=None):
+        payment = create_payment(self.gateway, status)
+        Payment.objects.filter(pk=payment.pk).update(
+            created_at=created_at or self.old,
+            gateway_response={'id': 'pay_1', 'status': 'completed', 'card': {'last4': '4242'}},
+        )
+        return payment
+
+    def test_old_settled_webhooks_are_archived_and_trimmed(self):
+        archived = self.webhook()
+        failed = self.webhook(status='FAILED')
+        queued = self.webhook(status='RECEIVED')
+        recent = self.webhook(created_at=timezone.now())
+
+        self.assertEqual(archive_webhooks(self.cutoff), 2)
+
+        archived.refresh_from_db()
+        self.assertEqual(archived.payload, {'id': 'pay_1', 'status': 'completed'})
+        self.assertIsNotNone(archived.archived_at)
+        self.assertEqual(
+            PaymentArchive.objects.get(source='WEBHOOK', object_id=archived.id).get_data()['customer'],
+            {'email': 'customer@example.com'}
+        )
+        self.assertTrue(PaymentArchive.objects.filter(source='WEBHOOK', object_id=failed.id).exists())
+        for webhook in (queued, recent):
+            webhook.refresh_from_db()
+            self.assertIsNone(webhook.archived_at)
+            self.assertIn('customer', webhook.payload)
+
+    def test_old_settled_payments_are_archived_and_trimmed(self):
+        archived = self.payment()
+        pending = self.payment(status='PENDING')
+        recent = self.payment(created_at=timezone.now())
+
+        self.assertEqual(archive_gateway_responses(self.cutoff), 1)
+
+        archived.refresh_from_db()
+        self.assertEqual(archived.gateway_response, {'id': 'pay_1', 'status': 'completed'})
+        self.assertEqual(
+            PaymentArchive.objects.get(source='PAYMENT', object_id=archived.id).get_data()['card'], {'last4': '4242'}
+        )
+        for payment in (pending, recent):
+            payment.refresh_from_db()
+            self.assertIsNone(payment.archived_at)
+            self.assertIn('card', payment.gateway_response)
+        self.assertEqual(count_archivable(90), {'webhooks': 0, 'payments': 0})
+
+    def test_rows_are_archived_in_batches(self):
+        for _ in range(3):
+            self.webhook()
+
+        self.assertEqual(count_archivable(90)['webhooks'], 3)
+        self.assertEqual(
+            [archive_webhooks(self.cutoff, batch_size=2) for _ in range(3)], [2, 1, 0]
+        )
+        self.assertEqual(PaymentArchive.objects.filter(source='WEBHOOK').count(), 3)
+
+    def test_batches_skip_locked_rows(self):
+        self.webhook()
+        self.payment()
+
+        with mock.patch.object(
+            QuerySet, 'select_for_update', autospec=True, side_effect=QuerySet.select_for_update
+        ) as select_for_update:
+            archive_webhooks(self.cutoff)
+            archive_gateway_responses(self.cutoff)
+
+        self.assertEqual(select_for_update.call_count, 2)
+        for call in select_for_update.call_args_list:
+            self.assertEqual(call.kwargs, {'skip_locked': True})
+
+
+@override_settings(ROOT_URLCONF='payments.tests')
+class AsyncGraphQLViewTests(TransactionTestCase):
+    """Async payment mutations share the event loop (GRAPHQL_ASYNC_VIEW)"""
+
+    VERIFY = 'mutation { verifyPayment(input: {paymentId: "%s", gatewayName: "ZIINA"}) { success message } }'
+
+    def post(self, query):
+        return self.async_client.post('/graphql/', {'query': query}, content_type='application/json')
+
+    async def test_gateway_calls_run_concurrently(self):
+        def verify_payment(payment_id):
+            time.sleep(0.3)
+            return {'success': False, 'error': f'Declined {payment_id}'}
+
+        gateway = payment_manager.get_gateway('ZIINA')
+        started = time.monotonic()
+        with mock.patch.object(gateway, 'verify_payment', side_effect=verify_payment):
+            responses = await asyncio.gather(*[self.post(self.VERIFY % f'pay_{n}') for n in range(6)])
+
+        # One after the other these would take 1.8s
+        self.assertLess(time.monotonic() - started, 1.2)
+        self.assertEqual(
+            [response.json()['data']['verifyPayment']['message'] for response in responses],
+            [f'Declined pay_{n}' for n in range(6)]
+        )
+
+    async def test_other_operations_fall_back_to_the_sync_view(self):
+        response = await self.post('{ __typename }')
+        self.assertEqual(response.json(), {'data': {'__typename': 'Query'}})
+
+        response = await self.post('mutation { verifyPayment(input: {}) { success } }')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,270 @@
+"""
+Batch admin updates
+Validates a list of price, inventory or product changes in bulk, loads the
+targets with in_bulk and writes every valid item with bulk_create/
+bulk_update in one transaction. Invalid items are reported per item and
+don't stop the others.
+"""
+from typing import Any, Dict, List, Tuple
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import INVENTORY_TAG, PRODUCTS_TAG, invalidate_on_commit
+from .models import Brand, Category, Inventory, Product, ProductPrice
+from .pricing import sync_active_prices
+
+# Most items one batch mutation may change
+MAX_BATCH_ITEMS = 1000
+
+PRODUCT_UPDATE_FIELDS = [
+    'sku', 'name', 'slug', 'description', 'short_description', 'ingredients', 'allergen_info',
+    'weight', 'volume', 'unit_type', 'is_active', 'featured',
+]
+
+
+def _result(index: int, product_id, success: bool, message: str) -> Dict[str, Any]:
+    return {'index': index, 'product_id': product_id, 'success': success, 'message': message}
+
+
+def _check_size(items: List[Dict[str, Any]]):
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_ITEMS} items per request")
+
+
+def set_product_prices(items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[ProductPrice]]:
+    """
+    Create or update product prices (matched by product, price_type and
+    min_quantity)
+
+    Args:
+        items: Dicts with product_id, price_type, base_price and optional
+            sale_price, min_quantity and is_active
+
+    Returns:
+        (per-item results in input order, saved prices)
+    """
+    _check_size(items)
+    valid_types = {choice for choice, _ in ProductPrice.PRICE_TYPE_CHOICES}
+    products = Product.objects.only('id', 'name').in_bulk({item['product_id'] for item in items})
+
+    results, valid, seen = [], [], {}
+    for index, item in enumerate(items):
+        key = (item['product_id'], item['price_type'], item.get('min_quantity') or 1)
+        error = None
+        if item['product_id'] not in products:
+            error = "Product not found"
+        elif item['price_type'] not in valid_types:
+            error = f"Invalid price type '{item['price_type']}'"
+        elif item['base_price'] < 0 or (item.get('sale_price') is not None and item['sale_price'] < 0):
+            error = "Prices cannot be negative"
+        elif key[2] < 1:
+            error = "Minimum quantity must be at least 1"
+        elif key in seen:
+            error = f"Same price as item {seen[key]}"
+        results.append(_result(index, item['product_id'], error is None, error))
+        if error is None:
+            seen[key] = index
+            valid.append((index, key, item))
+
+    product_ids = {key[0] for _, key, _ in valid}
+    existing = {
+        (price.product_id, price.price_type, price.min_quantity): price
+        for price in ProductPrice.objects.filter(product_id__in=product_ids)
+    }
+
+    now = timezone.now()
+    created, updated = [], []
+    for index, key, item in valid:
+        price = existing.get(key)
+        if price is None:
+            price = ProductPrice(
+                product_id=key[0],
+                price_type=key[1],
+                min_quantity=key[2],
+                base_price=item['base_price'],
+                sale_price=item.get('sale_price'),
+                is_active=True if item.get('is_active') is None else item['is_active'],
+            )
+            created.append(price)
+            action = "created"
+        else:
+            price.base_price = item['base_price']
+            if item.get('sale_price') is not None:
+                price.sale_price = item['sale_price']
+            if item.get('is_active') is not None:
+                price.is_active = item['is_active']
+            price.updated_at = now
+            updated.append(price)
+            action = "updated"
+        results[index]['message'] = f"Price {action} for '{products[key[0]].name}'"
+
+    with transaction.atomic():
+        ProductPrice.objects.bulk_create(created)
+        ProductPrice.objects.bulk_update(updated, ['base_price', 'sale_price', 'is_active', 'updated_at'])
+        # Bulk writes send no signals
+        sync_active_prices(product_ids)
+        if product_ids:
+            invalidate_on_commit(PRODUCTS_TAG, *[f'product:{product_id}' for product_id in product_ids])
+
+    return results, created + updated
+
+
+def update_inventories(items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Inventory]]:
+    """
+    Set stock levels, creating missing inventory rows
+
+    Args:
+        items: Dicts with product_id, quantity_in_stock and optional
+            low_stock_threshold and warehouse_location
+
+    Returns:
+        (per-item results in input order, saved inventory rows)
+    """
+    _check_size(items)
+    products = Product.objects.only('id', 'name').in_bulk({item['product_id'] for item in items})
+
+    results, valid, seen = [], [], {}
+    for index, item in enumerate(items):
+        product_id = item['product_id']
+        error = None
+        if product_id not in products:
+            error = "Product not found"
+        elif item['quantity_in_stock'] < 0:
+            error = "Quantity cannot be negative"
+        elif item.get('low_stock_threshold') is not None and item['low_stock_threshold'] < 0:
+            error = "Low stock threshold cannot be negative"
+        elif product_id in seen:
+            error = f"Same product as item {seen[product_id]}"
+        results.append(_result(index, product_id, error is None, error))
+        if error is None:
+            seen[product_id] = index
+            valid.append((index, item))
+
+    existing = {
+        inventory.product_id: inventory
+        for inventory in Inventory.objects.filter(product_id__in=[item['product_id'] for _, item in valid])
+    }
+
+    now = timezone.now()
+    created, updated = [], []
+    for index, item in valid:
+        inventory = existing.get(item['product_id'])
+        if inventory is None:
+            inventory = Inventory(product_id=item['product_id'], low_stock_threshold=10, warehouse_location='')
+            created.append(inventory)
+        else:
+            updated.append(inventory)
+        inventory.quantity_in_stock = item['quantity_in_stock']
+        if item.get('low_stock_threshold') is not None:
+            inventory.low_stock_threshold = item['low_stock_threshold']
+        if item.get('warehouse_location') is not None:
+            inventory.warehouse_location = item['warehouse_location']
+        inventory.updated_at = now
+        results[index]['message'] = (
+            f"Inventory updated for '{products[item['product_id']].name}': {inventory.quantity_in_stock} units"
+        )
+
+    with transaction.atomic():
+        Inventory.objects.bulk_create(created)
+        Inventory.objects.bulk_update(
+            updated, ['quantity_in_stock', 'low_stock_threshold', 'warehouse_location', 'updated_at']
+        )
+        if valid:
+            invalidate_on_commit(INVENTORY_TAG, *[f'inventory:{item["product_id"]}' for _, item in valid])
+
+    return results, created + updated
+
+
+def update_products(items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Product]]:
+    """
+    Update product fields; only the fields given (not None) change
+
+    Args:
+        items: Dicts with id and any of PRODUCT_UPDATE_FIELDS, brand_id and
+            category_id
+
+    Returns:
+        (per-item results in input order, updated products)
+    """
+    _check_size(items)
+    products = Product.objects.in_bulk({item['id'] for item in items})
+    brands = Brand.objects.only('id').in_bulk({item['brand_id'] for item in items if item.get('brand_id')})
+    categories = Category.objects.only('id').in_bulk(
+        {item['category_id'] for item in items if item.get('category_id')}
+    )
+    valid_unit_types = {choice for choice, _ in Product.UNIT_TYPE_CHOICES}
+
+    # Current owners of the SKUs and slugs asked for. A value held by another
+    # product stays taken even if that product changes it in this batch: the
+    # single bulk_update can't move unique values between rows (swaps)
+    batch_ids = {item['id'] for item in items}
+    owners = {
+        field: dict(
+            Product.objects.filter(**{f'{field}__in': [item[field] for item in items if item.get(field)]})
+            .values_list(field, 'id')
+        )
+        for field in ('sku', 'slug')
+    }
+
+    results, changed, fields, seen = [], [], set(), {}
+    claimed = {'sku': {}, 'slug': {}}
+    for index, item in enumerate(items):
+        product = products.get(item['id'])
+        error = None
+        if product is None:
+            error = "Product not found"
+        elif item['id'] in seen:
+            error = f"Same product as item {seen[item['id']]}"
+        elif item.get('brand_id') and item['brand_id'] not in brands:
+            error = "Brand not found"
+        elif item.get('category_id') and item['category_id'] not in categories:
+            error = "Category not found"
+        elif item.get('unit_type') is not None and item['unit_type'] not in valid_unit_types:
+            error = f"Invalid unit type '{item['unit_type']}'"
+        elif item.get('name') is not None and not item['name'].strip():
+            error = "Name cannot be empty"
+        else:
+            for field in ('sku', 'slug'):
+                value = item.get(field)
+                if not value:
+                    continue
+                owner = owners[field].get(value, item['id'])
+                if owner != item['id'] and owner in batch_ids:
+                    error = f"The {field} '{value}' still belongs to product {owner}; change that product first, in a separate request"
+                    break
+                if owner != item['id'] or claimed[field].get(value, item['id']) != item['id']:
+                    error = f"A product with this {field} already exists"
+                    break
+        if error:
+            results.append(_result(index, item['id'], False, error))
+            continue
+
+        seen[item['id']] = index
+        for field in ('sku', 'slug'):
+            if item.get(field):
+                claimed[field][item[field]] = item['id']
+
+        for field in PRODUCT_UPDATE_FIELDS:
+            value = item.get(field)
+            # Empty SKU or slug means "keep", as in updateProduct
+            if value is None or (field in ('sku', 'slug') and not value):
+                continue
+            setattr(product, field, value)
+            fields.add(field)
+        if item.get('brand_id'):
+            product.brand_id = item['brand_id']
+            fields.add('brand')
+        if item.get('category_id'):
+            product.category_id = item['category_id']
+            fields.add('category')
+        product.updated_at = timezone.now()
+        changed.append(product)
+        results.append(_result(index, product.id, True, f"Product '{product.name}' updated successfully"))
+
+    with transaction.atomic():
+        if changed and fields:
+            Product.objects.bulk_update(changed, [*sorted(fields), 'updated_at'])
+        if changed:
+            invalidate_on_commit(PRODUCTS_TAG, *[f'product:{product.id}' for product in changed])
+
+    return results, changed
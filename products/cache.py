@@ -0,0 +1,61 @@
+"""
+Catalog cache
+Resolver results for the public catalog queries, tagged so product, price
+and image changes evict exactly the entries they affect, in every worker
+(see invalidation.py). Stock is read live and only tags stock-filtered lists.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from ecomarce_choco.cache import TieredCache
+
+from .invalidation import listener_running, publish
+
+
+def _local_ttl():
+    """Local tier TTL: long only while this process' invalidation listener runs"""
+    if listener_running():
+        return getattr(settings, 'CATALOG_CACHE_BUS_LOCAL_TTL', 300)
+    return getattr(settings, 'CATALOG_CACHE_LOCAL_TTL', 30)
+
+
+catalog_cache = TieredCache(
+    'catalog',
+    ttl=getattr(settings, 'CATALOG_CACHE_TTL', 300),
+    local_ttl=_local_ttl,
+    local_max_entries=getattr(settings, 'CATALOG_CACHE_LOCAL_MAX_ENTRIES', 1000),
+    stale_ttl=getattr(settings, 'CATALOG_CACHE_STALE_TTL', 600),
+    lock_timeout=getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT', 10),
+)
+
+# Tags for whole collections (any change to one of their rows)
+PRODUCTS_TAG = 'products'
+CATEGORIES_TAG = 'categories'
+BRANDS_TAG = 'brands'
+INVENTORY_TAG = 'inventory'
+
+
+def product_tags(product):
+    """Tags for an entry containing this product"""
+    if product is None:
+        return []
+    return [f'product:{product.id}', f'category:{product.category_id}', f'brand:{product.brand_id}']
+
+
+def product_list_tags(products):
+    """Tags for an entry containing these products"""
+    tags = set()
+    for product in products:
+        tags.update(product_tags(product))
+    return tags
+
+
+def invalidate(*tags):
+    """Invalidate the tags here and in every other worker's local tier"""
+    catalog_cache.invalidate_tags(*tags)
+    publish(tags)
+
+
+def invalidate_on_commit(*tags):
+    """Invalidate the tags once the current transaction commits"""
+    transaction.on_commit(lambda: invalidate(*tags))
@@ -0,0 +1,156 @@
+"""
+Catalog export
+Streams the catalog as JSONL or CSV in the format import_catalog reads.
+Products are read with iterator(chunk_size=...) (a server-side cursor on
+PostgreSQL) and their prices, variants and images are prefetched per
+chunk, so memory stays flat whatever the catalog size.
+"""
+import csv
+import json
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional
+from django.db.models import Prefetch
+
+from .catalog_import import INVENTORY_FIELDS, PRICE_FIELDS, PRODUCT_FIELDS, VARIANT_FIELDS
+from .models import Product, ProductImage, ProductPrice, ProductVariant, ProductVariantValue
+
+# CSV has one row per product and per variant; only the lowest RETAIL tier
+# fits in the price columns (JSONL carries every tier)
+CSV_COLUMNS = [
+    'sku', 'parent_sku', 'brand', 'category', *PRODUCT_FIELDS,
+    'price', 'sale_price', 'currency', 'retail_price', 'stock', 'available_quantity',
+    'low_stock_threshold', 'warehouse_location', 'is_default', 'options', 'image_url',
+]
+
+
+def catalog_queryset(active_only: bool = False):
+    """Products with everything the export reads, prefetched per chunk"""
+    queryset = Product.objects.select_related('brand', 'category', 'inventory').prefetch_related(
+        Prefetch('prices', queryset=ProductPrice.objects.order_by('price_type', 'min_quantity')),
+        Prefetch('images', queryset=ProductImage.objects.order_by('-is_primary', 'display_order', 'id')),
+        Prefetch(
+            'variants',
+            queryset=ProductVariant.objects.order_by('sku').prefetch_related(
+                Prefetch('option_values', queryset=ProductVariantValue.objects.select_related('option_value__option'))
+            ),
+        ),
+    ).order_by('id')
+    if active_only:
+        queryset = queryset.filter(is_active=True)
+    return queryset
+
+
+def _value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _image_url(image, base_url: str) -> Optional[str]:
+    if not image:
+        return None
+    return f'{base_url.rstrip("/")}{image.url}' if base_url else image.url
+
+
+def product_record(product: Product, base_url: str = '') -> Dict[str, Any]:
+    """A product as an import_catalog JSONL record (plus export-only fields)"""
+    inventory = getattr(product, 'inventory', None)
+    images = list(product.images.all())
+    return {
+        'sku': product.sku,
+        'brand': product.brand.slug,
+        'category': product.category.slug,
+        **{name: _value(getattr(product, name)) for name in PRODUCT_FIELDS},
+        'retail_price': _value(product.effective_retail_price),
+        'image_url': _image_url(images[0].image, base_url) if images else None,
+        'prices': [
+            {
+                'price_type': price.price_type,
+                'min_quantity': price.min_quantity,
+                **{name: _value(getattr(price, name)) for name in PRICE_FIELDS},
+            }
+            for price in product.prices.all()
+        ],
+        'inventory': {
+            **{name: _value(getattr(inventory, name)) for name in INVENTORY_FIELDS},
+            'reserved_quantity': inventory.reserved_quantity,
+            'available_quantity': inventory.available_quantity,
+        } if inventory else None,
+        'variants': [
+            {
+                'sku': variant.sku,
+                'options': {vv.option_value.option.name: vv.option_value.value for vv in variant.option_values.all()},
+                **{name: _value(getattr(variant, name)) for name in VARIANT_FIELDS},
+                'available_quantity': variant.available_quantity,
+                'image_url': _image_url(variant.image, base_url),
+            }
+            for variant in product.variants.all()
+        ],
+    }
+
+
+def _csv_bool(value):
+    return ('true' if value else 'false') if isinstance(value, bool) else value
+
+
+def csv_rows(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A product record flattened to its CSV rows (product first, then variants)"""
+    retail = [price for price in record['prices'] if price['price_type'] == 'RETAIL']
+    inventory = record['inventory'] or {}
+    row = {name: record[name] for name in ('sku', 'brand', 'category', *PRODUCT_FIELDS, 'retail_price', 'image_url')}
+    if isinstance(row['nutritional_info'], (dict, list)):
+        row['nutritional_info'] = json.dumps(row['nutritional_info'])
+    if retail:
+        row.update(price=retail[0]['base_price'], sale_price=retail[0]['sale_price'], currency=retail[0]['currency'])
+    if inventory:
+        row.update(
+            stock=inventory['quantity_in_stock'],
+            available_quantity=inventory['available_quantity'],
+            low_stock_threshold=inventory['low_stock_threshold'],
+            warehouse_location=inventory['warehouse_location'],
+        )
+    rows = [row]
+
+    for variant in record['variants']:
+        rows.append({
+            'sku': variant['sku'],
+            'parent_sku': record['sku'],
+            'options': '; '.join(f'{name}={value}' for name, value in variant['options'].items()),
+            'price': variant['price'],
+            'sale_price': variant['sale_price'],
+            'currency': variant['currency'],
+            'stock': variant['quantity_in_stock'],
+            'available_quantity': variant['available_quantity'],
+            'low_stock_threshold': variant['low_stock_threshold'],
+            'weight': variant['weight'],
+            'is_active': variant['is_active'],
+            'is_default': variant['is_default'],
+            'image_url': variant['image_url'],
+        })
+    return [{name: _csv_bool(value) for name, value in row.items()} for row in rows]
+
+
+def iter_records(active_only: bool = False, chunk_size: int = 2000, base_url: str = '') -> Iterator[Dict[str, Any]]:
+    """Stream every product record"""
+    for product in catalog_queryset(active_only).iterator(chunk_size=chunk_size):
+        yield product_record(product, base_url)
+
+
+class CatalogWriter:
+    """Writes product records as JSONL or CSV"""
+
+    def __init__(self, handle, file_format: str):
+        self.handle = handle
+        self.file_format = file_format
+        if file_format == 'csv':
+            self.writer = csv.DictWriter(handle, fieldnames=CSV_COLUMNS)
+            self.writer.writeheader()
+
+    def write(self, record: Dict[str, Any]):
+        if self.file_format == 'csv':
+            self.writer.writerows(csv_rows(record))
+        else:
+            self.handle.write(json.dumps(record, ensure_ascii=False))
+            self.handle.write('\n')
@@ -0,0 +1,520 @@
+"""
+Catalog import
+Streams product records from CSV or JSONL into the catalog in batches.
+Brands and categories are resolved from in-memory maps; products, prices,
+inventory and variants are upserted with bulk_create(update_conflicts=True),
+a handful of queries per batch instead of several per row.
+
+CSV: one product per row (sku, name, brand, category, price, sale_price,
+stock, ... see PRODUCT_FIELDS). Rows with a parent_sku are variants of that
+product, with options as "Color=White; Weight=500g".
+
+JSONL: one product per line with the same keys, plus optional nested
+"prices" (tiers), "inventory" and "variants" (each with "options":
+{"Color": "White"}).
+"""
+import csv
+import gzip
+import io
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .cache import PRODUCTS_TAG, invalidate_on_commit
+from .models import (
+    Brand, Category, Inventory, Product, ProductPrice, ProductVariant, ProductVariantOption,
+    ProductVariantOptionValue, ProductVariantValue
+)
+from .pricing import sync_active_prices
+
+# Columns copied onto the models (brand, category, prices, stock and
+# variants are handled separately)
+PRODUCT_FIELDS = [
+    'name', 'slug', 'description', 'short_description', 'ingredients', 'allergen_info', 'nutritional_info',
+    'weight', 'volume', 'unit_type', 'is_active', 'featured', 'meta_title', 'meta_description',
+]
+PRICE_FIELDS = ['base_price', 'sale_price', 'currency', 'max_quantity', 'is_active', 'valid_from', 'valid_until']
+INVENTORY_FIELDS = ['quantity_in_stock', 'low_stock_threshold', 'warehouse_location']
+VARIANT_FIELDS = [
+    'price', 'sale_price', 'currency', 'quantity_in_stock', 'low_stock_threshold', 'weight', 'is_active',
+    'is_default',
+]
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+
+
+class RecordError(ValueError):
+    """A record that can't be imported"""
+
+
+# ============================================================================
+# Reading
+# ============================================================================
+
+def _open(path: str):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, newline='', encoding='utf-8')
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def _parse_options(value) -> Dict[str, str]:
+    """Variant options from {"Color": "White"} or "Color=White; Weight=500g" """
+    if isinstance(value, dict):
+        return {str(name).strip(): str(option).strip() for name, option in value.items()}
+    value = (value or '').strip()
+    if not value:
+        return {}
+    if value.startswith('{'):
+        return _parse_options(json.loads(value))
+    options = {}
+    for part in value.split(';'):
+        if not part.strip():
+            continue
+        if '=' not in part:
+            raise RecordError(f"Invalid option {part.strip()!r} (expected Name=Value)")
+        name, option = part.split('=', 1)
+        options[name.strip()] = option.strip()
+    return options
+
+
+def _given(row: Dict[str, Any], key: str) -> bool:
+    return row.get(key) not in (None, '')
+
+
+def _variant_from(row: Dict[str, Any]) -> Dict[str, Any]:
+    variant = {key: row[key] for key in VARIANT_FIELDS if key in row}
+    variant['sku'] = row.get('sku')
+    variant['options'] = _parse_options(row.get('options'))
+    if _given(row, 'stock'):
+        variant['quantity_in_stock'] = row['stock']
+    return variant
+
+
+def normalize(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn a CSV row or JSON object into a record:
+    {'sku', 'parent_sku', 'brand', 'category', 'fields', 'prices', 'inventory', 'variants'}
+    """
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise RecordError("Missing sku")
+
+    if _given(row, 'parent_sku'):
+        return {'sku': sku, 'parent_sku': str(row['parent_sku']).strip(), 'variants': [_variant_from(row)]}
+
+    prices = [dict(price) for price in row.get('prices') or []]
+    for price in prices:
+        if 'price' in price and 'base_price' not in price:
+            price['base_price'] = price.pop('price')
+    if _given(row, 'price'):
+        price = {'base_price': row['price'], 'sale_price': row.get('sale_price')}
+        if _given(row, 'currency'):
+            price['currency'] = row['currency']
+        prices.append(price)
+
+    inventory = dict(row['inventory']) if isinstance(row.get('inventory'), dict) else {}
+    if _given(row, 'stock'):
+        inventory['quantity_in_stock'] = row['stock']
+    for key in INVENTORY_FIELDS:
+        if _given(row, key):
+            inventory[key] = row[key]
+
+    return {
+        'sku': sku,
+        'parent_sku': None,
+        'brand': str(row.get('brand') or '').strip(),
+        'category': str(row.get('category') or '').strip(),
+        'fields': {key: row[key] for key in PRODUCT_FIELDS if key in row},
+        'prices': prices,
+        'inventory': inventory or None,
+        'variants': [_variant_from(variant) for variant in row.get('variants') or []],
+    }
+
+
+def read_records(path: str, file_format: str = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Stream (line number, record) pairs; malformed rows yield a RecordError
+    instead of a record
+    """
+    file_format = file_format or detect_format(path)
+    handle = _open(path)
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(handle)
+            if not reader.fieldnames or 'sku' not in reader.fieldnames:
+                raise RecordError('CSV must have a sku column')
+            rows = ((reader.line_num, row) for row in reader)
+        else:
+            rows = ((line, raw) for line, raw in enumerate(handle, start=1) if raw.strip())
+
+        for line, row in rows:
+            try:
+                if file_format != 'csv':
+                    row = json.loads(row)
+                    if not isinstance(row, dict):
+                        raise RecordError('Expected a JSON object')
+                yield line, normalize(row)
+            except RecordError as e:
+                yield line, e
+            except json.JSONDecodeError as e:
+                yield line, RecordError(f"Invalid JSON: {e}")
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+# ============================================================================
+# Importing
+# ============================================================================
+
+def _clean(model, name: str, value):
+    """Convert and validate a raw value for a model field"""
+    field = model._meta.get_field(name)
+    if isinstance(value, str):
+        value = value.strip()
+        if value == '' and not isinstance(field, (models.CharField, models.TextField)):
+            return None if field.null else field.get_default()
+        if isinstance(field, models.BooleanField):
+            if value.lower() in TRUE_VALUES:
+                return True
+            if value.lower() in FALSE_VALUES:
+                return False
+        if isinstance(field, models.JSONField) and value:
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                raise RecordError(f"{name}: invalid JSON")
+    if value is None and not field.null:
+        return field.get_default()
+    try:
+        value = field.clean(value, None)
+    except ValidationError as e:
+        raise RecordError(f"{name}: {'; '.join(e.messages)}")
+    if isinstance(field, models.DateTimeField) and value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _validate(model, values: Dict[str, Any], fields: List[str]):
+    """Check values without applying them, so a row is rejected as a whole"""
+    for name in fields:
+        if name in values:
+            _clean(model, name, values[name])
+
+
+def _apply(obj, values: Dict[str, Any], fields: List[str]):
+    for name in fields:
+        if name in values:
+            setattr(obj, name, _clean(type(obj), name, values[name]))
+
+
+class CatalogImporter:
+    """
+    Imports batches of normalized records
+
+    Each batch runs in one transaction (rolled back in dry-run mode). Rows
+    with invalid data are skipped and recorded in `errors`; a batch that
+    fails in the database is skipped as a whole.
+    """
+
+    def __init__(self, create_missing: bool = False, dry_run: bool = False):
+        self.create_missing = create_missing
+        self.dry_run = dry_run
+        self.brands = self._lookup(Brand)
+        self.categories = self._lookup(Category)
+        self.stats = {'products': 0, 'prices': 0, 'inventory': 0, 'variants': 0}
+        self.errors: List[Tuple[int, str]] = []
+        # SKUs of products rolled back in earlier dry-run batches
+        self.validated_skus = set()
+        self._created = 0
+
+    @staticmethod
+    def _lookup(model) -> Dict[str, int]:
+        """IDs by slug and by lower-case name"""
+        lookup = {}
+        for pk, name, slug in model.objects.values_list('id', 'name', 'slug'):
+            lookup.setdefault(name.lower(), pk)
+            lookup[slug] = pk
+        return lookup
+
+    def _resolve(self, model, lookup: Dict[str, int], value: str) -> Optional[int]:
+        if not value:
+            return None
+        pk = lookup.get(value) or lookup.get(value.lower())
+        if pk is None and self.create_missing:
+            obj = model(name=value, slug=slugify(value))
+            obj.save()
+            self._created += 1
+            lookup[obj.slug] = lookup[value.lower()] = pk = obj.pk
+        if pk is None:
+            raise RecordError(f"Unknown {model._meta.verbose_name} {value!r}")
+        return pk
+
+    def import_batch(self, batch: List[Tuple[int, Dict[str, Any]]]):
+        """Import one batch of (line number, record) pairs"""
+        stats = dict.fromkeys(self.stats, 0)
+        errors = []
+        created = self._created
+        try:
+            with transaction.atomic():
+                self._import(batch, stats, errors)
+                if self.dry_run:
+                    transaction.set_rollback(True)
+        except Exception as e:
+            first, last = batch[0][0], batch[-1][0]
+            self.errors.append((first, f"Lines {first}-{last} not imported: {e}"))
+            stats, errors = {}, []
+        # Brands and categories created in a rolled back batch are gone
+        if self._created != created and (self.dry_run or not stats):
+            self.brands, self.categories = self._lookup(Brand), self._lookup(Category)
+        for key, count in stats.items():
+            self.stats[key] += count
+        self.errors.extend(errors)
+
+    def _import(self, batch, stats, errors):
+        # Later rows for the same SKU win
+        products = {}
+        variant_rows = []
+        for line, record in batch:
+            if record['parent_sku']:
+                variant_rows.append((line, record))
+            else:
+                products[record['sku']] = (line, record)
+
+        product_ids = self._import_products(products, stats, errors)
+        if self.dry_run:
+            self.validated_skus.update(product_ids)
+
+        parents = {record['parent_sku'] for _, record in variant_rows} - set(product_ids)
+        if parents:
+            product_ids.update(Product.objects.filter(sku__in=parents).values_list('sku', 'id'))
+
+        prices, inventories, variants = [], [], []
+        for sku, (line, record) in products.items():
+            if sku not in product_ids:
+                continue
+            prices += [(line, product_ids[sku], price) for price in record['prices']]
+            if record['inventory']:
+                inventories.append((line, product_ids[sku], record['inventory']))
+            variants += [(line, product_ids[sku], variant) for variant in record['variants']]
+        for line, record in variant_rows:
+            parent_sku = record['parent_sku']
+            if parent_sku not in product_ids:
+                if parent_sku in self.validated_skus:
+                    # Dry run: the parent was only validated in an earlier batch
+                    try:
+                        _validate(ProductVariant, record['variants'][0], VARIANT_FIELDS)
+                        stats['variants'] += 1
+                    except RecordError as e:
+                        errors.append((line, f"{record['sku']}: {e}"))
+                else:
+                    errors.append((line, f"Unknown parent product {parent_sku!r}"))
+                continue
+            variants += [(line, product_ids[parent_sku], variant) for variant in record['variants']]
+
+        priced = self._import_prices(prices, stats, errors)
+        self._import_inventory(inventories, stats, errors)
+        self._import_variants(variants, stats, errors)
+
+        # bulk_create sends no signals
+        sync_active_prices(priced)
+        touched = set(product_ids.values())
+        if touched:
+            invalidate_on_commit(PRODUCTS_TAG, *[f'product:{product_id}' for product_id in touched])
+
+    def _import_products(self, products, stats, errors) -> Dict[str, int]:
+        existing = {product.sku: product for product in Product.objects.filter(sku__in=products)}
+        objs = []
+        for sku, (line, record) in products.items():
+            product = existing.get(sku) or Product(sku=sku)
+            fields = {name: value for name, value in record['fields'].items() if name != 'slug' or value}
+            try:
+                if record['brand'] or product.pk is None:
+                    product.brand_id = self._resolve(Brand, self.brands, record['brand'])
+                if record['category'] or product.pk is None:
+                    product.category_id = self._resolve(Category, self.categories, record['category'])
+                if product.brand_id is None or product.category_id is None:
+                    raise RecordError("New products need a brand and a category")
+                _apply(product, fields, PRODUCT_FIELDS)
+                if not product.name:
+                    raise RecordError("Missing name")
+                if not product.slug:
+                    product.slug = slugify(product.name)
+                for price in record['prices']:
+                    _validate(ProductPrice, price, ['price_type', 'min_quantity', *PRICE_FIELDS])
+                _validate(Inventory, record['inventory'] or {}, INVENTORY_FIELDS)
+                for variant in record['variants']:
+                    _validate(ProductVariant, variant, VARIANT_FIELDS)
+            except RecordError as e:
+                errors.append((line, f"{sku}: {e}"))
+                continue
+            objs.append(product)
+
+        # Keep slugs unique: clashes get the SKU appended
+        taken = set(
+            Product.objects.filter(slug__in=[product.slug for product in objs])
+            .exclude(sku__in=[product.sku for product in objs]).values_list('slug', flat=True)
+        )
+        for product in objs:
+            if product.slug in taken:
+                product.slug = f'{product.slug}-{slugify(product.sku)}'[:255]
+            taken.add(product.slug)
+
+        Product.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=['brand', 'category', *PRODUCT_FIELDS, 'updated_at'],
+        )
+        stats['products'] += len(objs)
+        return dict(Product.objects.filter(sku__in=[product.sku for product in objs]).values_list('sku', 'id'))
+
+    def _import_prices(self, prices, stats, errors) -> set:
+        product_ids = {product_id for _, product_id, _ in prices}
+        existing = {
+            (price.product_id, price.price_type, price.min_quantity): price
+            for price in ProductPrice.objects.filter(product_id__in=product_ids)
+        }
+        objs = {}
+        for line, product_id, values in prices:
+            try:
+                price_type = _clean(ProductPrice, 'price_type', values.get('price_type') or 'RETAIL')
+                min_quantity = _clean(ProductPrice, 'min_quantity', values.get('min_quantity') or 1)
+                key = (product_id, price_type, min_quantity)
+                price = objs.get(key) or existing.get(key) or ProductPrice(
+                    product_id=product_id, price_type=price_type, min_quantity=min_quantity
+                )
+                _apply(price, {name: value for name, value in values.items() if value is not None}, PRICE_FIELDS)
+                if price.base_price is None:
+                    raise RecordError("Missing price")
+            except RecordError as e:
+                errors.append((line, f"Price: {e}"))
+                continue
+            objs[key] = price
+
+        ProductPrice.objects.bulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            unique_fields=['product', 'price_type', 'min_quantity'],
+            update_fields=[*PRICE_FIELDS, 'updated_at'],
+        )
+        stats['prices'] += len(objs)
+        return {product_id for product_id, _, _ in objs}
+
+    def _import_inventory(self, inventories, stats, errors):
+        existing = {
+            inventory.product_id: inventory
+            for inventory in Inventory.objects.filter(product_id__in=[product_id for _, product_id, _ in inventories])
+        }
+        objs = {}
+        for line, product_id, values in inventories:
+            inventory = objs.get(product_id) or existing.get(product_id) or Inventory(product_id=product_id)
+            try:
+                _apply(inventory, values, INVENTORY_FIELDS)
+            except RecordError as e:
+                errors.append((line, f"Inventory: {e}"))
+                continue
+            objs[product_id] = inventory
+
+        Inventory.objects.bulk_create(
+            list(objs.values()),
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=[*INVENTORY_FIELDS, 'updated_at'],
+        )
+        stats['inventory'] += len(objs)
+
+    def _import_variants(self, variants, stats, errors):
+        existing = {
+            variant.sku: variant
+            for variant in ProductVariant.objects.filter(sku__in=[values.get('sku') for _, _, values in variants])
+        }
+        objs = {}
+        for line, product_id, values in variants:
+            sku = str(values.get('sku') or '').strip()
+            try:
+                if not sku:
+                    raise RecordError("Missing variant sku")
+                variant = objs.get(sku, (None, None))[0] or existing.get(sku) or ProductVariant(sku=sku)
+                if variant.pk and variant.product_id != product_id:
+                    raise RecordError("SKU belongs to another product's variant")
+                variant.product_id = product_id
+                _apply(variant, values, VARIANT_FIELDS)
+                if variant.price is None:
+                    raise RecordError("Missing variant price")
+            except RecordError as e:
+                errors.append((line, f"{sku or 'Variant'}: {e}"))
+                continue
+            objs[sku] = (variant, values['options'])
+
+        ProductVariant.objects.bulk_create(
+            [variant for variant, _ in objs.values()],
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=['product', *VARIANT_FIELDS, 'updated_at'],
+        )
+        stats['variants'] += len(objs)
+
+        with_options = {sku: (variant, options) for sku, (variant, options) in objs.items() if options}
+        if with_options:
+            self._link_options(with_options)
+
+    def _link_options(self, variants):
+        """Replace the option values of the variants (options and values created as needed)"""
+        variant_ids = dict(ProductVariant.objects.filter(sku__in=variants).values_list('sku', 'id'))
+        product_ids = {variant.product_id for variant, _ in variants.values()}
+
+        options = {
+            (option.product_id, option.name): option
+            for option in ProductVariantOption.objects.filter(product_id__in=product_ids)
+        }
+        new_options = {}
+        for variant, selected in variants.values():
+            for name in selected:
+                key = (variant.product_id, name)
+                if key not in options and key not in new_options:
+                    new_options[key] = ProductVariantOption(product_id=variant.product_id, name=name)
+        ProductVariantOption.objects.bulk_create(new_options.values())
+        options.update(new_options)
+
+        values = {
+            (value.option_id, value.value): value
+            for value in ProductVariantOptionValue.objects.filter(option__product_id__in=product_ids)
+        }
+        new_values = {}
+        links = []
+        for sku, (variant, selected) in variants.items():
+            for name, selected_value in selected.items():
+                key = (options[(variant.product_id, name)].id, selected_value)
+                value = values.get(key) or new_values.get(key)
+                if value is None:
+                    value = new_values[key] = ProductVariantOptionValue(option_id=key[0], value=selected_value)
+                links.append((variant_ids[sku], value))
+        ProductVariantOptionValue.objects.bulk_create(new_values.values())
+
+        wanted = {(variant_id, value.id) for variant_id, value in links}
+        current = {
+            (variant_id, option_value_id): pk
+            for pk, variant_id, option_value_id in ProductVariantValue.objects.filter(
+                variant_id__in=variant_ids.values()
+            ).values_list('id', 'variant_id', 'option_value_id')
+        }
+        stale = [pk for link, pk in current.items() if link not in wanted]
+        if stale:
+            ProductVariantValue.objects.filter(id__in=stale).delete()
+        ProductVariantValue.objects.bulk_create([
+            ProductVariantValue(variant_id=variant_id, option_value_id=option_value_id)
+            for variant_id, option_value_id in wanted - set(current)
+        ])
@@ -0,0 +1,163 @@
+"""
+Catalog cache invalidation bus
+Tells every worker process which catalog cache tags changed, so each can
+evict its local tier. Uses PostgreSQL LISTEN/NOTIFY, or polls the
+CatalogInvalidation table on other databases.
+
+Without a shared default cache (no REDIS_URL: LocMemCache per process) the
+tag versions live in each process too, so the listener bumps them as well.
+
+Workers start the listener from the gunicorn post_worker_init hook
+(deployment/gunicorn_config.py). Only processes running it keep local
+entries for CATALOG_CACHE_BUS_LOCAL_TTL; all others (runserver, ASGI,
+management commands) fall back to the short CATALOG_CACHE_LOCAL_TTL.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Iterable
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections, connection, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'catalog_invalidation'
+
+# NOTIFY payloads are limited to 8000 bytes
+MAX_PAYLOAD_BYTES = 7000
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _uses_notify() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def _cache_is_per_process() -> bool:
+    """Whether the default ("shared") cache is really this process' own"""
+    return isinstance(caches['default'], LocMemCache)
+
+
+def _chunks(tags):
+    chunk, size = [], 2
+    for tag in tags:
+        if chunk and size + len(tag) + 4 > MAX_PAYLOAD_BYTES:
+            yield chunk
+            chunk, size = [], 2
+        chunk.append(tag)
+        size += len(tag) + 4
+    if chunk:
+        yield chunk
+
+
+def publish(tags: Iterable[str]):
+    """Send invalidated tags to every worker (call after commit)"""
+    tags = sorted(set(tags))
+    if not tags or not getattr(settings, 'CATALOG_CACHE_BUS_ENABLED', True):
+        return
+
+    try:
+        if _uses_notify():
+            with connection.cursor() as cursor:
+                for chunk in _chunks(tags):
+                    cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(chunk)])
+        else:
+            from .models import CatalogInvalidation
+            CatalogInvalidation.objects.create(tags=tags)
+    except Exception as e:
+        # Other workers fall back to their local TTL
+        logger.error(f"Failed to publish catalog invalidation: {str(e)}", exc_info=True)
+
+
+class InvalidationListener(threading.Thread):
+    """Background thread evicting this process' local catalog entries"""
+
+    def __init__(self, cache):
+        super().__init__(name='catalog-invalidation', daemon=True)
+        self.cache = cache
+        self.poll_interval = getattr(settings, 'CATALOG_CACHE_BUS_POLL_INTERVAL', 1.0)
+        self.retention = timedelta(seconds=getattr(settings, 'CATALOG_CACHE_BUS_RETENTION', 3600))
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def evict(self, tags):
+        if _cache_is_per_process():
+            # The publisher's version bump never reached this process' cache
+            self.cache.invalidate_tags(*tags)
+            logger.debug(f"Invalidated catalog tags {tags}")
+            return
+        evicted = self.cache.local.evict_tags(tags)
+        logger.debug(f"Evicted {evicted} local catalog entries for {tags}")
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                # Messages may have been missed while disconnected
+                self.cache.local.clear()
+                if _uses_notify():
+                    self.listen()
+                else:
+                    self.poll()
+            except Exception as e:
+                logger.error(f"Catalog invalidation listener failed, reconnecting: {str(e)}", exc_info=True)
+                connections.close_all()
+                self._stopped.wait(5)
+
+    def listen(self):
+        wrapper = connections.create_connection('default')
+        try:
+            wrapper.ensure_connection()
+            wrapper.set_autocommit(True)
+            conn = wrapper.connection
+            conn.execute(f'LISTEN {CHANNEL}')
+            while not self._stopped.is_set():
+                for notify in conn.notifies(timeout=self.poll_interval):
+                    self.evict(json.loads(notify.payload))
+        finally:
+            wrapper.close()
+
+    def poll(self):
+        from .models import CatalogInvalidation
+
+        last_id = CatalogInvalidation.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        pruned_at = 0.0
+        while not self._stopped.wait(self.poll_interval):
+            close_old_connections()
+            for invalidation in CatalogInvalidation.objects.filter(id__gt=last_id):
+                self.evict(invalidation.tags)
+                last_id = invalidation.id
+
+            if time.monotonic() - pruned_at > 60:
+                CatalogInvalidation.objects.filter(created_at__lt=timezone.now() - self.retention).delete()
+                pruned_at = time.monotonic()
+
+
+def listener_running() -> bool:
+    """Whether this process' listener is evicting local entries"""
+    listener = _listener
+    return listener is not None and listener.pid == os.getpid() and listener.is_alive()
+
+
+def start_listener():
+    """Start this process' listener (once per process, safe after fork)"""
+    global _listener
+    from .cache import catalog_cache
+
+    if not getattr(settings, 'CATALOG_CACHE_BUS_ENABLED', True):
+        return None
+
+    with _listener_lock:
+        if _listener is None or _listener.pid != os.getpid() or not _listener.is_alive():
+            _listener = InvalidationListener(catalog_cache)
+            _listener.pid = os.getpid()
+            _listener.start()
+    return _listener
@@ -0,0 +1,75 @@
+"""
+Django management command to apply price changes at their valid_from/valid_until times
+Run: python manage.py activate_scheduled_prices --loop (or from cron every minute)
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from products.cache import PRODUCTS_TAG, invalidate
+from products.models import Product
+from products.pricing import next_price_change, scheduled_product_ids, sync_active_prices
+
+
+class Command(BaseCommand):
+    help = "Activate and expire scheduled prices (ActiveProductPrice) and invalidate the catalog cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-sync every product, not only those with scheduled prices',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, waking up at each price window boundary',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=60.0,
+            help='Longest wait between runs with --loop (seconds), so new schedules are picked up',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show which products would change without making changes',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n🔍 DRY RUN - No changes will be made\n'))
+
+        while True:
+            self.run_once(options)
+            if not options['loop'] or options['dry_run']:
+                break
+
+            wait = options['max_sleep']
+            upcoming = next_price_change()
+            if upcoming:
+                wait = min(wait, max((upcoming - timezone.now()).total_seconds(), 0) + 0.5)
+            try:
+                time.sleep(wait)
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('\nStopping...'))
+                break
+            close_old_connections()
+
+    def run_once(self, options):
+        product_ids = None if options['all'] else scheduled_product_ids()
+        changed = sync_active_prices(product_ids, dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            for product in Product.objects.filter(id__in=changed).order_by('id'):
+                self.stdout.write(f'  - ID {product.id}: {product.name} (SKU: {product.sku})')
+
+        if changed and not options['dry_run']:
+            invalidate(PRODUCTS_TAG, *[f'product:{product_id}' for product_id in changed])
+
+        if changed or not options['loop']:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {timezone.now():%Y-%m-%d %H:%M:%S} Prices changed for {len(changed)} product(s)'
+            ))
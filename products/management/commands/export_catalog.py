@@ -0,0 +1,85 @@
+"""
+Django management command to export the catalog for ERP sync and product feeds
+Run: python manage.py export_catalog catalog.jsonl --base-url https://api.example.com
+
+Writes JSONL or CSV (optionally gzipped, '-' for stdout) in the format
+import_catalog reads, plus export-only fields (retail_price,
+available_quantity, image_url).
+"""
+import gzip
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_export import CatalogWriter, iter_records
+from products.catalog_import import detect_format
+
+
+class Command(BaseCommand):
+    help = "Export products with prices, inventory, variants and image URLs as JSONL or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Output file ('-' for stdout; .gz is compressed)")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Products fetched (and prefetched) per database round trip',
+        )
+        parser.add_argument(
+            '--active-only',
+            action='store_true',
+            help='Only export active products',
+        )
+        parser.add_argument(
+            '--base-url',
+            default='',
+            help='Prefix for image URLs (default: relative media URLs)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or ('jsonl' if path == '-' else detect_format(path))
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        # Progress goes to stderr when the export itself goes to stdout
+        log = self.stderr if path == '-' else self.stdout
+
+        try:
+            if path == '-':
+                handle = sys.stdout
+            elif path.endswith('.gz'):
+                handle = gzip.open(path, 'wt', encoding='utf-8', newline='')
+            else:
+                handle = open(path, 'w', encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot write {path}: {e}')
+
+        started = time.monotonic()
+        count = 0
+        try:
+            writer = CatalogWriter(handle, file_format)
+            records = iter_records(
+                active_only=options['active_only'],
+                chunk_size=options['chunk_size'],
+                base_url=options['base_url'],
+            )
+            for record in records:
+                writer.write(record)
+                count += 1
+                if count % options['chunk_size'] == 0:
+                    elapsed = time.monotonic() - started
+                    log.write(f'  {count} product(s) - {count / elapsed if elapsed else 0:.0f} products/s')
+        finally:
+            if handle is not sys.stdout:
+                handle.close()
+
+        log.write(self.style.SUCCESS(
+            f'✅ Exported {count} product(s) as {file_format.upper()} in {time.monotonic() - started:.1f}s'
+        ))
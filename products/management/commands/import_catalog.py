@@ -0,0 +1,98 @@
+"""
+Django management command to import products, prices, stock and variants in bulk
+Run: python manage.py import_catalog catalog.csv --batch-size 1000
+
+Reads CSV or JSONL (optionally gzipped, '-' for stdin); see
+products/catalog_import.py for the columns.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_import import CatalogImporter, RecordError, read_records
+
+
+class Command(BaseCommand):
+    help = "Create or update catalog products from a CSV or JSONL file (upserts by SKU)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV or JSONL file ('-' for stdin)")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows written per transaction',
+        )
+        parser.add_argument(
+            '--create-missing',
+            action='store_true',
+            help='Create brands and categories that do not exist yet (by name)',
+        )
+        parser.add_argument(
+            '--max-errors',
+            type=int,
+            default=50,
+            help='Rejected rows to list individually',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate and import inside transactions that are rolled back',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['file'] == '-' and not options['format']:
+            raise CommandError('--format is required when reading from stdin')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\n🔍 DRY RUN - No changes will be made\n'))
+
+        importer = CatalogImporter(create_missing=options['create_missing'], dry_run=options['dry_run'])
+        started = time.monotonic()
+        rows = 0
+        batch = []
+
+        try:
+            for line, record in read_records(options['file'], options['format']):
+                rows += 1
+                if isinstance(record, RecordError):
+                    importer.errors.append((line, str(record)))
+                    continue
+                batch.append((line, record))
+                if len(batch) >= options['batch_size']:
+                    importer.import_batch(batch)
+                    batch = []
+                    self.report_progress(importer, rows, started)
+            if batch:
+                importer.import_batch(batch)
+        except RecordError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["file"]}: {e}')
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nStopped, batches imported so far are kept'))
+
+        for line, message in sorted(importer.errors)[:options['max_errors']]:
+            self.stdout.write(self.style.ERROR(f'✗ Line {line}: {message}'))
+        if len(importer.errors) > options['max_errors']:
+            self.stdout.write(self.style.ERROR(f'✗ ... and {len(importer.errors) - options["max_errors"]} more'))
+
+        stats = importer.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {rows} row(s) in {time.monotonic() - started:.1f}s: {stats['products']} product(s), "
+            f"{stats['prices']} price(s), {stats['inventory']} inventory row(s), {stats['variants']} variant(s)"
+            f"{' validated' if options['dry_run'] else ' imported'}, {len(importer.errors)} error(s)"
+        ))
+
+    def report_progress(self, importer, rows, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'  {rows} row(s), {importer.stats["products"]} product(s), {len(importer.errors)} error(s) '
+            f'- {rows / elapsed if elapsed else 0:.0f} rows/s'
+        )
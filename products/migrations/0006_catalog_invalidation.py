@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-19 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_brand_brand_is_active_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogInvalidation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tags', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'catalog_invalidations',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='unit_type',
+            field=models.CharField(choices=[('KG', 'Kilogram'), ('GRAM', 'Gram'), ('LITER', 'Liter'), ('BOTTLE', 'Bottle'), ('PIECE', 'Piece'), ('BOX', 'Box'), ('PACK', 'Pack')], default='PIECE', max_length=20),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-19 05:54
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_category_id'))
+
+    def path_of(category_id, seen=()):
+        parent_id = parents[category_id]
+        if parent_id is None or parent_id in seen:
+            return f'{category_id}/'
+        return f'{path_of(parent_id, seen + (category_id,))}{category_id}/'
+
+    for category_id in parents:
+        path = path_of(category_id)
+        Category.objects.filter(id=category_id).update(path=path, depth=path.count('/') - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_catalog_invalidation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
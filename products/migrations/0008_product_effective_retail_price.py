@@ -0,0 +1,39 @@
+# Generated by Django 5.1 on 2026-10-19 05:56
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def fill_effective_retail_price(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductPrice = apps.get_model('products', 'ProductPrice')
+    current = ProductPrice.objects.filter(
+        product=models.OuterRef('pk'), price_type='RETAIL', is_active=True
+    ).filter(
+        models.Q(valid_from__isnull=True) | models.Q(valid_from__lte=Now()),
+        models.Q(valid_until__isnull=True) | models.Q(valid_until__gt=Now()),
+    ).order_by('min_quantity').annotate(effective=Coalesce('sale_price', 'base_price'))
+    Product.objects.update(effective_retail_price=models.Subquery(
+        current.values('effective')[:1],
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_retail_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'effective_retail_price'], name='product_active_price_idx'),
+        ),
+        migrations.RunPython(fill_effective_retail_price, migrations.RunPython.noop),
+    ]
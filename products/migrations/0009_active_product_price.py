@@ -0,0 +1,70 @@
+# Generated by Django 5.1 on 2026-10-19 05:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_active_prices(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductPrice = apps.get_model('products', 'ProductPrice')
+    ActiveProductPrice = apps.get_model('products', 'ActiveProductPrice')
+    now = timezone.now()
+    prices = ProductPrice.objects.filter(is_active=True).filter(
+        models.Q(valid_from__isnull=True) | models.Q(valid_from__lte=now),
+        models.Q(valid_until__isnull=True) | models.Q(valid_until__gt=now),
+    )
+    ActiveProductPrice.objects.bulk_create([
+        ActiveProductPrice(
+            price_id=price.id,
+            product_id=price.product_id,
+            price_type=price.price_type,
+            min_quantity=price.min_quantity,
+            max_quantity=price.max_quantity,
+            base_price=price.base_price,
+            sale_price=price.sale_price,
+            unit_price=price.sale_price or price.base_price,
+            currency=price.currency,
+            valid_until=price.valid_until,
+        )
+        for price in prices
+    ])
+    Product.objects.update(effective_retail_price=models.Subquery(
+        ActiveProductPrice.objects.filter(
+            product=models.OuterRef('pk'), price_type='RETAIL'
+        ).order_by('min_quantity').values('unit_price')[:1],
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_effective_retail_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiveProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_type', models.CharField(max_length=20)),
+                ('min_quantity', models.IntegerField(default=1)),
+                ('max_quantity', models.IntegerField(blank=True, null=True)),
+                ('base_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('sale_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('unit_price', models.DecimalField(decimal_places=2, help_text='Sale price if set, otherwise base price', max_digits=10)),
+                ('currency', models.CharField(default='AED', max_length=3)),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('activated_at', models.DateTimeField(auto_now=True)),
+                ('price', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='active', to='products.productprice')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='active_prices', to='products.product')),
+            ],
+            options={
+                'db_table': 'active_product_prices',
+                'ordering': ['price_type', 'min_quantity'],
+                'unique_together': {('product', 'price_type', 'min_quantity')},
+            },
+        ),
+        migrations.RunPython(fill_active_prices, migrations.RunPython.noop),
+    ]
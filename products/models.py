@@ -1,4 +1,6 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 
 
@@ -11,6 +13,9 @@ class Category(models.Model):
     image = models.ImageField(upload_to='categories/', blank=True)
     is_active = models.BooleanField(default=True)
     display_order = models.IntegerField(default=0)
+    # Materialized path: IDs from the root, e.g. "3/12/" (maintained in save)
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -21,12 +26,38 @@ class Category(models.Model):
         indexes = [
             models.Index(fields=['is_active'], name='category_is_active_idx'),
             models.Index(fields=['parent_category', 'is_active'], name='category_parent_active_idx'),
+            # varchar_pattern_ops so LIKE 'prefix%' can use the index on PostgreSQL
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
         ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_path()
+
+    def update_path(self):
+        """Recompute this category's path and depth, and its descendants' when it moved"""
+        parent_path = ''
+        if self.parent_category_id:
+            parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_category_id)
+            if str(self.pk) in parent_path.split('/'):
+                raise ValidationError('A category cannot be moved under one of its own subcategories')
+
+        old_path = self.path
+        path = f'{parent_path}{self.pk}/'
+        depth = path.count('/') - 1
+        if path == old_path and depth == self.depth:
+            return
+
+        Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(models.Value(path), Substr('path', len(old_path) + 1)),
+                depth=models.F('depth') + (depth - self.depth),
+            )
+        self.path, self.depth = path, depth
 
     def __str__(self):
         return self.name
@@ -87,6 +118,9 @@ class Product(models.Model):
     unit_type = models.CharField(max_length=20, choices=UNIT_TYPE_CHOICES, default='PIECE')
     is_active = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
+    # Current single-unit RETAIL price (sale price if set), maintained from
+    # ActiveProductPrice by products.pricing for sorting and filtering
+    effective_retail_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
     meta_title = models.CharField(max_length=255, blank=True)
     meta_description = models.CharField(max_length=500, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -102,6 +136,7 @@ class Product(models.Model):
             models.Index(fields=['is_active', 'featured'], name='product_active_featured_idx'),
             models.Index(fields=['category', 'is_active'], name='product_category_active_idx'),
             models.Index(fields=['brand', 'is_active'], name='product_brand_active_idx'),
+            models.Index(fields=['is_active', 'effective_retail_price'], name='product_active_price_idx'),
         ]
 
     def save(self, *args, **kwargs):
@@ -199,6 +234,35 @@ class ProductPrice(models.Model):
         return self.sale_price if self.sale_price else self.base_price
 
 
+class ActiveProductPrice(models.Model):
+    """
+    Prices currently in effect (active, inside valid_from/valid_until)
+    
+    Precomputed from ProductPrice by products.pricing whenever prices change
+    and by the activate_scheduled_prices job at window boundaries. Carts,
+    orders and the listing columns read prices from here.
+    """
+    price = models.OneToOneField(ProductPrice, on_delete=models.CASCADE, related_name='active')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='active_prices')
+    price_type = models.CharField(max_length=20)
+    min_quantity = models.IntegerField(default=1)
+    max_quantity = models.IntegerField(null=True, blank=True)
+    base_price = models.DecimalField(max_digits=10, decimal_places=2)
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Sale price if set, otherwise base price")
+    currency = models.CharField(max_length=3, default='AED')
+    valid_until = models.DateTimeField(null=True, blank=True)
+    activated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'active_product_prices'
+        ordering = ['price_type', 'min_quantity']
+        unique_together = ['product', 'price_type', 'min_quantity']
+
+    def __str__(self):
+        return f"{self.product_id} - {self.price_type} x{self.min_quantity}: {self.unit_price} {self.currency}"
+
+
 class Inventory(models.Model):
     """Stock management"""
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='inventory')
@@ -358,7 +422,11 @@ class ProductVariant(models.Model):
         return self.sale_price if self.sale_price else self.price
     
     def __str__(self):
-        option_values = ', '.join([vo.value for vo in self.option_values.all()])
+        if 'option_values' in getattr(self, '_prefetched_objects_cache', {}):
+            values = [vv.option_value.value for vv in self.option_values.all()]
+        else:
+            values = self.option_values.values_list('option_value__value', flat=True)
+        option_values = ', '.join(values)
         return f"{self.product.name} - {option_values} ({self.sku})"
 
 
@@ -381,3 +449,19 @@ class ProductVariantValue(models.Model):
     
     def __str__(self):
         return f"{self.variant.sku} - {self.option_value}"
+
+
+class CatalogInvalidation(models.Model):
+    """
+    Catalog cache invalidations, polled by workers when the database
+    has no LISTEN/NOTIFY (SQLite)
+    """
+    tags = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'catalog_invalidations'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.id}: {', '.join(self.tags)}"
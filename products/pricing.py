@@ -0,0 +1,215 @@
+"""
+Product pricing
+Precomputes the prices in effect (ActiveProductPrice) from ProductPrice and
+keeps Product.effective_retail_price in step with them, so carts, orders
+and price sorting/filtering all read the same prices. Quantity tiers
+(min_quantity/max_quantity) are resolved by PriceTiers.
+"""
+from bisect import bisect_right
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import ActiveProductPrice, Product, ProductPrice, ProductVariant
+
+# ProductPrice fields copied to ActiveProductPrice
+ACTIVE_PRICE_FIELDS = (
+    'product_id', 'price_type', 'min_quantity', 'max_quantity', 'base_price', 'sale_price', 'currency', 'valid_until'
+)
+
+
+def current_prices(price_type: str = None, now=None):
+    """Active prices whose valid_from/valid_until window contains `now`"""
+    now = now or timezone.now()
+    queryset = ProductPrice.objects.filter(is_active=True).filter(
+        models.Q(valid_from__isnull=True) | models.Q(valid_from__lte=now),
+        models.Q(valid_until__isnull=True) | models.Q(valid_until__gt=now),
+    )
+    if price_type:
+        queryset = queryset.filter(price_type=price_type)
+    return queryset
+
+
+def scheduled_product_ids():
+    """Products with prices that start or end at a set time"""
+    return set(
+        ProductPrice.objects.filter(
+            models.Q(valid_from__isnull=False) | models.Q(valid_until__isnull=False)
+        ).values_list('product_id', flat=True)
+    )
+
+
+def next_price_change(now=None):
+    """Time of the next valid_from/valid_until boundary, or None"""
+    now = now or timezone.now()
+    upcoming = ProductPrice.objects.filter(is_active=True).aggregate(
+        starts=models.Min('valid_from', filter=models.Q(valid_from__gt=now)),
+        ends=models.Min('valid_until', filter=models.Q(valid_until__gt=now)),
+    )
+    times = [time for time in upcoming.values() if time]
+    return min(times) if times else None
+
+
+def _active_values(price) -> dict:
+    values = {field: getattr(price, field) for field in ACTIVE_PRICE_FIELDS}
+    values['unit_price'] = price.get_effective_price()
+    return values
+
+
+def sync_active_prices(product_ids: Optional[Iterable[int]] = None, now=None, dry_run: bool = False) -> Set[int]:
+    """
+    Bring ActiveProductPrice in line with the prices in effect now
+
+    Rows are only written where something changed, and
+    Product.effective_retail_price is refreshed for those products (and
+    always for explicitly passed products: a deleted ProductPrice has
+    already taken its active row with it). Doesn't send signals; callers
+    invalidate the catalog cache for the returned products.
+
+    Returns:
+        IDs of products whose active prices changed
+    """
+    prices = current_prices(now=now)
+    active = ActiveProductPrice.objects.all()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        prices = prices.filter(product_id__in=product_ids)
+        active = active.filter(product_id__in=product_ids)
+
+    wanted = {price.id: price for price in prices}
+    existing = {row.price_id: row for row in active}
+
+    # Changed rows are replaced rather than updated, so tiers can swap
+    # without tripping the unique (product, price_type, min_quantity)
+    stale = [row for price_id, row in existing.items() if price_id not in wanted]
+    fresh = []
+    for price_id, price in wanted.items():
+        values = _active_values(price)
+        row = existing.get(price_id)
+        if row is not None and all(getattr(row, field) == value for field, value in values.items()):
+            continue
+        if row is not None:
+            stale.append(row)
+        fresh.append(ActiveProductPrice(price_id=price_id, **values))
+
+    changed_products = {row.product_id for row in stale + fresh}
+    refresh_ids = changed_products if product_ids is None else set(product_ids)
+    if dry_run or not refresh_ids:
+        return changed_products
+
+    with transaction.atomic():
+        if stale:
+            ActiveProductPrice.objects.filter(id__in=[row.id for row in stale]).delete()
+        ActiveProductPrice.objects.bulk_create(fresh)
+        refresh_effective_retail_prices(refresh_ids)
+
+    return changed_products
+
+
+def get_active_price(product_id: int, price_type: str = 'RETAIL') -> Optional[ActiveProductPrice]:
+    """Single-unit (lowest tier) price in effect for a product, or None"""
+    return ActiveProductPrice.objects.filter(
+        product_id=product_id, price_type=price_type
+    ).order_by('min_quantity').first()
+
+
+class PriceTiers:
+    """
+    Quantity tiers of one product and price type
+
+    Of the tiers covering the quantity (min_quantity up to max_quantity,
+    if set) the one with the highest min_quantity applies, found by binary
+    search. Quantities no tier covers (below the lowest tier, or above a
+    capped tier) get the lowest tier's price.
+    """
+
+    def __init__(self, tiers: Iterable[ActiveProductPrice]):
+        self.tiers = sorted(tiers, key=lambda tier: tier.min_quantity)
+        self.min_quantities = [tier.min_quantity for tier in self.tiers]
+
+    def __bool__(self):
+        return bool(self.tiers)
+
+    def tier_for(self, quantity: int) -> Optional[ActiveProductPrice]:
+        if not self.tiers:
+            return None
+        index = bisect_right(self.min_quantities, quantity) - 1
+        while index >= 0:
+            tier = self.tiers[index]
+            if tier.max_quantity is None or quantity <= tier.max_quantity:
+                return tier
+            index -= 1
+        return self.tiers[0]
+
+    def unit_price(self, quantity: int) -> Optional[Decimal]:
+        """Unit price for buying `quantity`, or None without prices"""
+        tier = self.tier_for(quantity)
+        return tier.unit_price if tier else None
+
+
+def load_price_tiers(product_ids: Iterable[int], price_type: str = 'RETAIL') -> Dict[int, PriceTiers]:
+    """Tiers in effect for several products, in one query (empty PriceTiers when none)"""
+    product_ids = set(product_ids)
+    rows = {product_id: [] for product_id in product_ids}
+    for tier in ActiveProductPrice.objects.filter(product_id__in=product_ids, price_type=price_type):
+        rows[tier.product_id].append(tier)
+    return {product_id: PriceTiers(tiers) for product_id, tiers in rows.items()}
+
+
+def reprice_items(items: List, price_type: str = 'RETAIL') -> List:
+    """
+    Set price_at_addition on cart items to the current price for their quantity
+
+    Variant items take the variant's price; other items their product's
+    tier price. Tiers and the variants not already loaded with the items
+    are fetched in one query each. Items whose product has no price in
+    effect keep their price.
+
+    Returns:
+        The items whose price changed (not saved)
+    """
+    tiers = load_price_tiers(
+        [item.product_id for item in items if not item.variant_id], price_type
+    )
+    variants = {}
+    if items:
+        variant_field = items[0]._meta.get_field('variant')
+        variants = ProductVariant.objects.only('id', 'price', 'sale_price').in_bulk({
+            item.variant_id for item in items if item.variant_id and not variant_field.is_cached(item)
+        })
+    changed = []
+    for item in items:
+        if item.variant_id:
+            variant = variants.get(item.variant_id) or item.variant
+            price = variant.effective_price
+        else:
+            price = tiers[item.product_id].unit_price(item.quantity)
+        if price is not None and price != item.price_at_addition:
+            item.price_at_addition = price
+            changed.append(item)
+    return changed
+
+
+def effective_retail_price_subquery():
+    """Current single-unit retail price of the outer product (lowest active tier)"""
+    return models.Subquery(
+        ActiveProductPrice.objects.filter(
+            product=models.OuterRef('pk'), price_type='RETAIL'
+        ).order_by('min_quantity').values('unit_price')[:1],
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def refresh_effective_retail_prices(product_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute Product.effective_retail_price from ActiveProductPrice in a
+    single UPDATE
+
+    Returns:
+        Number of products updated
+    """
+    queryset = Product.objects.all()
+    if product_ids is not None:
+        queryset = queryset.filter(id__in=list(product_ids))
+    return queryset.update(effective_retail_price=effective_retail_price_subquery())
@@ -13,14 +13,23 @@ from django.core.files.base import ContentFile
 from django.conf import settings
 from PIL import Image
 import io
+import json
 import logging
 from decimal import Decimal
 
+from ecomarce_choco.cache_hints import cache_control
+
+from .cache import (
+    catalog_cache, product_tags, product_list_tags, PRODUCTS_TAG, CATEGORIES_TAG, BRANDS_TAG,
+    INVENTORY_TAG
+)
 from .models import (
     Product, Category, Brand, 
     ProductImage, ProductImageUseCase, ProductPrice, Inventory, ProductReview,
     ProductVariant, ProductVariantOption, ProductVariantOptionValue, ProductVariantValue
 )
+from .bulk_updates import set_product_prices, update_inventories, update_products
+from .variants import generate_variant_matrix, get_variant_index
 
 logger = logging.getLogger(__name__)
 
@@ -35,13 +44,24 @@ def _require_staff(info):
 # GraphQL Types (Object Types)
 # ============================================================================
 
+@cache_control(max_age=3600)
 class CategoryType(DjangoObjectType):
     """Category object type"""
+    children = graphene.List(lambda: CategoryType, description="Active subcategories")
+    
     class Meta:
         model = Category
         fields = '__all__'
+    
+    def resolve_children(self, info):
+        """Subcategories; already attached when loaded through categoryTree"""
+        children = getattr(self, 'tree_children', None)
+        if children is not None:
+            return children
+        return self.subcategories.filter(is_active=True).order_by('display_order', 'name')
 
 
+@cache_control(max_age=3600)
 class BrandType(DjangoObjectType):
     """Brand object type"""
     class Meta:
@@ -92,6 +112,7 @@ class ProductPriceType(DjangoObjectType):
         return self.get_effective_price()
 
 
+@cache_control(max_age=0)
 class InventoryType(DjangoObjectType):
     """Inventory object type with computed fields"""
     available_quantity = graphene.Int()
@@ -166,10 +187,28 @@ class ProductVariantType(DjangoObjectType):
         return [vv.option_value for vv in self.option_values.all()]
 
 
+class VariantCombinationType(graphene.ObjectType):
+    """An option value combination and the active variant it selects"""
+    variant_id = graphene.Int()
+    sku = graphene.String()
+    option_value_ids = graphene.List(graphene.Int)
+    effective_price = graphene.Decimal()
+    is_default = graphene.Boolean()
+    in_stock = graphene.Boolean()
+
+
+@cache_control(
+    max_age=300,
+    images=3600, usecase_images=3600, variant_options=3600,
+    prices=300, retail_price=300, has_variants=300,
+    reviews=600, average_rating=600,
+    inventory=0, in_stock=0,
+)
 class ProductType(DjangoObjectType):
     """
     Product object type with related data
     Includes: images, use case images, prices, inventory, and computed fields
+    Stock (inventory, inStock) is always read live
     """
     images = graphene.List(ProductImageType)
     usecase_images = graphene.List(ProductImageUseCaseType)
@@ -184,74 +223,260 @@ class ProductType(DjangoObjectType):
     variant_options = graphene.List(ProductVariantOptionType)
     variants = graphene.List(ProductVariantType)
     has_variants = graphene.Boolean()
+    variant_for = graphene.Field(
+        ProductVariantType,
+        options=graphene.JSONString(description='Option names and values, e.g. {"Color": "White", "Weight": "500g"}'),
+        option_value_ids=graphene.List(graphene.Int, description="Option value IDs"),
+        description="Active variant with exactly these options (null if there is none)"
+    )
+    available_combinations = graphene.List(
+        VariantCombinationType,
+        include_out_of_stock=graphene.Boolean(default_value=False, description="Also list variants that are out of stock"),
+        description="Option value combinations of the active variants in stock"
+    )
     
     class Meta:
         model = Product
         fields = '__all__'
     
+    # Related lists are read through .all() (already in display order) so
+    # the rows prefetched with the cached product are used
+    
     def resolve_images(self, info):
         """Get all product images ordered by display order"""
-        return self.images.all().order_by('display_order')
+        return self.images.all()
     
     def resolve_usecase_images(self, info):
         """Get all use case images ordered by display order"""
-        return self.usecase_images.all().order_by('display_order')
+        return self.usecase_images.all()
     
     def resolve_prices(self, info):
         """Get only active prices"""
-        return self.prices.filter(is_active=True)
+        return [price for price in self.prices.all() if price.is_active]
     
     def resolve_inventory(self, info):
         """Get product inventory"""
-        try:
-            return self.inventory
-        except Inventory.DoesNotExist:
-            return None
+        return _live_inventory(info, self)
     
     def resolve_reviews(self, info):
         """Get only approved reviews"""
-        return self.reviews.filter(is_approved=True)
+        return _approved_reviews(self)
     
     def resolve_retail_price(self, info):
         """Get current retail price (with sale price if applicable)"""
-        price = self.prices.filter(
-            price_type='RETAIL', 
-            is_active=True
-        ).first()
-        return price.get_effective_price() if price else None
+        return self.effective_retail_price
     
     def resolve_in_stock(self, info):
         """Check if product is in stock"""
-        try:
-            return self.inventory.is_in_stock
-        except (Inventory.DoesNotExist, AttributeError):
-            return False
+        inventory = _live_inventory(info, self)
+        return inventory.is_in_stock if inventory else False
     
     def resolve_average_rating(self, info):
         """Calculate average rating from approved reviews"""
-        approved_reviews = self.reviews.filter(is_approved=True)
-        if approved_reviews.exists():
-            avg = approved_reviews.aggregate(avg=models.Avg('rating'))['avg']
-            return float(avg) if avg else None
+        ratings = [review.rating for review in _approved_reviews(self)]
+        if ratings:
+            return float(sum(ratings)) / len(ratings)
         return None
     
     def resolve_variant_options(self, info):
         """Get all variant options for this product"""
-        return self.variant_options.all().order_by('display_order')
+        return self.variant_options.all()
     
     def resolve_variants(self, info):
         """Get all active variants for this product"""
-        return self.variants.filter(is_active=True).order_by('-is_default', 'sku')
+        return self.variants.filter(is_active=True).order_by('-is_default', 'sku').prefetch_related(
+            'option_values__option_value'
+        )
     
     def resolve_has_variants(self, info):
         """Check if product has variants"""
+        if 'variants' in getattr(self, '_prefetched_objects_cache', {}):
+            return bool(self.variants.all())
         return self.variants.exists()
+    
+    def resolve_variant_for(self, info, options=None, option_value_ids=None):
+        """Look the selection up in the product's cached variant index"""
+        index = get_variant_index(self.id)
+        if option_value_ids is not None:
+            variant_id = index.variant_id_for(option_value_ids)
+        elif options:
+            if isinstance(options, str):
+                options = json.loads(options)
+            variant_id = index.variant_id_for_options(options)
+        else:
+            return None
+        if variant_id is None:
+            return None
+        # Stock is read live
+        return ProductVariant.objects.filter(id=variant_id, is_active=True).prefetch_related(
+            'option_values__option_value'
+        ).first()
+    
+    def resolve_available_combinations(self, info, include_out_of_stock=False):
+        """Combinations from the cached variant index, filtered on live stock"""
+        combinations = get_variant_index(self.id).combinations
+        if not combinations:
+            return []
+        in_stock = {
+            variant_id: quantity_in_stock - reserved_quantity > 0
+            for variant_id, quantity_in_stock, reserved_quantity in ProductVariant.objects.filter(
+                product_id=self.id, is_active=True
+            ).values_list('id', 'quantity_in_stock', 'reserved_quantity')
+        }
+        return [
+            VariantCombinationType(
+                variant_id=combination.variant_id,
+                sku=combination.sku,
+                option_value_ids=combination.option_value_ids,
+                effective_price=combination.effective_price,
+                is_default=combination.is_default,
+                in_stock=in_stock.get(combination.variant_id, False),
+            )
+            for combination in combinations
+            if include_out_of_stock or in_stock.get(combination.variant_id, False)
+        ]
+
+
+class BatchItemResultType(graphene.ObjectType):
+    """Outcome of one item in a batch mutation"""
+    index = graphene.Int(description="Position of the item in the input list")
+    product_id = graphene.Int()
+    success = graphene.Boolean()
+    message = graphene.String()
+
+
+class FacetCountType(graphene.ObjectType):
+    """Number of matching products for one facet value (brand, category)"""
+    slug = graphene.String()
+    name = graphene.String()
+    count = graphene.Int()
+
+
+class PriceRangeFacetType(graphene.ObjectType):
+    """Number of matching products in a retail price range (max_price empty for the last one)"""
+    min_price = graphene.Decimal()
+    max_price = graphene.Decimal()
+    count = graphene.Int()
+
+
+class ProductFacetsType(graphene.ObjectType):
+    """Facet counts for a product filter set"""
+    total = graphene.Int()
+    in_stock = graphene.Int()
+    min_price = graphene.Decimal()
+    max_price = graphene.Decimal()
+    brands = graphene.List(FacetCountType)
+    categories = graphene.List(FacetCountType)
+    price_ranges = graphene.List(PriceRangeFacetType)
 
 
 # ============================================================================
 # Queries
 # ============================================================================
 
+# Lower bounds of the price range facets (AED)
+PRICE_FACET_BOUNDS = [Decimal('0'), Decimal('50'), Decimal('100'), Decimal('200'), Decimal('500')]
+
+
+def _filter_products(category=None, include_descendants=None, brand=None, search=None, in_stock=None,
+                     featured=None, min_price=None, max_price=None):
+    """Active products matching the catalog filters (shared by products and productFacets)"""
+    queryset = Product.objects.filter(is_active=True)
+    
+    # Filter by category (with its subcategories: prefix match on the category path)
+    if category and include_descendants:
+        path = Category.objects.filter(slug=category).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        queryset = queryset.filter(category__path__startswith=path)
+    elif category:
+        queryset = queryset.filter(category__slug=category)
+    
+    # Filter by brand
+    if brand:
+        queryset = queryset.filter(brand__slug=brand)
+    
+    # Search filter
+    if search:
+        queryset = queryset.filter(
+            models.Q(name__icontains=search) |
+            models.Q(description__icontains=search) |
+            models.Q(sku__icontains=search)
+        )
+    
+    # Stock filter
+    if in_stock is not None:
+        if in_stock:
+            queryset = queryset.filter(
+                inventory__quantity_in_stock__gt=models.F('inventory__reserved_quantity')
+            )
+    
+    # Featured filter
+    if featured is not None:
+        queryset = queryset.filter(featured=featured)
+    
+    # Price filters (current retail price, sale price included)
+    if min_price is not None:
+        queryset = queryset.filter(effective_retail_price__gte=min_price)
+    
+    if max_price is not None:
+        queryset = queryset.filter(effective_retail_price__lte=max_price)
+    
+    return queryset
+
+def _prime_live_inventory(info, products):
+    """
+    Load current inventory rows for products served from the catalog cache
+    
+    Cached Product objects carry the inventory prefetched when they were
+    cached; stock changes don't invalidate them, so the live rows for the
+    whole result are loaded here in one query.
+    """
+    live = getattr(info.context, 'live_inventory', None)
+    if live is None:
+        live = {}
+        setattr(info.context, 'live_inventory', live)
+    
+    product_ids = [product.id for product in products if product.id not in live]
+    if not product_ids:
+        return
+    live.update(dict.fromkeys(product_ids))
+    for inventory in Inventory.objects.filter(product_id__in=product_ids):
+        live[inventory.product_id] = inventory
+
+
+def _approved_reviews(product):
+    """Approved reviews, prefetched with the product when it was loaded for the catalog"""
+    reviews = getattr(product, 'approved_reviews', None)
+    if reviews is None:
+        reviews = list(product.reviews.filter(is_approved=True))
+    return reviews
+
+
+def _product_prefetches():
+    """Related rows cached along with catalog products, so their fields need no queries"""
+    return [
+        'images',
+        'usecase_images',
+        'prices',
+        'variants',
+        'variant_options__values',
+        models.Prefetch('reviews', queryset=ProductReview.objects.filter(is_approved=True), to_attr='approved_reviews'),
+    ]
+
+
+def _live_inventory(info, product):
+    """Inventory loaded by _prime_live_inventory, or the product's own"""
+    live = getattr(info.context, 'live_inventory', None) or {}
+    if product.id in live:
+        return live[product.id]
+    try:
+        return product.inventory
+    except Inventory.DoesNotExist:
+        return None
+
+
+@cache_control(search_suggestions=300)
 class ProductQuery(graphene.ObjectType):
     """
     All product-related queries
@@ -269,6 +494,7 @@ class ProductQuery(graphene.ObjectType):
     products = graphene.List(
         ProductType,
         category=graphene.String(description="Filter by category slug"),
+        include_descendants=graphene.Boolean(description="Also match products in subcategories of the category"),
         brand=graphene.String(description="Filter by brand slug"),
         search=graphene.String(description="Search in name, description, or SKU"),
         in_stock=graphene.Boolean(description="Filter by stock availability"),
@@ -280,6 +506,20 @@ class ProductQuery(graphene.ObjectType):
         description="Get list of products with optional filters and sorting"
     )
     
+    # Filter sidebar counts (same filters as products)
+    product_facets = graphene.Field(
+        ProductFacetsType,
+        category=graphene.String(description="Filter by category slug"),
+        include_descendants=graphene.Boolean(description="Also match products in subcategories of the category"),
+        brand=graphene.String(description="Filter by brand slug"),
+        search=graphene.String(description="Search in name, description, or SKU"),
+        in_stock=graphene.Boolean(description="Filter by stock availability"),
+        featured=graphene.Boolean(description="Filter featured products"),
+        min_price=graphene.Decimal(description="Minimum price filter"),
+        max_price=graphene.Decimal(description="Maximum price filter"),
+        description="Brand, category, price range and stock counts for the products matching the filters"
+    )
+    
     # Search autocomplete - optimized for fast results as user types
     search_products = graphene.List(
         ProductType,
@@ -321,6 +561,12 @@ class ProductQuery(graphene.ObjectType):
         description="Get a single category by ID or slug"
     )
     
+    category_tree = graphene.List(
+        CategoryType,
+        root_slug=graphene.String(description="Only the subtree under this category"),
+        description="Active categories as a tree (query `children` for subcategories)"
+    )
+    
     # Brands
     brands = graphene.List(
         BrandType, 
@@ -343,86 +589,86 @@ class ProductQuery(graphene.ObjectType):
         """
         Get a single product by ID or slug
         PUBLIC ENDPOINT - No authentication required
+        Served from the catalog cache
         """
+        if not id and not slug:
+            return None
+        
+        product = catalog_cache.get_or_set(
+            catalog_cache.make_key('product', id=id, slug=slug),
+            lambda: ProductQuery.fetch_product(id, slug),
+            # A missing product is cached until any product is created
+            extra_tags=lambda product: product_tags(product) or [PRODUCTS_TAG],
+        )
+        if product:
+            _prime_live_inventory(info, [product])
+        return product
+    
+    @staticmethod
+    def fetch_product(id=None, slug=None):
+        """Load a single product with its related data"""
         queryset = Product.objects.filter(is_active=True)
         
         if id:
             queryset = queryset.filter(id=id)
-        elif slug:
-            queryset = queryset.filter(slug=slug)
         else:
-            return None
+            queryset = queryset.filter(slug=slug)
         
         # Optimize queries to avoid N+1
         return queryset.select_related(
             'brand', 
             'category', 
             'inventory'
-        ).prefetch_related(
-            'images',
-            'usecase_images',
-            'prices',
-            'variants',
-            'variant_options__values'
-        ).first()
+        ).prefetch_related(*_product_prefetches()).first()
     
-    def resolve_products(self, info, category=None, brand=None, search=None, 
+    def resolve_products(self, info, category=None, include_descendants=None, brand=None, search=None, 
                         in_stock=None, featured=None, min_price=None, max_price=None,
                         sort_by=None, limit=None):
         """
         Get list of products with optional filters and sorting
         PUBLIC ENDPOINT - No authentication required
+        Served from the catalog cache
+        """
+        filters = dict(
+            category=category, include_descendants=include_descendants, brand=brand, search=search,
+            in_stock=in_stock, featured=featured, min_price=min_price, max_price=max_price,
+            sort_by=sort_by, limit=limit
+        )
+        tags = [PRODUCTS_TAG]
+        # The in-stock filter itself depends on stock, the descendant filter on the tree
+        if in_stock:
+            tags.append(INVENTORY_TAG)
+        if category and include_descendants:
+            tags.append(CATEGORIES_TAG)
+        products = catalog_cache.get_or_set(
+            catalog_cache.make_key('products', **filters),
+            lambda: list(ProductQuery.fetch_products(**filters)),
+            tags=tags,
+            extra_tags=product_list_tags,
+        )
+        _prime_live_inventory(info, products)
+        return products
+    
+    @staticmethod
+    def fetch_products(category=None, include_descendants=None, brand=None, search=None, in_stock=None,
+                       featured=None, min_price=None, max_price=None, sort_by=None, limit=None):
+        """
+        Product list query
         Optimized with select_related and prefetch_related
         """
-        queryset = Product.objects.filter(is_active=True)
-        
-        # Filter by category
-        if category:
-            queryset = queryset.filter(category__slug=category)
-        
-        # Filter by brand
-        if brand:
-            queryset = queryset.filter(brand__slug=brand)
-        
-        # Search filter
-        if search:
-            queryset = queryset.filter(
-                models.Q(name__icontains=search) |
-                models.Q(description__icontains=search) |
-                models.Q(sku__icontains=search)
-            )
-        
-        # Stock filter
-        if in_stock is not None:
-            if in_stock:
-                queryset = queryset.filter(
-                    inventory__quantity_in_stock__gt=models.F('inventory__reserved_quantity')
-                )
-        
-        # Featured filter
-        if featured is not None:
-            queryset = queryset.filter(featured=featured)
-        
-        # Price filters (only retail prices)
-        if min_price is not None or max_price is not None:
-            price_filter = models.Q(prices__price_type='RETAIL', prices__is_active=True)
-            
-            if min_price is not None:
-                price_filter &= models.Q(prices__base_price__gte=min_price)
-            
-            if max_price is not None:
-                price_filter &= models.Q(prices__base_price__lte=max_price)
-            
-            queryset = queryset.filter(price_filter).distinct()
+        queryset = _filter_products(
+            category=category, include_descendants=include_descendants, brand=brand, search=search,
+            in_stock=in_stock, featured=featured, min_price=min_price, max_price=max_price
+        )
         
         # Apply sorting
         if sort_by:
             if sort_by == 'name':
                 queryset = queryset.order_by('name')
             elif sort_by == 'price_asc':
-                queryset = queryset.order_by('prices__base_price')
+                queryset = queryset.order_by(models.F('effective_retail_price').asc(nulls_last=True), 'name')
             elif sort_by == 'price_desc':
-                queryset = queryset.order_by('-prices__base_price')
+                queryset = queryset.order_by(models.F('effective_retail_price').desc(nulls_last=True), 'name')
             elif sort_by == 'rating':
                 # Sort by average rating (if reviews exist)
                 queryset = queryset.order_by('-reviews__rating')
@@ -439,56 +685,179 @@ class ProductQuery(graphene.ObjectType):
             queryset = queryset[:limit]
         
         # Optimize queries
-        return queryset.select_related('brand', 'category', 'inventory').prefetch_related(
-            'images', 
-            'usecase_images',
-            'prices',
-            'variants',
-            'variant_options__values'
+        return queryset.select_related('brand', 'category', 'inventory').prefetch_related(*_product_prefetches())
+    
+    def resolve_product_facets(self, info, **filters):
+        """
+        Get facet counts for the product filter sidebar
+        PUBLIC ENDPOINT - No authentication required
+        Counts are for the current filter set, from one grouped query
+        """
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('product_facets', **filters),
+            lambda: ProductQuery.fetch_product_facets(**filters),
+            tags=[PRODUCTS_TAG, INVENTORY_TAG, CATEGORIES_TAG, BRANDS_TAG],
+        )
+    
+    @staticmethod
+    def fetch_product_facets(**filters):
+        """
+        Facet counts from a single aggregation
+        
+        Matching products are grouped by brand, category, price range and
+        stock state; the groups are then summed into each facet.
+        """
+        bounds = PRICE_FACET_BOUNDS
+        price_range = Case(
+            *[When(effective_retail_price__lt=upper, then=Value(index)) for index, upper in enumerate(bounds[1:])],
+            When(effective_retail_price__isnull=False, then=Value(len(bounds) - 1)),
+            default=Value(None),
+            output_field=IntegerField(),
         )
+        groups = _filter_products(**filters).annotate(
+            price_range=price_range,
+            is_in_stock=Case(
+                When(inventory__quantity_in_stock__gt=models.F('inventory__reserved_quantity'), then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+        ).order_by().values(
+            'brand__slug', 'brand__name', 'category__slug', 'category__name', 'price_range', 'is_in_stock'
+        ).annotate(
+            count=models.Count('id', distinct=True),
+            min_price=models.Min('effective_retail_price'),
+            max_price=models.Max('effective_retail_price'),
+        )
+        
+        total = in_stock = 0
+        min_price = max_price = None
+        brands, categories, price_ranges = {}, {}, [0] * len(bounds)
+        for group in groups:
+            count = group['count']
+            total += count
+            if group['is_in_stock']:
+                in_stock += count
+            if group['min_price'] is not None:
+                min_price = group['min_price'] if min_price is None else min(min_price, group['min_price'])
+                max_price = group['max_price'] if max_price is None else max(max_price, group['max_price'])
+            if group['price_range'] is not None:
+                price_ranges[group['price_range']] += count
+            for facets, prefix in ((brands, 'brand'), (categories, 'category')):
+                facet = facets.setdefault(group[f'{prefix}__slug'], {
+                    'slug': group[f'{prefix}__slug'], 'name': group[f'{prefix}__name'], 'count': 0
+                })
+                facet['count'] += count
+        
+        return {
+            'total': total,
+            'in_stock': in_stock,
+            'min_price': min_price,
+            'max_price': max_price,
+            'brands': sorted(brands.values(), key=lambda facet: (-facet['count'], facet['name'])),
+            'categories': sorted(categories.values(), key=lambda facet: (-facet['count'], facet['name'])),
+            'price_ranges': [
+                {
+                    'min_price': lower,
+                    'max_price': bounds[index + 1] if index + 1 < len(bounds) else None,
+                    'count': price_ranges[index],
+                }
+                for index, lower in enumerate(bounds)
+            ],
+        }
     
     def resolve_categories(self, info, parent_id=None):
         """
         Get list of categories, optionally filtered by parent
         PUBLIC ENDPOINT - No authentication required
         """
-        queryset = Category.objects.filter(is_active=True)
+        def fetch():
+            queryset = Category.objects.filter(is_active=True)
+            
+            if parent_id is not None:
+                queryset = queryset.filter(parent_category_id=parent_id)
+            
+            return list(queryset.order_by('display_order', 'name'))
         
-        if parent_id is not None:
-            queryset = queryset.filter(parent_category_id=parent_id)
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('categories', parent_id=parent_id), fetch, tags=[CATEGORIES_TAG]
+        )
+    
+    def resolve_category_tree(self, info, root_slug=None):
+        """
+        Get active categories as a tree
+        PUBLIC ENDPOINT - No authentication required
+        One query (a path prefix match for a subtree), served from the catalog cache
+        """
+        def fetch():
+            queryset = Category.objects.filter(is_active=True)
+            root_depth = 0
+            if root_slug:
+                root = Category.objects.filter(slug=root_slug, is_active=True).values('path', 'depth').first()
+                if root is None:
+                    return []
+                queryset = queryset.filter(path__startswith=root['path'])
+                root_depth = root['depth']
+            
+            roots, nodes = [], {}
+            for category in queryset.order_by('depth', 'display_order', 'name'):
+                category.tree_children = []
+                nodes[category.id] = category
+                if category.parent_category_id in nodes:
+                    nodes[category.parent_category_id].tree_children.append(category)
+                elif category.depth == root_depth:
+                    roots.append(category)
+                # Otherwise the parent is inactive, so the whole branch is hidden
+            return roots
         
-        return queryset.order_by('display_order', 'name')
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('category_tree', root_slug=root_slug), fetch, tags=[CATEGORIES_TAG]
+        )
     
     def resolve_category(self, info, id=None, slug=None):
         """
         Get a single category by ID or slug
         PUBLIC ENDPOINT - No authentication required
         """
-        if id:
-            return Category.objects.filter(id=id, is_active=True).first()
-        if slug:
-            return Category.objects.filter(slug=slug, is_active=True).first()
-        return None
+        def fetch():
+            if id:
+                return Category.objects.filter(id=id, is_active=True).first()
+            if slug:
+                return Category.objects.filter(slug=slug, is_active=True).first()
+            return None
+        
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('category', id=id, slug=slug), fetch, tags=[CATEGORIES_TAG]
+        )
     
     def resolve_brands(self, info, is_active=None):
         """
         Get list of brands, optionally filtered by active status
         PUBLIC ENDPOINT - No authentication required
         """
-        queryset = Brand.objects.all()
-        
-        if is_active is not None:
-            queryset = queryset.filter(is_active=is_active)
+        def fetch():
+            queryset = Brand.objects.all()
+            
+            if is_active is not None:
+                queryset = queryset.filter(is_active=is_active)
+            
+            return list(queryset.order_by('display_order', 'name'))
         
-        return queryset.order_by('display_order', 'name')
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('brands', is_active=is_active), fetch, tags=[BRANDS_TAG]
+        )
     
     def resolve_brand(self, info, id=None, slug=None):
         """Get a single brand by ID or slug"""
-        if id:
-            return Brand.objects.filter(id=id, is_active=True).first()
-        if slug:
-            return Brand.objects.filter(slug=slug, is_active=True).first()
-        return None
+        def fetch():
+            if id:
+                return Brand.objects.filter(id=id, is_active=True).first()
+            if slug:
+                return Brand.objects.filter(slug=slug, is_active=True).first()
+            return None
+        
+        return catalog_cache.get_or_set(
+            catalog_cache.make_key('brand', id=id, slug=slug), fetch, tags=[BRANDS_TAG]
+        )
     
     def resolve_search_products(self, info, query, limit=10, sort_by=None):
         """
@@ -535,9 +904,9 @@ class ProductQuery(graphene.ObjectType):
             if sort_by == 'name':
                 queryset = queryset.order_by('name')
             elif sort_by == 'price_asc':
-                queryset = queryset.order_by('prices__base_price')
+                queryset = queryset.order_by(models.F('effective_retail_price').asc(nulls_last=True), 'name')
             elif sort_by == 'price_desc':
-                queryset = queryset.order_by('-prices__base_price')
+                queryset = queryset.order_by(models.F('effective_retail_price').desc(nulls_last=True), 'name')
             elif sort_by == 'rating':
                 queryset = queryset.order_by('-reviews__rating')
             elif sort_by == 'newest':
@@ -608,9 +977,9 @@ class ProductQuery(graphene.ObjectType):
             if sort_by == 'name':
                 product_scores.sort(key=lambda x: (x[0].name, -x[1]), reverse=False)
             elif sort_by == 'price_asc':
-                product_scores.sort(key=lambda x: (x[0].prices.filter(is_active=True).first().base_price if x[0].prices.filter(is_active=True).exists() else 0, -x[1]), reverse=False)
+                product_scores.sort(key=lambda x: (x[0].effective_retail_price or 0, -x[1]), reverse=False)
             elif sort_by == 'price_desc':
-                product_scores.sort(key=lambda x: (x[0].prices.filter(is_active=True).first().base_price if x[0].prices.filter(is_active=True).exists() else 0, -x[1]), reverse=True)
+                product_scores.sort(key=lambda x: (x[0].effective_retail_price or 0, -x[1]), reverse=True)
             elif sort_by == 'rating':
                 product_scores.sort(key=lambda x: (x[0].reviews.filter(is_approved=True).aggregate(avg=models.Avg('rating'))['avg'] or 0, -x[1]), reverse=True)
             elif sort_by == 'newest':
@@ -738,6 +1107,25 @@ class InventoryInput(graphene.InputObjectType):
     warehouse_location = graphene.String()
 
 
+class ProductUpdateInput(graphene.InputObjectType):
+    """Input for one product in updateProducts (only the fields given change)"""
+    id = graphene.Int(required=True)
+    sku = graphene.String()
+    name = graphene.String()
+    slug = graphene.String()
+    brand_id = graphene.Int()
+    category_id = graphene.Int()
+    description = graphene.String()
+    short_description = graphene.String()
+    ingredients = graphene.String()
+    allergen_info = graphene.String()
+    weight = graphene.Decimal()
+    volume = graphene.Decimal()
+    unit_type = graphene.String()
+    is_active = graphene.Boolean()
+    featured = graphene.Boolean()
+
+
 class ProductImageInput(graphene.InputObjectType):
     """Input for uploading product images"""
     product_id = graphene.Int(required=True)
@@ -1204,6 +1592,102 @@ class UpdateInventory(graphene.Mutation):
             return UpdateInventory(success=False, message="Failed to update inventory. Please try again.")
 
 
+class SetProductPrices(graphene.Mutation):
+    """Set or update many product prices in one transaction (e.g. repricing a brand)"""
+    class Arguments:
+        items = graphene.List(graphene.NonNull(ProductPriceInput), required=True)
+    
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(BatchItemResultType)
+    prices = graphene.List(ProductPriceType)
+    
+    def mutate(self, info, items):
+        _require_staff(info)
+        try:
+            results, prices = set_product_prices([dict(item) for item in items])
+            succeeded = sum(1 for result in results if result['success'])
+            
+            return SetProductPrices(
+                success=succeeded == len(results),
+                message=f"{succeeded} of {len(results)} prices set",
+                results=[BatchItemResultType(**result) for result in results],
+                prices=prices
+            )
+        except ValueError as e:
+            return SetProductPrices(success=False, message=str(e), results=[])
+        except IntegrityError as e:
+            logger.error(f"Integrity error setting product prices: {str(e)}")
+            return SetProductPrices(success=False, message="Failed to set prices due to a constraint violation", results=[])
+        except Exception as e:
+            logger.error(f"Error setting product prices: {str(e)}", exc_info=True)
+            return SetProductPrices(success=False, message="Failed to set product prices. Please try again.", results=[])
+
+
+class UpdateInventories(graphene.Mutation):
+    """Update the inventory of many products in one transaction"""
+    class Arguments:
+        items = graphene.List(graphene.NonNull(InventoryInput), required=True)
+    
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(BatchItemResultType)
+    inventories = graphene.List(InventoryType)
+    
+    def mutate(self, info, items):
+        _require_staff(info)
+        try:
+            results, inventories = update_inventories([dict(item) for item in items])
+            succeeded = sum(1 for result in results if result['success'])
+            
+            return UpdateInventories(
+                success=succeeded == len(results),
+                message=f"{succeeded} of {len(results)} inventories updated",
+                results=[BatchItemResultType(**result) for result in results],
+                inventories=inventories
+            )
+        except ValueError as e:
+            return UpdateInventories(success=False, message=str(e), results=[])
+        except Exception as e:
+            logger.error(f"Error updating inventories: {str(e)}", exc_info=True)
+            return UpdateInventories(success=False, message="Failed to update inventories. Please try again.", results=[])
+
+
+class UpdateProducts(graphene.Mutation):
+    """Update many products in one transaction"""
+    class Arguments:
+        items = graphene.List(graphene.NonNull(ProductUpdateInput), required=True)
+    
+    success = graphene.Boolean()
+    message = graphene.String()
+    results = graphene.List(BatchItemResultType)
+    products = graphene.List(ProductType)
+    
+    def mutate(self, info, items):
+        _require_staff(info)
+        try:
+            results, products = update_products([dict(item) for item in items])
+            succeeded = sum(1 for result in results if result['success'])
+            
+            return UpdateProducts(
+                success=succeeded == len(results),
+                message=f"{succeeded} of {len(results)} products updated",
+                results=[BatchItemResultType(**result) for result in results],
+                products=products
+            )
+        except ValueError as e:
+            return UpdateProducts(success=False, message=str(e), results=[])
+        except IntegrityError as e:
+            error_str = str(e).lower()
+            if 'sku' in error_str or 'slug' in error_str:
+                return UpdateProducts(success=False, message="Products could not be updated: SKUs and slugs must stay unique", results=[])
+            logger.error(f"Integrity error updating products: {str(e)}")
+            return UpdateProducts(success=False, message="Failed to update products due to a constraint violation", results=[])
+        except Exception as e:
+            logger.error(f"Error updating products: {str(e)}", exc_info=True)
+            return UpdateProducts(success=False, message="Failed to update products. Please try again.", results=[])
+
+
 class UploadProductImage(graphene.Mutation):
     """Upload product image with automatic resizing"""
     class Arguments:
@@ -1722,6 +2206,75 @@ class DeleteProductVariant(graphene.Mutation):
             return DeleteProductVariant(success=False, message="Failed to delete variant. Please try again.")
 
 
+class GenerateVariantMatrix(graphene.Mutation):
+    """
+    Create a variant for every combination of option values
+    (e.g. 4 colours x 5 weights = 20 variants) in one transaction
+    """
+    class Arguments:
+        product_id = graphene.Int(required=True)
+        options = graphene.List(VariantOptionInput, required=True, description="Options and values to combine; missing ones are created")
+        base_price = graphene.Decimal(required=True, description="Price of every variant before adjustments")
+        price_adjustments = graphene.JSONString(description='Amounts added per option value, e.g. {"Weight": {"1kg": "20.00"}}')
+        sku_template = graphene.String(description='SKU pattern: {sku} is the product SKU, {values} the option values joined with "-", {Color} one option value (default "{sku}-{values}")')
+        sale_price = graphene.Decimal()
+        currency = graphene.String(default_value='AED')
+        quantity_in_stock = graphene.Int(default_value=0)
+        low_stock_threshold = graphene.Int(default_value=10)
+        is_active = graphene.Boolean(default_value=True)
+    
+    success = graphene.Boolean()
+    message = graphene.String()
+    variants = graphene.List(ProductVariantType)
+    created_count = graphene.Int()
+    skipped_count = graphene.Int()
+    
+    def mutate(self, info, product_id, options, base_price, price_adjustments=None, sku_template=None, **kwargs):
+        _require_staff(info)
+        try:
+            product = Product.objects.get(id=product_id)
+            
+            if isinstance(price_adjustments, str):
+                price_adjustments = json.loads(price_adjustments)
+            
+            variants, skipped = generate_variant_matrix(
+                product,
+                [
+                    {'name': option.name, 'values': option.values, 'display_order': option.get('display_order')}
+                    for option in options
+                ],
+                base_price,
+                price_adjustments=price_adjustments,
+                sku_template=sku_template,
+                **kwargs
+            )
+            
+            models.prefetch_related_objects(variants, 'option_values__option_value')
+            
+            return GenerateVariantMatrix(
+                success=True,
+                message=f"Created {len(variants)} variants for '{product.name}' ({skipped} combinations already existed)",
+                variants=variants,
+                created_count=len(variants),
+                skipped_count=skipped
+            )
+        
+        except Product.DoesNotExist:
+            return GenerateVariantMatrix(success=False, message="Product not found")
+        except ValidationError as e:
+            logger.error(f"Validation error generating variant matrix: {str(e)}")
+            return GenerateVariantMatrix(success=False, message=f"Invalid variant matrix: {e.message if hasattr(e, 'message') else str(e)}")
+        except IntegrityError as e:
+            logger.error(f"Integrity error generating variant matrix: {str(e)}")
+            return GenerateVariantMatrix(success=False, message="Failed to create variants due to a constraint violation")
+        except (ValueError, ArithmeticError) as e:
+            logger.error(f"Value error generating variant matrix: {str(e)}")
+            return GenerateVariantMatrix(success=False, message="Invalid variant data provided")
+        except Exception as e:
+            logger.error(f"Error generating variant matrix: {str(e)}", exc_info=True)
+            return GenerateVariantMatrix(success=False, message="Failed to create variants. Please try again.")
+
+
 # Mutation class for Products Admin
 class ProductAdminMutation(graphene.ObjectType):
     """All product admin mutations"""
@@ -1736,13 +2289,16 @@ class ProductAdminMutation(graphene.ObjectType):
     # Products
     create_product = CreateProduct.Field()
     update_product = UpdateProduct.Field()
+    update_products = UpdateProducts.Field()
     delete_product = DeleteProduct.Field()
     
     # Pricing
     set_product_price = SetProductPrice.Field()
+    set_product_prices = SetProductPrices.Field()
     
     # Inventory
     update_inventory = UpdateInventory.Field()
+    update_inventories = UpdateInventories.Field()
     
     # Images
     upload_product_image = UploadProductImage.Field()
@@ -1755,6 +2311,7 @@ class ProductAdminMutation(graphene.ObjectType):
     create_product_variant = CreateProductVariant.Field()
     update_product_variant = UpdateProductVariant.Field()
     delete_product_variant = DeleteProductVariant.Field()
+    generate_variant_matrix = GenerateVariantMatrix.Field()
 
 
 # Main Mutation class - exports all product mutations
@@ -0,0 +1,65 @@
+"""
+Product signals
+Evict catalog cache entries when catalog rows change, and keep
+denormalized product columns current
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import BRANDS_TAG, CATEGORIES_TAG, INVENTORY_TAG, PRODUCTS_TAG, invalidate_on_commit
+from .models import (
+    Brand, Category, Inventory, Product, ProductImage, ProductImageUseCase, ProductPrice,
+    ProductReview, ProductVariant, ProductVariantOption, ProductVariantOptionValue, ProductVariantValue
+)
+from .pricing import sync_active_prices
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    invalidate_on_commit(f'product:{instance.id}', PRODUCTS_TAG)
+
+
+@receiver([post_save, post_delete], sender=Inventory)
+def invalidate_inventory(sender, instance, **kwargs):
+    """Stock is read live, only entries filtered by stock depend on it"""
+    invalidate_on_commit(f'inventory:{instance.product_id}', INVENTORY_TAG)
+
+
+@receiver([post_save, post_delete], sender=ProductPrice)
+def refresh_active_prices(sender, instance, **kwargs):
+    """Keep ActiveProductPrice and Product.effective_retail_price current"""
+    sync_active_prices([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductPrice)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductImageUseCase)
+@receiver([post_save, post_delete], sender=ProductReview)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductVariantOption)
+def invalidate_product_data(sender, instance, **kwargs):
+    """Prices, images, reviews and variants belong to one product"""
+    invalidate_on_commit(f'product:{instance.product_id}', PRODUCTS_TAG)
+
+
+@receiver([post_save, post_delete], sender=ProductVariantOptionValue)
+def invalidate_option_value(sender, instance, **kwargs):
+    invalidate_on_commit(f'product:{instance.option.product_id}', PRODUCTS_TAG)
+
+
+@receiver([post_save, post_delete], sender=ProductVariantValue)
+def invalidate_variant_value(sender, instance, **kwargs):
+    """Variant option links change the product's variant index"""
+    product_id = ProductVariant.objects.filter(id=instance.variant_id).values_list('product_id', flat=True).first()
+    if product_id:
+        invalidate_on_commit(f'product:{product_id}', PRODUCTS_TAG)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate_on_commit(f'category:{instance.id}', CATEGORIES_TAG)
+
+
+@receiver([post_save, post_delete], sender=Brand)
+def invalidate_brand(sender, instance, **kwargs):
+    invalidate_on_commit(f'brand:{instance.id}', BRANDS_TAG)
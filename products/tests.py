@@ -1,3 +1,1109 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from graphql import parse
+
+from ecomarce_choco.cache import MISSING, TieredCache
+from ecomarce_choco.cache_hints import operation_max_age
+from ecomarce_choco.persisted_queries import PERSISTED_QUERIES, get_persisted_query
+from ecomarce_choco.schema import schema
+
+from .bulk_updates import set_product_prices, update_inventories, update_products
+from .cache import catalog_cache
+from .catalog_export import iter_records
+from .catalog_import import CatalogImporter, read_records
+from .invalidation import InvalidationListener
+from .models import (
+    ActiveProductPrice, Brand, Category, Inventory, Product, ProductPrice, ProductVariant, ProductVariantOption,
+    ProductVariantOptionValue, ProductVariantValue
+)
+from .pricing import PriceTiers, next_price_change, sync_active_prices
+from .schema import PRICE_FACET_BOUNDS, ProductQuery
+from .variants import generate_variant_matrix, get_variant_index
+
+
+def create_product(sku='CHOC-1', **kwargs):
+    category, _ = Category.objects.get_or_create(slug='chocolate', defaults={'name': 'Chocolate'})
+    brand, _ = Brand.objects.get_or_create(slug='callebaut', defaults={'name': 'Callebaut'})
+    return Product.objects.create(
+        sku=sku, name=kwargs.pop('name', sku), slug=sku.lower(), category=category, brand=brand, **kwargs
+    )
+
+
+class ActivePriceTests(TestCase):
+    """ActiveProductPrice and Product.effective_retail_price follow ProductPrice"""
+
+    def test_saving_a_price_sets_the_effective_retail_price(self):
+        product = create_product()
+        ProductPrice.objects.create(product=product, base_price=Decimal('10.00'))
+        ProductPrice.objects.create(product=product, base_price=Decimal('8.00'), min_quantity=5)
+
+        product.refresh_from_db()
+        self.assertEqual(product.effective_retail_price, Decimal('10.00'))
+        self.assertEqual(ActiveProductPrice.objects.filter(product=product).count(), 2)
+
+    def test_deleting_the_only_price_clears_the_effective_retail_price(self):
+        product = create_product()
+        price = ProductPrice.objects.create(product=product, base_price=Decimal('10.00'))
+
+        price.delete()
+
+        product.refresh_from_db()
+        self.assertIsNone(product.effective_retail_price)
+        self.assertFalse(ActiveProductPrice.objects.filter(product=product).exists())
+
+    def test_deleting_the_lowest_tier_falls_back_to_the_next_one(self):
+        product = create_product()
+        single = ProductPrice.objects.create(product=product, base_price=Decimal('10.00'))
+        ProductPrice.objects.create(product=product, base_price=Decimal('8.00'), min_quantity=5)
+
+        single.delete()
+
+        product.refresh_from_db()
+        self.assertEqual(product.effective_retail_price, Decimal('8.00'))
+
+
+class ScheduledPriceTests(TestCase):
+    """Prices with a valid_from/valid_until window (activate_scheduled_prices)"""
+
+    def setUp(self):
+        self.product = create_product()
+        ProductPrice.objects.create(product=self.product, base_price=Decimal('10.00'))
+        self.starts = timezone.now() + timedelta(hours=1)
+        self.sale = ProductPrice.objects.create(
+            product=self.product, base_price=Decimal('10.00'), sale_price=Decimal('7.00'), min_quantity=1,
+            price_type='WHOLESALE', valid_from=self.starts, valid_until=self.starts + timedelta(days=1)
+        )
+
+    def test_future_price_is_not_active_yet(self):
+        self.assertFalse(ActiveProductPrice.objects.filter(price=self.sale).exists())
+        self.assertEqual(next_price_change(), self.starts)
+
+    def test_price_activates_and_expires_with_its_window(self):
+        self.assertEqual(sync_active_prices(now=self.starts), {self.product.id})
+        self.assertEqual(ActiveProductPrice.objects.get(price=self.sale).unit_price, Decimal('7.00'))
+        self.assertEqual(sync_active_prices(now=self.starts), set())
+
+        self.assertEqual(sync_active_prices(now=self.starts + timedelta(days=2)), {self.product.id})
+        self.assertFalse(ActiveProductPrice.objects.filter(price=self.sale).exists())
+
+    def test_effective_retail_price_follows_the_window(self):
+        product = create_product('CHOC-2')
+        ProductPrice.objects.create(product=product, base_price=Decimal('9.00'), valid_from=self.starts)
+
+        product.refresh_from_db()
+        self.assertIsNone(product.effective_retail_price)
+
+        sync_active_prices(now=self.starts)
+        product.refresh_from_db()
+        self.assertEqual(product.effective_retail_price, Decimal('9.00'))
+
+    def test_command_activates_due_prices_and_invalidates_the_cache(self):
+        # The window opened without a save, as when the time simply passes
+        ProductPrice.objects.filter(pk=self.sale.pk).update(valid_from=timezone.now() - timedelta(minutes=1))
+
+        with mock.patch('products.management.commands.activate_scheduled_prices.invalidate') as invalidate:
+            call_command('activate_scheduled_prices', stdout=StringIO())
+
+        self.assertTrue(ActiveProductPrice.objects.filter(price=self.sale).exists())
+        invalidate.assert_called_once_with('products', f'product:{self.product.id}')
+
+    def test_dry_run_changes_nothing(self):
+        ProductPrice.objects.filter(pk=self.sale.pk).update(valid_from=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+
+        call_command('activate_scheduled_prices', '--dry-run', stdout=out)
+
+        self.assertIn(f'ID {self.product.id}', out.getvalue())
+        self.assertFalse(ActiveProductPrice.objects.filter(price=self.sale).exists())
+
+
+class CatalogImportTests(TestCase):
+    """import_catalog: CSV/JSONL upserts, rejected rows and dry runs"""
+
+    CSV = (
+        'sku,name,brand,category,price,sale_price,stock,parent_sku,options\n'
+        'CHOC-1,Dark,Callebaut,Chocolate,10.00,,50,,\n'
+        'CHOC-2,Milk,Callebaut,Chocolate,abc,,5,,\n'
+        'CHOC-1-W,,,,12.00,,7,CHOC-1,Color=White; Weight=500g\n'
+        'CHOC-3,Ruby,Unknown,Chocolate,9.00,,1,,\n'
+    )
+
+    def setUp(self):
+        create_product('EXISTING')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def import_file(self, path, *args):
+        out = StringIO()
+        call_command('import_catalog', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_rows_are_upserted_and_invalid_rows_reported(self):
+        out = self.import_file(self.write('catalog.csv', self.CSV))
+
+        product = Product.objects.get(sku='CHOC-1')
+        self.assertEqual(product.effective_retail_price, Decimal('10.00'))
+        self.assertEqual(product.inventory.quantity_in_stock, 50)
+        variant = product.variants.get()
+        self.assertEqual((variant.sku, variant.price, variant.quantity_in_stock), ('CHOC-1-W', Decimal('12.00'), 7))
+        self.assertEqual(
+            sorted(variant.option_values.values_list('option_value__option__name', 'option_value__value')),
+            [('Color', 'White'), ('Weight', '500g')]
+        )
+        self.assertFalse(Product.objects.filter(sku__in=['CHOC-2', 'CHOC-3']).exists())
+        self.assertIn('Line 3: CHOC-2: base_price', out)
+        self.assertIn("Line 5: CHOC-3: Unknown brand 'Unknown'", out)
+
+        self.import_file(self.write('update.csv', 'sku,price,stock\nCHOC-1,11.00,40\n'))
+
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.effective_retail_price), ('Dark', Decimal('11.00')))
+        self.assertEqual(Inventory.objects.get(product=product).quantity_in_stock, 40)
+        self.assertEqual(ProductPrice.objects.filter(product=product).count(), 1)
+
+    def test_jsonl_with_tiers_and_missing_brands_created(self):
+        record = {
+            'sku': 'CHOC-1', 'name': 'Dark', 'brand': 'Valrhona', 'category': 'Chocolate',
+            'prices': [{'price': '10.00'}, {'price': '8.00', 'min_quantity': 5}],
+            'variants': [{'sku': 'CHOC-1-L', 'price': '20.00', 'options': {'Size': 'Large'}}],
+        }
+        path = self.write('catalog.jsonl', json.dumps(record) + '\n{not json}\n')
+
+        out = self.import_file(path, '--create-missing')
+
+        product = Product.objects.get(sku='CHOC-1')
+        self.assertEqual(product.brand.name, 'Valrhona')
+        self.assertEqual(PriceTiers(ActiveProductPrice.objects.filter(product=product)).unit_price(6), Decimal('8.00'))
+        self.assertEqual(product.variants.get().sku, 'CHOC-1-L')
+        self.assertIn('Line 2: Invalid JSON', out)
+
+    def test_dry_run_is_rolled_back(self):
+        out = self.import_file(self.write('catalog.csv', self.CSV), '--dry-run', '--batch-size', '1')
+
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['EXISTING'])
+        self.assertFalse(ProductVariant.objects.exists())
+        # The variant's parent was validated in an earlier (rolled back) batch
+        self.assertIn('1 product(s), 1 price(s), 1 inventory row(s), 1 variant(s) validated, 2 error(s)', out)
+
+    def test_batch_is_written_in_a_fixed_number_of_queries(self):
+        rows = ''.join(f'CHOC-{n},Bar {n},Callebaut,Chocolate,{n}.00,,{n},,\n' for n in range(1, 21))
+        importer = CatalogImporter()
+        batch = list(read_records(self.write('catalog.csv', self.CSV.splitlines(True)[0] + rows)))
+
+        # 12 reads and writes, however many rows, plus two savepoints
+        with self.assertNumQueries(16):
+            importer.import_batch(batch)
+
+        self.assertEqual(importer.stats, {'products': 20, 'prices': 20, 'inventory': 20, 'variants': 0})
+        self.assertEqual(Product.objects.get(sku='CHOC-20').effective_retail_price, Decimal('20.00'))
+
+
+class CatalogExportTests(TestCase):
+    """export_catalog output reads back through import_catalog"""
+
+    def setUp(self):
+        self.product = create_product(nutritional_info={'energy': '540 kcal'}, weight=Decimal('1.00'))
+        ProductPrice.objects.create(product=self.product, base_price=Decimal('10.00'), sale_price=Decimal('9.00'))
+        ProductPrice.objects.create(product=self.product, base_price=Decimal('8.00'), min_quantity=5, max_quantity=9)
+        Inventory.objects.create(product=self.product, quantity_in_stock=50, reserved_quantity=5)
+        variant = ProductVariant.objects.create(product=self.product, sku='CHOC-1-W', price=Decimal('12.00'))
+        option = ProductVariantOption.objects.create(product=self.product, name='Color')
+        ProductVariantValue.objects.create(
+            variant=variant, option_value=ProductVariantOptionValue.objects.create(option=option, value='White')
+        )
+        create_product('CHOC-2', is_active=False)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def export(self, name, *args):
+        path = os.path.join(self.tmp.name, name)
+        call_command('export_catalog', path, *args, stdout=StringIO())
+        return path
+
+    def reimport(self, path):
+        Product.objects.all().delete()
+        call_command('import_catalog', path, stdout=StringIO())
+        return list(iter_records())
+
+    def test_record_contents(self):
+        record = next(iter_records())
+
+        self.assertEqual((record['sku'], record['brand'], record['retail_price']), ('CHOC-1', 'callebaut', '9.00'))
+        self.assertEqual([price['min_quantity'] for price in record['prices']], [1, 5])
+        self.assertEqual(record['inventory']['available_quantity'], 45)
+        self.assertEqual(record['variants'][0]['options'], {'Color': 'White'})
+        self.assertEqual([record['sku'] for record in iter_records(active_only=True)], ['CHOC-1'])
+
+    def test_jsonl_round_trip(self):
+        before = list(iter_records())
+
+        after = self.reimport(self.export('catalog.jsonl.gz'))
+
+        # Reservations belong to open orders and are not imported
+        for record in before:
+            if record['inventory']:
+                record['inventory'].update(reserved_quantity=0, available_quantity=50)
+        self.assertEqual(after, before)
+
+    def test_csv_round_trip_keeps_the_first_retail_tier_and_variants(self):
+        after = self.reimport(self.export('catalog.csv'))
+
+        record = after[0]
+        self.assertEqual(record['nutritional_info'], {'energy': '540 kcal'})
+        self.assertEqual(
+            [(price['base_price'], price['sale_price']) for price in record['prices']], [('10.00', '9.00')]
+        )
+        self.assertEqual(record['inventory']['quantity_in_stock'], 50)
+        self.assertEqual(
+            [(variant['sku'], variant['price'], variant['options']) for variant in record['variants']],
+            [('CHOC-1-W', '12.00', {'Color': 'White'})]
+        )
+        self.assertFalse(after[1]['is_active'])
+
+    def test_queries_do_not_grow_with_the_catalog(self):
+        for n in range(3, 13):
+            ProductPrice.objects.create(product=create_product(f'CHOC-{n}'), base_price=Decimal('5.00'))
+
+        # One query for the products and one per prefetch, per chunk
+        with self.assertNumQueries(5):
+            self.assertEqual(len(list(iter_records(chunk_size=100))), 12)
+
+
+class PriceTiersTests(TestCase):
+    """Tier lookup by quantity"""
+
+    def tiers(self, *tiers):
+        return PriceTiers(
+            ActiveProductPrice(min_quantity=min_quantity, max_quantity=max_quantity, unit_price=Decimal(price))
+            for min_quantity, max_quantity, price in tiers
+        )
+
+    def test_highest_tier_not_above_the_quantity_applies(self):
+        tiers = self.tiers((1, None, '10'), (5, None, '8'), (20, None, '6'))
+
+        self.assertEqual(
+            [tiers.unit_price(quantity) for quantity in (0, 1, 4, 5, 19, 20, 99)],
+            [10, 10, 10, 8, 8, 6, 6]
+        )
+
+    def test_capped_tier_stops_applying_above_max_quantity(self):
+        tiers = self.tiers((1, None, '10'), (5, 9, '8'))
+
+        self.assertEqual([tiers.unit_price(quantity) for quantity in (5, 9, 10, 50)], [8, 8, 10, 10])
+
+    def test_quantity_no_tier_covers_gets_the_lowest_tier(self):
+        tiers = self.tiers((1, 4, '10'), (10, None, '7'))
+
+        self.assertEqual([tiers.unit_price(quantity) for quantity in (4, 6, 10)], [10, 10, 7])
+
+    def test_no_tiers(self):
+        self.assertIsNone(self.tiers().unit_price(3))
+
+
+
+class TieredCacheTests(TestCase):
+    """Local and shared cache tiers with tag invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.cache = TieredCache('test', ttl=60, local_ttl=30, stale_ttl=60)
+        self.calls = 0
+
+    def fetch(self, value='value'):
+        def fetch():
+            self.calls += 1
+            return value
+        return fetch
+
+    def test_value_is_computed_once(self):
+        for _ in range(3):
+            self.assertEqual(self.cache.get_or_set('test:key', self.fetch(), tags=['product:1']), 'value')
+        # Another worker (empty local tier) is served from the shared tier
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get_or_set('test:key', self.fetch()), 'value')
+
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidating_a_tag_only_recomputes_entries_carrying_it(self):
+        self.cache.get_or_set('test:one', self.fetch('one'), tags=['product:1'])
+        self.cache.get_or_set('test:two', self.fetch('two'), tags=['product:2'])
+
+        self.cache.invalidate_tags('product:1')
+
+        self.assertEqual(self.cache.get_or_set('test:one', self.fetch('new')), 'new')
+        self.assertEqual(self.cache.get_or_set('test:two', self.fetch('new')), 'two')
+        self.assertEqual(self.calls, 3)
+
+    def test_other_workers_see_the_invalidation_through_tag_versions(self):
+        other_worker = TieredCache('test', ttl=60, local_ttl=30, stale_ttl=60)
+        self.cache.get_or_set('test:key', self.fetch('old'), tags=['product:1'])
+        other_worker.get_or_set('test:key', self.fetch('old'), tags=['product:1'])
+
+        self.cache.invalidate_tags('product:1')
+        # What the invalidation bus does in the other worker
+        other_worker.local.evict_tags(['product:1'])
+
+        self.assertIs(other_worker.get('test:key'), MISSING)
+        self.assertEqual(other_worker.get_or_set('test:key', self.fetch('new'), tags=['product:1']), 'new')
+
+    def test_invalidation_during_compute_is_not_lost(self):
+        def fetch():
+            self.cache.invalidate_tags('product:1')
+            return 'computed before the change'
+
+        self.cache.get_or_set('test:key', fetch, tags=['product:1'])
+
+        self.assertEqual(self.cache.get_or_set('test:key', self.fetch('new'), tags=['product:1']), 'new')
+
+    def test_saving_a_product_invalidates_its_catalog_entries(self):
+        product = create_product()
+        key = catalog_cache.make_key('product', id=product.id)
+        catalog_cache.get_or_set(key, self.fetch('old'), tags=[f'product:{product.id}'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+        self.assertEqual(catalog_cache.get_or_set(key, self.fetch('new'), tags=[f'product:{product.id}']), 'new')
+
+
+
+class SingleFlightTests(TestCase):
+    """One worker recomputes a key while the others serve or wait"""
+
+    def setUp(self):
+        cache.clear()
+        self.cache = TieredCache('test', ttl=60, local_ttl=30, stale_ttl=60, lock_timeout=1)
+        self.calls = 0
+
+    def fetch(self):
+        self.calls += 1
+        return 'computed'
+
+    def hold_lock(self, key):
+        # Another worker is recomputing the key
+        cache.add(f'{key}:computing', 1, 10)
+
+    def test_stale_value_is_served_while_another_worker_recomputes(self):
+        self.cache.set('test:key', 'stale', tags=['product:1'])
+        self.cache.invalidate_tags('product:1')
+        self.hold_lock('test:key')
+
+        self.assertEqual(self.cache.get_or_set('test:key', self.fetch, tags=['product:1']), 'stale')
+        self.assertEqual(self.calls, 0)
+
+    def test_missing_value_is_awaited_from_the_computing_worker(self):
+        self.hold_lock('test:key')
+        other_worker = TieredCache('test', ttl=60)
+        threading.Timer(0.1, other_worker.set, ['test:key', 'theirs']).start()
+
+        self.assertEqual(self.cache.get_or_set('test:key', self.fetch), 'theirs')
+        self.assertEqual(self.calls, 0)
+
+    def test_value_is_computed_when_the_computing_worker_gives_up(self):
+        self.cache.lock_timeout = 0.2
+        self.hold_lock('test:key')
+
+        self.assertEqual(self.cache.get_or_set('test:key', self.fetch), 'computed')
+        self.assertEqual(self.calls, 1)
+
+    def test_lock_is_released_after_computing(self):
+        self.cache.get_or_set('test:key', self.fetch)
+
+        self.assertIsNone(cache.get('test:key:computing'))
+
+
+@override_settings(CATALOG_CACHE_LOCAL_TTL=30, CATALOG_CACHE_BUS_LOCAL_TTL=300)
+class LocalTierTTLTests(TestCase):
+    """Local catalog entries only live long while the invalidation listener runs"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+
+    def local_ttl(self, key):
+        _, expires_at, _ = catalog_cache.local._entries[key]
+        return expires_at - time.monotonic()
+
+    def test_short_local_ttl_without_a_listener(self):
+        catalog_cache.set('catalog:test', 'value', tags=['product:1'])
+
+        self.assertLessEqual(self.local_ttl('catalog:test'), 30)
+
+    def test_long_local_ttl_while_the_listener_runs(self):
+        with mock.patch('products.cache.listener_running', return_value=True):
+            catalog_cache.set('catalog:test', 'value', tags=['product:1'])
+
+        self.assertGreater(self.local_ttl('catalog:test'), 30)
+
+
+class InvalidationListenerTests(TestCase):
+    """Invalidations received from other workers"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.listener = InvalidationListener(catalog_cache)
+        self.versions = catalog_cache.tag_versions(['product:1'])
+        catalog_cache.set('catalog:test', 'value', tags=['product:1'])
+
+    def test_per_process_cache_gets_the_tag_versions_bumped(self):
+        self.listener.evict(['product:1'])
+
+        self.assertIs(catalog_cache.get('catalog:test'), MISSING)
+        self.assertNotEqual(catalog_cache.tag_versions(['product:1']), self.versions)
+
+    def test_shared_cache_only_loses_the_local_entries(self):
+        with mock.patch('products.invalidation._cache_is_per_process', return_value=False):
+            self.listener.evict(['product:1'])
+
+        self.assertNotIn('catalog:test', catalog_cache.local._entries)
+        self.assertEqual(catalog_cache.tag_versions(['product:1']), self.versions)
+        self.assertEqual(catalog_cache.get('catalog:test'), 'value')
+
+
+class PersistedQueryTests(TestCase):
+    """Persisted catalog queries over GET with ETag/304 (ecomarce_choco/views.py)"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.product = create_product()
+        self.price = ProductPrice.objects.create(product=self.product, base_price=Decimal('10.00'))
+        self.inventory = Inventory.objects.create(product=self.product, quantity_in_stock=10)
+
+    def get(self, query_id, variables=None, etag=None):
+        params = {'id': query_id}
+        if variables:
+            params['variables'] = json.dumps(variables)
+        return self.client.get('/graphql/', params, headers={'If-None-Match': etag} if etag else {})
+
+    def get_product(self, etag=None):
+        return self.get('product', {'id': self.product.id}, etag)
+
+    def test_queries_are_found_by_id_and_by_hash(self):
+        query_hash = hashlib.sha256(PERSISTED_QUERIES['brands']['query'].encode('utf-8')).hexdigest()
+        self.assertIs(get_persisted_query(query_hash), get_persisted_query('brands'))
+
+        by_id, by_hash = self.get('brands'), self.get(query_hash)
+
+        self.assertEqual(by_hash.json(), by_id.json())
+        self.assertEqual(by_hash['ETag'], by_id['ETag'])
+        self.assertEqual(by_id.json()['data']['brands'][0]['slug'], 'callebaut')
+
+    def test_unknown_hash_is_rejected(self):
+        response = self.get('0' * 64)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response)
+
+    def test_matching_etag_is_answered_with_304_without_running_the_query(self):
+        first = self.get('brands')
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('max-age=3600', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.get('brands', etag=first['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+    def test_stock_change_gives_a_new_etag(self):
+        first = self.get_product()
+        # Stock is volatile: cacheable, but always revalidated
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inventory.quantity_in_stock = 0
+            self.inventory.save()
+
+        response = self.get_product(etag=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['data']['product']['inventory']['quantityInStock'], 0)
+
+    def test_price_change_gives_a_new_etag(self):
+        first = self.get_product()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.price.base_price = Decimal('12.00')
+            self.price.save()
+
+        response = self.get_product(etag=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['data']['product']['retailPrice']), Decimal('12.00'))
+
+    def test_signed_in_requests_are_not_cached(self):
+        self.client.force_login(get_user_model().objects.create_user(username='staff', password='x'))
+
+        response = self.get('brands')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_mutations_and_posts_are_not_cached(self):
+        mutation = self.client.get('/graphql/', {'query': 'mutation { __typename }'})
+        post = self.client.post('/graphql/', {'id': 'brands'}, content_type='application/json')
+
+        self.assertEqual(mutation.status_code, 405)
+        self.assertEqual(post.json()['data']['brands'][0]['slug'], 'callebaut')
+        for response in (mutation, post):
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('public', response.get('Cache-Control', ''))
+
+
+class CategoryPathTests(TestCase):
+    """Category.path/depth and the queries built on them follow subtree moves"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.chocolate = Category.objects.create(name='Chocolate', slug='chocolate')
+        self.dark = Category.objects.create(name='Dark', slug='dark', parent_category=self.chocolate)
+        self.extra_dark = Category.objects.create(name='Extra Dark', slug='extra-dark', parent_category=self.dark)
+        self.gifts = Category.objects.create(name='Gifts', slug='gifts')
+        brand = Brand.objects.create(name='Callebaut', slug='callebaut')
+        self.product = Product.objects.create(
+            sku='CHOC-1', name='Chocolate 1', slug='choc-1', category=self.extra_dark, brand=brand
+        )
+
+    def query(self, query):
+        return self.client.post('/graphql/', {'query': query}, content_type='application/json').json()['data']
+
+    def product_skus(self, category):
+        data = self.query('{ products(category: "%s", includeDescendants: true) { sku } }' % category)
+        return [product['sku'] for product in data['products']]
+
+    def category_tree(self):
+        data = self.query('{ categoryTree { slug children { slug children { slug } } } }')
+        return data['categoryTree']
+
+    def move_dark_under_gifts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dark.parent_category = self.gifts
+            self.dark.save()
+
+    def test_paths_are_built_from_the_root(self):
+        self.extra_dark.refresh_from_db()
+        self.assertEqual(self.extra_dark.path, f'{self.chocolate.pk}/{self.dark.pk}/{self.extra_dark.pk}/')
+        self.assertEqual(self.extra_dark.depth, 2)
+
+    def test_moving_a_subtree_updates_the_descendants(self):
+        self.move_dark_under_gifts()
+
+        self.dark.refresh_from_db()
+        self.extra_dark.refresh_from_db()
+        self.assertEqual((self.dark.path, self.dark.depth), (f'{self.gifts.pk}/{self.dark.pk}/', 1))
+        self.assertEqual(
+            (self.extra_dark.path, self.extra_dark.depth),
+            (f'{self.gifts.pk}/{self.dark.pk}/{self.extra_dark.pk}/', 2)
+        )
+
+    def test_moving_to_the_root_updates_the_descendants(self):
+        self.dark.parent_category = None
+        self.dark.save()
+
+        self.extra_dark.refresh_from_db()
+        self.assertEqual((self.extra_dark.path, self.extra_dark.depth), (f'{self.dark.pk}/{self.extra_dark.pk}/', 1))
+
+    def test_descendant_filter_follows_the_move(self):
+        self.assertEqual(self.product_skus('chocolate'), ['CHOC-1'])
+        self.assertEqual(self.product_skus('gifts'), [])
+
+        self.move_dark_under_gifts()
+
+        self.assertEqual(self.product_skus('chocolate'), [])
+        self.assertEqual(self.product_skus('gifts'), ['CHOC-1'])
+
+    def test_category_tree_follows_the_move(self):
+        self.assertEqual(self.category_tree(), [
+            {'slug': 'chocolate', 'children': [{'slug': 'dark', 'children': [{'slug': 'extra-dark'}]}]},
+            {'slug': 'gifts', 'children': []},
+        ])
+
+        self.move_dark_under_gifts()
+
+        self.assertEqual(self.category_tree(), [
+            {'slug': 'chocolate', 'children': []},
+            {'slug': 'gifts', 'children': [{'slug': 'dark', 'children': [{'slug': 'extra-dark'}]}]},
+        ])
+
+    def test_category_cannot_move_under_its_own_subcategory(self):
+        self.dark.parent_category = self.extra_dark
+
+        with self.assertRaises(ValidationError):
+            self.dark.save()
+
+        self.dark.refresh_from_db()
+        self.assertEqual(self.dark.parent_category, self.chocolate)
+
+
+class ProductFacetsTests(TestCase):
+    """productFacets counts match a naive count over the same products"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        chocolate = Category.objects.create(name='Chocolate', slug='chocolate')
+        dark = Category.objects.create(name='Dark', slug='dark', parent_category=chocolate)
+        milk = Category.objects.create(name='Milk', slug='milk')
+        callebaut = Brand.objects.create(name='Callebaut', slug='callebaut')
+        valrhona = Brand.objects.create(name='Valrhona', slug='valrhona')
+        rows = [
+            # category, brand, price, stock, reserved, active
+            (dark, callebaut, '12.00', 5, 0, True),
+            (dark, valrhona, '75.00', 5, 5, True),
+            (chocolate, callebaut, '150.00', 0, 0, True),
+            (milk, valrhona, '49.99', 10, 2, True),
+            (milk, callebaut, '650.00', 3, 0, True),
+            (milk, valrhona, '250.00', 8, 0, False),
+            (dark, valrhona, None, 1, 0, True),
+        ]
+        for index, (category, brand, price, stock, reserved, active) in enumerate(rows):
+            product = Product.objects.create(
+                sku=f'CHOC-{index}', name=f'Chocolate {index}', slug=f'choc-{index}', category=category,
+                brand=brand, is_active=active
+            )
+            if price:
+                ProductPrice.objects.create(product=product, base_price=Decimal(price))
+            Inventory.objects.create(product=product, quantity_in_stock=stock, reserved_quantity=reserved)
+
+    def naive_facets(self, categories=None, brand=None, in_stock=None, min_price=None):
+        """The facets by hand: filter active products in Python and count each value"""
+        products = []
+        for product in Product.objects.filter(is_active=True).select_related('category', 'brand', 'inventory'):
+            available = product.inventory.quantity_in_stock > product.inventory.reserved_quantity
+            price = product.effective_retail_price
+            if categories and product.category.slug not in categories:
+                continue
+            if brand and product.brand.slug != brand:
+                continue
+            if in_stock and not available:
+                continue
+            if min_price is not None and (price is None or price < min_price):
+                continue
+            products.append((product, available, price))
+
+        def counts(attribute):
+            values = {}
+            for product, _, _ in products:
+                value = getattr(product, attribute)
+                values[value.slug] = values.get(value.slug, 0) + 1
+            return values
+
+        bounds = PRICE_FACET_BOUNDS + [None]
+        return {
+            'total': len(products),
+            'in_stock': sum(1 for _, available, _ in products if available),
+            'brands': counts('brand'),
+            'categories': counts('category'),
+            'price_ranges': [
+                sum(1 for _, _, price in products
+                    if price is not None and lower <= price and (upper is None or price < upper))
+                for lower, upper in zip(bounds, bounds[1:])
+            ],
+        }
+
+    def assertFacetsMatch(self, facets, expected):
+        self.assertEqual(facets['total'], expected['total'])
+        self.assertEqual(facets['in_stock'], expected['in_stock'])
+        self.assertEqual({facet['slug']: facet['count'] for facet in facets['brands']}, expected['brands'])
+        self.assertEqual({facet['slug']: facet['count'] for facet in facets['categories']}, expected['categories'])
+        self.assertEqual([facet['count'] for facet in facets['price_ranges']], expected['price_ranges'])
+
+    def test_unfiltered_counts(self):
+        with self.assertNumQueries(1):
+            facets = ProductQuery.fetch_product_facets()
+
+        expected = self.naive_facets()
+        self.assertFacetsMatch(facets, expected)
+        self.assertEqual(expected['total'], 6)
+        self.assertEqual(expected['price_ranges'], [2, 1, 1, 0, 1])
+        self.assertEqual((facets['min_price'], facets['max_price']), (Decimal('12.00'), Decimal('650.00')))
+
+    def test_filtered_counts(self):
+        cases = [
+            ({'brand': 'valrhona'}, {'brand': 'valrhona'}),
+            ({'in_stock': True}, {'in_stock': True}),
+            ({'min_price': Decimal('50')}, {'min_price': Decimal('50')}),
+            ({'category': 'milk', 'in_stock': True}, {'categories': {'milk'}, 'in_stock': True}),
+        ]
+        for filters, naive in cases:
+            with self.subTest(filters=filters):
+                with self.assertNumQueries(1):
+                    facets = ProductQuery.fetch_product_facets(**filters)
+                self.assertFacetsMatch(facets, self.naive_facets(**naive))
+
+    def test_category_with_descendants(self):
+        # One query for the category path, one for the counts
+        with self.assertNumQueries(2):
+            facets = ProductQuery.fetch_product_facets(category='chocolate', include_descendants=True)
+
+        expected = self.naive_facets(categories={'chocolate', 'dark'})
+        self.assertFacetsMatch(facets, expected)
+        self.assertEqual(expected['categories'], {'chocolate': 1, 'dark': 3})
+
+    def test_graphql_counts_are_cached(self):
+        query = '{ productFacets(brand: "callebaut") { total inStock brands { slug count } } }'
+
+        first = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        with self.assertNumQueries(0):
+            second = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+
+        facets = first.json()['data']['productFacets']
+        self.assertEqual(second.json()['data']['productFacets'], facets)
+        self.assertEqual(facets, {'total': 3, 'inStock': 2, 'brands': [{'slug': 'callebaut', 'count': 3}]})
+
+
+class VariantIndexTests(TestCase):
+    """Variant selection index (variants.py) and the variantFor/availableCombinations fields"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.product = create_product('COCO')
+        self.variants, _ = generate_variant_matrix(
+            self.product,
+            [{'name': 'Color', 'values': ['White', 'Dark']}, {'name': 'Weight', 'values': ['500g', '1kg']}],
+            Decimal('25.00'),
+            quantity_in_stock=5,
+        )
+        self.by_sku = {variant.sku: variant for variant in self.variants}
+
+    def query_product(self, fields):
+        query = '{ product(id: %d) { %s } }' % (self.product.id, fields)
+        return self.client.post('/graphql/', {'query': query}, content_type='application/json').json()['data']['product']
+
+    def test_lookup_ignores_the_option_order(self):
+        index = get_variant_index(self.product.id)
+        variant = self.by_sku['COCO-DARK-1KG']
+
+        self.assertEqual(index.variant_id_for_options({'Color': 'Dark', 'Weight': '1kg'}), variant.id)
+        self.assertEqual(index.variant_id_for_options({'Weight': '1kg', 'Color': 'Dark'}), variant.id)
+        option_value_ids = list(variant.option_values.values_list('option_value_id', flat=True))
+        self.assertEqual(index.variant_id_for(reversed(option_value_ids)), variant.id)
+
+    def test_partial_or_unknown_selection_has_no_match(self):
+        index = get_variant_index(self.product.id)
+
+        self.assertIsNone(index.variant_id_for_options({'Color': 'Dark'}))
+        self.assertIsNone(index.variant_id_for_options({'Color': 'Dark', 'Weight': '2kg'}))
+        self.assertIsNone(index.variant_id_for_options({'Color': 'Dark', 'Size': '1kg'}))
+
+    def test_index_is_cached_and_rebuilt_when_a_variant_changes(self):
+        get_variant_index(self.product.id)
+        with self.assertNumQueries(0):
+            get_variant_index(self.product.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            variant = self.by_sku['COCO-WHITE-500G']
+            variant.is_active = False
+            variant.save()
+
+        index = get_variant_index(self.product.id)
+        self.assertIsNone(index.variant_id_for_options({'Color': 'White', 'Weight': '500g'}))
+        self.assertEqual(len(index.combinations), 3)
+
+    def test_variant_for_field(self):
+        data = self.query_product(
+            'variantFor(options: "{\\"Weight\\": \\"500g\\", \\"Color\\": \\"Dark\\"}") { sku } '
+            'partial: variantFor(options: "{\\"Color\\": \\"Dark\\"}") { sku }'
+        )
+
+        self.assertEqual(data['variantFor'], {'sku': 'COCO-DARK-500G'})
+        self.assertIsNone(data['partial'])
+
+    def test_available_combinations_skip_out_of_stock_variants(self):
+        ProductVariant.objects.filter(sku='COCO-DARK-1KG').update(quantity_in_stock=0)
+        ProductVariant.objects.filter(sku='COCO-WHITE-1KG').update(reserved_quantity=5)
+
+        data = self.query_product(
+            'availableCombinations { sku inStock } '
+            'all: availableCombinations(includeOutOfStock: true) { sku inStock }'
+        )
+
+        self.assertEqual(
+            sorted(combination['sku'] for combination in data['availableCombinations']),
+            ['COCO-DARK-500G', 'COCO-WHITE-500G']
+        )
+        self.assertEqual(
+            {combination['sku']: combination['inStock'] for combination in data['all']},
+            {'COCO-WHITE-500G': True, 'COCO-WHITE-1KG': False, 'COCO-DARK-500G': True, 'COCO-DARK-1KG': False}
+        )
+
+
+class VariantMatrixTests(TestCase):
+    """generate_variant_matrix and the generateVariantMatrix mutation"""
+
+    options = [
+        {'name': 'Color', 'values': ['White', 'Dark', 'Milk', 'Ruby']},
+        {'name': 'Weight', 'values': ['250g', '500g', '1kg', '2.5 kg', '5kg']},
+    ]
+
+    def setUp(self):
+        self.product = create_product('COCO')
+
+    def test_matrix_has_one_variant_per_combination(self):
+        variants, skipped = generate_variant_matrix(
+            self.product, self.options, Decimal('25.00'), price_adjustments={'Weight': {'1kg': '20.00'}}
+        )
+
+        self.assertEqual((len(variants), skipped), (20, 0))
+        self.assertEqual(ProductVariantValue.objects.filter(variant__product=self.product).count(), 40)
+        self.assertEqual(ProductVariantOptionValue.objects.filter(option__product=self.product).count(), 9)
+        self.assertEqual(ProductVariant.objects.filter(product=self.product, is_default=True).count(), 1)
+        self.assertEqual(ProductVariant.objects.get(sku='COCO-DARK-1KG').price, Decimal('45.00'))
+        self.assertEqual(ProductVariant.objects.get(sku='COCO-RUBY-2-5-KG').price, Decimal('25.00'))
+
+    def test_matrix_is_written_with_bulk_inserts(self):
+        # Same count for any matrix size (savepoint and release included)
+        with self.assertNumQueries(11):
+            generate_variant_matrix(self.product, self.options, Decimal('25.00'))
+
+    def test_rerunning_the_matrix_creates_nothing(self):
+        generate_variant_matrix(self.product, self.options, Decimal('25.00'))
+
+        variants, skipped = generate_variant_matrix(self.product, self.options, Decimal('25.00'))
+
+        self.assertEqual((variants, skipped), ([], 20))
+        self.assertEqual(ProductVariant.objects.filter(product=self.product).count(), 20)
+
+    def test_new_value_only_adds_its_combinations(self):
+        generate_variant_matrix(self.product, self.options, Decimal('25.00'))
+        options = [{'name': 'Color', 'values': ['White', 'Caramel']}, self.options[1]]
+
+        variants, skipped = generate_variant_matrix(self.product, options, Decimal('25.00'))
+
+        self.assertEqual((len(variants), skipped), (5, 5))
+        self.assertTrue(all(variant.sku.startswith('COCO-CARAMEL-') for variant in variants))
+
+    def test_sku_template(self):
+        variants, _ = generate_variant_matrix(
+            self.product, self.options[:1], Decimal('25.00'), sku_template='{sku}/{Color}'
+        )
+
+        self.assertEqual([variant.sku for variant in variants], ['COCO/WHITE', 'COCO/DARK', 'COCO/MILK', 'COCO/RUBY'])
+
+    def test_invalid_matrices_are_rejected(self):
+        invalid = [
+            ([{'name': 'Color', 'values': []}], {}),
+            ([{'name': 'Color', 'values': ['White']}, {'name': 'Color', 'values': ['Dark']}], {}),
+            (self.options, {'sku_template': '{sku}-{Size}'}),
+            (self.options, {'sku_template': '{sku}'}),
+            (self.options, {'price_adjustments': {'Weight': {'250g': '-30'}}}),
+        ]
+        for options, kwargs in invalid:
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValidationError):
+                generate_variant_matrix(self.product, options, Decimal('25.00'), **kwargs)
+
+        self.assertFalse(ProductVariant.objects.filter(product=self.product).exists())
+
+    def test_mutation_requires_staff(self):
+        query = (
+            'mutation { generateVariantMatrix(productId: %d, basePrice: "25.00", '
+            'options: [{name: "Color", values: ["White", "Dark"]}]) { success createdCount } }' % self.product.id
+        )
+
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertEqual(response['errors'][0]['message'], 'Not authorized')
+        self.client.force_login(get_user_model().objects.create_user(username='customer', password='x'))
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertEqual(response['errors'][0]['message'], 'Not authorized')
+        self.assertFalse(ProductVariant.objects.filter(product=self.product).exists())
+
+        self.client.force_login(get_user_model().objects.create_user(username='staff', password='x', is_staff=True))
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertEqual(response['data']['generateVariantMatrix'], {'success': True, 'createdCount': 2})
+
+
+class CacheHintTests(TestCase):
+    """Cache hints (ecomarce_choco/cache_hints.py): query max-age and root field caching"""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+
+    def max_age(self, query, operation_name=None):
+        return operation_max_age(schema.graphql_schema, parse(query), operation_name)
+
+    def post(self, query):
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertNotIn('errors', response)
+        return response['data']
+
+    def test_max_age_is_the_smallest_hint_in_the_query(self):
+        cases = [
+            ('{ brands { name } }', 3600),
+            ('{ categoryTree { name children { name } } }', 3600),
+            # Type hint, then longer field hints below it
+            ('{ products { name images { image } } }', 300),
+            ('{ products { name brand { name } } }', 300),
+            ('{ product(id: 1) { name reviews { rating } } }', 300),
+            # Stock anywhere makes the whole query volatile
+            ('{ products { name inStock } }', 0),
+            ('{ brands { name } products { inventory { quantityInStock } } }', 0),
+            ('{ searchSuggestions(query: "dark") }', 300),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(self.max_age(query), expected)
+
+    def test_fragments_are_followed(self):
+        query = '''
+            query Listing { products { ...Card } }
+            fragment Card on ProductType { name ... on ProductType { inStock } }
+        '''
+        self.assertEqual(self.max_age(query), 0)
+        self.assertEqual(self.max_age('{ products { ...Card } } fragment Card on ProductType { name }'), 300)
+
+    def test_unhinted_root_fields_use_the_default(self):
+        self.assertEqual(self.max_age('{ productFacets { total } }'), 0)
+        with override_settings(GRAPHQL_DEFAULT_MAX_AGE=60):
+            self.assertEqual(self.max_age('{ productFacets { total } }'), 60)
+            self.assertEqual(self.max_age('{ brands { name } productFacets { total } }'), 60)
+
+    def test_mutations_and_unknown_operations_are_not_cacheable(self):
+        self.assertEqual(self.max_age('mutation { __typename }'), 0)
+        self.assertEqual(self.max_age('query A { brands { name } }', 'B'), 0)
+
+    def test_hinted_root_field_is_cached(self):
+        create_product(name='Dark Truffle')
+        query = '{ searchSuggestions(query: "dark truffle") }'
+
+        first = self.post(query)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post(query), first)
+        self.assertEqual(first['searchSuggestions'], ['dark truffle'])
+
+    def test_nested_fields_are_served_from_the_cached_list(self):
+        for index in range(5):
+            product = create_product(f'CHOC-{index}')
+            ProductPrice.objects.create(product=product, base_price=Decimal('10.00'))
+            Inventory.objects.create(product=product, quantity_in_stock=3)
+        query = (
+            '{ products { name images { image } prices { basePrice } reviews { rating } averageRating '
+            'variantOptions { name } hasVariants retailPrice inStock } }'
+        )
+        self.post(query)
+
+        with mock.patch.object(catalog_cache, 'get_or_set', wraps=catalog_cache.get_or_set) as get_or_set, \
+                self.assertNumQueries(1):
+            data = self.post(query)
+
+        # One lookup for the list, none per product or field; stock is read live
+        self.assertEqual(get_or_set.call_count, 1)
+        self.assertEqual(len(data['products']), 5)
+        self.assertEqual(data['products'][0]['prices'], [{'basePrice': '10.00'}])
+
+
+class BatchUpdateTests(TestCase):
+    """Batch admin updates (bulk_updates.py and its mutations)"""
+
+    def setUp(self):
+        self.products = [create_product(f'CHOC-{i}') for i in range(3)]
+
+    def test_prices_are_set_per_item(self):
+        first, second, _ = self.products
+        ProductPrice.objects.create(product=first, base_price=Decimal('10.00'))
+
+        results, prices = set_product_prices([
+            {'product_id': first.id, 'price_type': 'RETAIL', 'base_price': Decimal('9.00')},
+            {'product_id': second.id, 'price_type': 'RETAIL', 'base_price': Decimal('12.00')},
+            {'product_id': second.id, 'price_type': 'BOGUS', 'base_price': Decimal('1.00')},
+            {'product_id': 0, 'price_type': 'RETAIL', 'base_price': Decimal('1.00')},
+        ])
+
+        self.assertEqual([result['success'] for result in results], [True, True, False, False])
+        self.assertEqual(len(prices), 2)
+        self.assertEqual(ProductPrice.objects.count(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.effective_retail_price, second.effective_retail_price), (Decimal('9.00'), Decimal('12.00')))
+
+    def test_inventories_are_created_or_updated(self):
+        first, second, _ = self.products
+        Inventory.objects.create(product=first, quantity_in_stock=1)
+
+        results, _ = update_inventories([
+            {'product_id': first.id, 'quantity_in_stock': 5},
+            {'product_id': second.id, 'quantity_in_stock': 7, 'low_stock_threshold': 2},
+            {'product_id': second.id, 'quantity_in_stock': 8},
+        ])
+
+        self.assertEqual([result['success'] for result in results], [True, True, False])
+        self.assertEqual(
+            dict(Inventory.objects.values_list('product_id', 'quantity_in_stock')), {first.id: 5, second.id: 7}
+        )
+
+    def test_products_are_updated_in_one_query(self):
+        first, second, _ = self.products
+
+        # Load, then one UPDATE (inside a savepoint)
+        with self.assertNumQueries(4):
+            results, _ = update_products([{'id': first.id, 'featured': True}, {'id': second.id, 'name': 'Milk'}])
+
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('name', 'featured'))[:2],
+            [('CHOC-0', True), ('Milk', False)]
+        )
+
+    def test_swapped_skus_are_rejected_per_item(self):
+        first, second, third = self.products
+
+        results, changed = update_products([
+            {'id': first.id, 'sku': second.sku},
+            {'id': second.id, 'sku': first.sku},
+            {'id': third.id, 'name': 'White'},
+        ])
+
+        self.assertEqual([result['success'] for result in results], [False, False, True])
+        self.assertIn('still belongs to product', results[0]['message'])
+        self.assertEqual(changed, [third])
+        first.refresh_from_db()
+        self.assertEqual(first.sku, 'CHOC-0')
+
+    def test_sku_taken_outside_the_batch_is_rejected(self):
+        first, second, _ = self.products
+
+        results, _ = update_products([{'id': first.id, 'sku': second.sku}])
+
+        self.assertEqual(results[0]['message'], 'A product with this sku already exists')
+
+    def test_mutation_requires_staff_and_reports_each_item(self):
+        first, _, _ = self.products
+        query = 'mutation { updateProducts(items: [{id: %d, featured: true}, {id: 0}]) { success message results { index success } } }' % first.id
+
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertEqual(response['errors'][0]['message'], 'Not authorized')
+
+        self.client.force_login(get_user_model().objects.create_user(username='staff', password='x', is_staff=True))
+        response = self.client.post('/graphql/', {'query': query}, content_type='application/json').json()
+        self.assertEqual(response['data']['updateProducts']['message'], '1 of 2 products updated')
+        self.assertEqual(
+            response['data']['updateProducts']['results'],
+            [{'index': 0, 'success': True}, {'index': 1, 'success': False}]
+        )
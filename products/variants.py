@@ -0,0 +1,260 @@
+"""
+Product variants
+Variant selection index: maps each product's option value combinations to
+its active variants, so variant pickers resolve a selection with one lookup
+instead of downloading and matching every variant. Indexes are kept in the
+catalog cache, tagged with the product, so variant and option changes
+rebuild them.
+
+Variant matrix: creates the variants for every combination of option
+values with a few bulk inserts.
+"""
+import itertools
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .cache import PRODUCTS_TAG, catalog_cache, invalidate_on_commit
+from .models import ProductVariant, ProductVariantOption, ProductVariantOptionValue, ProductVariantValue
+
+# Most variants one matrix may create
+MAX_MATRIX_VARIANTS = 500
+
+DEFAULT_SKU_TEMPLATE = '{sku}-{values}'
+
+
+class VariantCombination:
+    """One active variant and the option values that select it"""
+
+    def __init__(self, variant_id: int, sku: str, option_value_ids: List[int], effective_price: Decimal,
+                 is_default: bool):
+        self.variant_id = variant_id
+        self.sku = sku
+        self.option_value_ids = option_value_ids
+        self.effective_price = effective_price
+        self.is_default = is_default
+
+
+class VariantIndex:
+    """
+    Option value combinations of one product's active variants
+
+    `values` maps (option name, value) to the option value id, `variants`
+    a frozenset of option value ids to the variant id.
+    """
+
+    def __init__(self, values: Dict[tuple, int], combinations: List[VariantCombination]):
+        self.values = values
+        self.combinations = combinations
+        self.variants = {
+            frozenset(combination.option_value_ids): combination.variant_id
+            for combination in combinations
+        }
+
+    def variant_id_for(self, option_value_ids: Iterable[int]) -> Optional[int]:
+        """Variant with exactly these option values, or None"""
+        return self.variants.get(frozenset(option_value_ids))
+
+    def variant_id_for_options(self, options: Dict[str, str]) -> Optional[int]:
+        """Variant for option names and values (e.g. {'Color': 'White'}), or None"""
+        option_value_ids = []
+        for name, value in options.items():
+            option_value_id = self.values.get((name, str(value)))
+            if option_value_id is None:
+                return None
+            option_value_ids.append(option_value_id)
+        return self.variant_id_for(option_value_ids)
+
+
+def build_variant_index(product_id: int) -> VariantIndex:
+    """Build a product's index (three queries)"""
+    values = {
+        (option_name, value): option_value_id
+        for option_value_id, option_name, value in ProductVariantOptionValue.objects.filter(
+            option__product_id=product_id
+        ).values_list('id', 'option__name', 'value')
+    }
+
+    option_value_ids = {}
+    for variant_id, option_value_id in ProductVariantValue.objects.filter(
+        variant__product_id=product_id, variant__is_active=True
+    ).values_list('variant_id', 'option_value_id'):
+        option_value_ids.setdefault(variant_id, []).append(option_value_id)
+
+    combinations = [
+        VariantCombination(
+            variant.id,
+            variant.sku,
+            sorted(option_value_ids.get(variant.id, [])),
+            variant.effective_price,
+            variant.is_default,
+        )
+        for variant in ProductVariant.objects.filter(product_id=product_id, is_active=True)
+        .only('id', 'sku', 'price', 'sale_price', 'is_default').order_by('-is_default', 'sku')
+    ]
+    return VariantIndex(values, combinations)
+
+
+def get_variant_index(product_id: int) -> VariantIndex:
+    """Cached index of a product's variants"""
+    return catalog_cache.get_or_set(
+        catalog_cache.make_key('variant_index', product_id=product_id),
+        lambda: build_variant_index(product_id),
+        tags=[f'product:{product_id}'],
+    )
+
+
+def _sku_part(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '-', value).strip('-').upper()
+
+
+def _ensure_options(product, options: List[Dict[str, Any]]) -> List[List[ProductVariantOptionValue]]:
+    """
+    Options and values of the matrix, created where missing (two bulk inserts)
+
+    Returns the option values per option, in the order given.
+    """
+    existing_options = {option.name: option for option in ProductVariantOption.objects.filter(product=product)}
+    new_options = [
+        ProductVariantOption(product=product, name=option['name'], display_order=option.get('display_order') or index)
+        for index, option in enumerate(options)
+        if option['name'] not in existing_options
+    ]
+    ProductVariantOption.objects.bulk_create(new_options)
+    existing_options.update({option.name: option for option in new_options})
+
+    existing_values = {
+        (value.option_id, value.value): value
+        for value in ProductVariantOptionValue.objects.filter(option__product=product)
+    }
+    new_values = []
+    matrix = []
+    for option in options:
+        option_id = existing_options[option['name']].id
+        option_values = []
+        for index, value in enumerate(dict.fromkeys(option['values'])):
+            option_value = existing_values.get((option_id, value))
+            if option_value is None:
+                option_value = ProductVariantOptionValue(option_id=option_id, value=value, display_order=index)
+                existing_values[(option_id, value)] = option_value
+                new_values.append(option_value)
+            option_values.append(option_value)
+        matrix.append(option_values)
+    ProductVariantOptionValue.objects.bulk_create(new_values)
+    return matrix
+
+
+def generate_variant_matrix(product, options: List[Dict[str, Any]], base_price: Decimal,
+                            price_adjustments: Dict[str, Dict[str, Any]] = None,
+                            sku_template: str = None, sale_price: Decimal = None, currency: str = 'AED',
+                            quantity_in_stock: int = 0, low_stock_threshold: int = 10,
+                            is_active: bool = True) -> Tuple[List[ProductVariant], int]:
+    """
+    Create a variant for every combination of option values
+
+    Missing options and values are created; combinations that already have
+    a variant are skipped. Everything is written with bulk inserts in one
+    transaction.
+
+    Args:
+        product: Product to add the variants to
+        options: Dicts with 'name', 'values' and optional 'display_order'
+        base_price: Price of every variant before adjustments
+        price_adjustments: Amounts added per option value, e.g.
+            {'Weight': {'1kg': '20.00'}}
+        sku_template: str.format pattern; {sku} is the product SKU, {values}
+            the option values joined with '-', {<option name>} one value
+        sale_price, currency, quantity_in_stock, low_stock_threshold,
+        is_active: Copied to every variant
+
+    Returns:
+        (created variants, number of combinations skipped)
+
+    Raises:
+        ValidationError: Invalid options, template or prices, or SKUs that
+            already exist
+    """
+    if not options or any(not option.get('values') for option in options):
+        raise ValidationError("Every option needs at least one value")
+    names = [option['name'] for option in options]
+    if len(set(names)) != len(names):
+        raise ValidationError("Option names must be unique")
+
+    size = 1
+    for option in options:
+        size *= len(set(option['values']))
+    if size > MAX_MATRIX_VARIANTS:
+        raise ValidationError(f"The matrix has {size} combinations, at most {MAX_MATRIX_VARIANTS} are allowed")
+
+    price_adjustments = price_adjustments or {}
+    sku_template = sku_template or DEFAULT_SKU_TEMPLATE
+
+    with transaction.atomic():
+        matrix = _ensure_options(product, options)
+
+        linked = {}
+        for variant_id, option_value_id in ProductVariantValue.objects.filter(
+            variant__product=product
+        ).values_list('variant_id', 'option_value_id'):
+            linked.setdefault(variant_id, set()).add(option_value_id)
+        existing_combinations = {frozenset(option_value_ids) for option_value_ids in linked.values()}
+
+        variants, combinations, skipped = [], [], 0
+        for combination in itertools.product(*matrix):
+            if frozenset(value.id for value in combination) in existing_combinations:
+                skipped += 1
+                continue
+
+            context = {name: _sku_part(value.value) for name, value in zip(names, combination)}
+            context.update({
+                'sku': product.sku,
+                'values': '-'.join(_sku_part(value.value) for value in combination),
+            })
+            try:
+                sku = sku_template.format_map(context)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValidationError(f"Invalid SKU template: {e}")
+            if len(sku) > ProductVariant._meta.get_field('sku').max_length:
+                raise ValidationError(f"SKU '{sku}' is too long")
+
+            price = Decimal(str(base_price))
+            for name, value in zip(names, combination):
+                price += Decimal(str(price_adjustments.get(name, {}).get(value.value, 0)))
+            if price < 0:
+                raise ValidationError(f"Price of '{sku}' would be negative")
+
+            variants.append(ProductVariant(
+                product=product,
+                sku=sku,
+                price=price,
+                sale_price=sale_price,
+                currency=currency,
+                quantity_in_stock=quantity_in_stock,
+                low_stock_threshold=low_stock_threshold,
+                is_active=is_active,
+            ))
+            combinations.append(combination)
+
+        skus = [variant.sku for variant in variants]
+        if len(set(skus)) != len(skus):
+            raise ValidationError("The SKU template produces duplicate SKUs")
+        taken = list(ProductVariant.objects.filter(sku__in=skus).values_list('sku', flat=True)[:10])
+        if taken:
+            raise ValidationError(f"SKUs already exist: {', '.join(taken)}")
+
+        if variants and not ProductVariant.objects.filter(product=product, is_default=True).exists():
+            variants[0].is_default = True
+
+        ProductVariant.objects.bulk_create(variants)
+        ProductVariantValue.objects.bulk_create([
+            ProductVariantValue(variant=variant, option_value=value)
+            for variant, combination in zip(variants, combinations)
+            for value in combination
+        ])
+
+        # bulk_create sends no signals
+        invalidate_on_commit(f'product:{product.id}', PRODUCTS_TAG)
+
+    return variants, skipped